@@ -6,9 +6,58 @@ kelly
 
 The Kelly library allows you to model your domain objects in a declarative, pure-python fashion.
 
+Submodules are loaded lazily, the first time one of their names is used: `import kelly` alone costs next to nothing, and
+`from kelly import ERROR_INVALID` does not load models or properties.
+
 """
 
-from models import Model
-from properties import Property, String, Integer, DateTime, Uuid, List, Dict, Boolean, Object, Constant
-from validators import choices, min_length, max_length, regex, model_validator
-from errors import *
+import sys
+from importlib import import_module
+from types import ModuleType
+
+# Public names, by submodule
+_exports = {
+    'models': ('Model',),
+    'properties': ('Property', 'String', 'Integer', 'DateTime', 'Uuid', 'List', 'Dict', 'Boolean', 'Object', 'Union',
+                   'Constant'),
+    'validators': ('choices', 'min_length', 'max_length', 'regex', 'model_validator'),
+    'errors': ('ERROR_INVALID', 'ERROR_REQUIRED', 'ERROR_EXTRA', 'InvalidModelError', 'InvalidPropertyError',
+               'CannotSetPropertyError', 'CodecError'),
+    'changes': ('diff',),
+    'sampling': ('SamplingPolicy',),
+    'results': ('ValidationResult', 'ValidationSummary'),
+    'migrations': ('rename', 'fill', 'convert'),
+}
+
+_submodules = {name: module_name for module_name, names in _exports.iteritems() for name in names}
+
+__all__ = sorted(_submodules)
+
+
+class _LazyModule(ModuleType):
+    """Package module loading submodules on attribute access (modules cannot define __getattr__ in Python 2)"""
+
+    def __getattr__(self, name):
+        module_name = _submodules.get(name)
+
+        if module_name is None:
+            raise AttributeError('module %r has no attribute %r' % (self.__name__, name))
+
+        value = getattr(import_module('%s.%s' % (self.__name__, module_name)), name)
+        setattr(self, name, value)  # Later lookups are plain attribute reads
+
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_submodules))
+
+
+def _install():
+    module = sys.modules[__name__]
+    lazy_module = _LazyModule(__name__, module.__doc__)
+    lazy_module.__dict__.update(module.__dict__)
+    lazy_module._original_module = module  # Keep the globals of this file alive
+    sys.modules[__name__] = lazy_module
+
+
+_install()
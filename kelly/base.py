@@ -4,16 +4,47 @@
 kelly.base
 ~~~~~~~~~~
 
-Base model & property classes.
+Base model & property classes, and model class registry.
 
 """
 
+from weakref import WeakValueDictionary
+
+# Model classes by module-qualified name, so that properties can refer to classes that are not defined yet
+model_registry = WeakValueDictionary()
+
+
+def get_model_class(name, module=None):
+    """Find a model class by module-qualified name ('blog.models.Comment') or by name ('Comment'). Names are looked up
+    in module first (the module of the model class holding the reference, for Object properties), then among all model
+    classes: names shared by several model classes are rejected, use module-qualified names for those.
+
+    :param name
+    :param module: the name of the module to look the name up in first
+    """
+
+    model_class = model_registry.get('%s.%s' % (module, name)) if module is not None else None
+    if model_class is None:
+        model_class = model_registry.get(name)
+    if model_class is not None:
+        return model_class
+
+    candidates = set(model_class for model_class in model_registry.values() if model_class.__name__ == name)
+    if len(candidates) > 1:
+        raise LookupError('Ambiguous model class name %r: use a module-qualified name' % name)
+    elif len(candidates) == 0:
+        raise LookupError('Unknown model class %r' % name)
+
+    return candidates.pop()
+
 
 class Model(object):
     """Base model class - only used to provide a signature"""
 
     _model_properties = {}
-    _model_validators = []
+    _model_property_names = ()
+    _model_validators = ()
+    _model_nested = False
 
     def __new__(cls, **kwargs):
         return super(Model, cls).__new__(cls)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks
+~~~~~~~~~~~~~~~~
+
+Benchmarks - each module can be run with python -m kelly.benchmarks.<name>.
+
+"""
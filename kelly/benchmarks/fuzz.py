@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks.fuzz
+~~~~~~~~~~~~~~~~~~~~~
+
+Fuzzing harness: random valid and invalid payloads are derived from model property tables and validators, and fed to
+several validation engines, which must all accept and reject the same payloads. The reference engine is
+Model.from_dict() followed by Model.validate(); engines returning errors must return the same errors whenever
+from_dict() succeeds, others only have to agree on acceptance. Throughput is reported for the mixed workload.
+
+$ python -m kelly.benchmarks.fuzz --count 5000 --invalid-rate 0.3 --seed 42
+
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+from uuid import UUID
+from kelly import String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, Union, Constant, \
+    InvalidModelError, CannotSetPropertyError, CodecError
+from kelly.schema import compile_schema
+from kelly.benchmarks.samples import BlogPost
+
+_characters = string.ascii_letters + string.digits + u' -!.'
+
+
+class PayloadGenerator(object):
+    """Random payloads for a model class, as dicts"""
+
+    def __init__(self, model_class, seed=None, max_depth=3, max_items=3):
+        """Class constructor
+
+        :type model_class: Model
+        :param seed: seed of the random generator, for reproducible runs
+        :param max_depth: nested models below that depth are left out whenever possible
+        :param max_items: the maximum number of items of generated lists and dicts
+        """
+
+        self.model_class = model_class
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.max_items = max_items
+
+    def valid(self):
+        """A payload meant to be valid - model validators are not taken into account"""
+
+        return self.model_dict(self.model_class, 0)
+
+    def invalid(self):
+        """A payload with a single invalid value, somewhere in the graph"""
+
+        payload = self.valid()
+        positions = list(self._positions(self.model_class, payload))
+        container, key, property_instance = self.random.choice(positions)
+        container[key] = self.random.choice(self._invalid_values(property_instance, container.get(key)))
+
+        return payload
+
+    def payloads(self, count, invalid_rate=0.5):
+        """Yield count payloads, a fraction of them invalid
+
+        :param count
+        :param invalid_rate
+        """
+
+        for _ in xrange(count):
+            yield self.invalid() if self.random.random() < invalid_rate else self.valid()
+
+    def model_dict(self, model_class, depth):
+        payload = {}
+
+        for property_name in model_class._model_property_names:
+            property_instance = model_class._model_properties[property_name]
+            required, _ = property_instance.validation_plan(None)
+            if not required and not isinstance(property_instance, Constant) and \
+                    (depth >= self.max_depth or self.random.random() < 0.2):
+                continue  # Missing values are replaced by defaults (Union discriminators are always provided)
+            value = self.value(property_instance, depth)
+            if value is not None or required:  # Values that could not be generated are left out if possible
+                payload[property_name] = value
+
+        return payload
+
+    def value(self, property_instance, depth):
+        """A valid value for a property
+
+        :param property_instance
+        :param depth: the depth of the model holding the value
+        """
+
+        required, validators = property_instance.validation_plan(None)
+
+        if isinstance(property_instance, Constant):
+            return property_instance.value
+        elif isinstance(property_instance, Union):
+            return self.model_dict(self.random.choice(property_instance.mapping.values()), depth + 1)
+        elif isinstance(property_instance, Object):
+            if not required and depth >= self.max_depth:
+                return None
+            return self.model_dict(property_instance._model_class, depth + 1)
+        elif isinstance(property_instance, List):
+            size = self._size(validators, property_instance.max_size, depth)
+            return [self.value(property_instance.property, depth) if property_instance.property is not None else
+                    self._text(validators) for _ in xrange(size)]
+        elif isinstance(property_instance, Dict):
+            if property_instance.mapping is not None:
+                return {inner_key: self.value(inner_property, depth)
+                        for inner_key, inner_property in property_instance.mapping.iteritems()
+                        if inner_property.validation_plan(None)[0] or self.random.random() < 0.5}
+            size = self._size((), property_instance.max_size, depth)
+            return {self._text(()): self.value(property_instance.values, depth) if property_instance.values is not None
+                    else self.random.randint(0, 100) for _ in xrange(size)}
+        elif isinstance(property_instance, Uuid):
+            return unicode(UUID(int=self.random.getrandbits(128)))
+        elif isinstance(property_instance, String):
+            return self._text(validators)
+        elif isinstance(property_instance, Boolean):
+            return self.random.choice([True, False])
+        elif isinstance(property_instance, Integer):
+            return self.random.randint(-1000, 1000)
+        elif isinstance(property_instance, DateTime):
+            return datetime(2016, 1, 1) + timedelta(seconds=self.random.randint(0, 10 ** 8))
+
+        return None
+
+    def _size(self, validators, max_size, depth):
+        low, high = _length_bounds(validators)
+        high = min(high, max_size if max_size is not None else high, max(low, self.max_items))
+
+        return low if depth >= self.max_depth else self.random.randint(low, max(low, high))
+
+    def _text(self, validators):
+        """A string satisfying choices, min_length, max_length and regex validators - None if none was found"""
+
+        choices = [validator.argument for validator in validators if getattr(validator, 'name', None) == 'choices']
+        if choices:
+            return self.random.choice(choices[0])
+
+        low, high = _length_bounds(validators)
+        high = min(high, max(low, 20))
+
+        for _ in xrange(20):  # Regex validators are satisfied by trial and error
+            text = u''.join(self.random.choice(_characters) for _ in xrange(self.random.randint(low, high)))
+            if _passes(validators, text):
+                return text
+
+        return None
+
+    def _positions(self, model_class, payload):
+        """Yield (container, key, property) for every value of a payload graph that can be made invalid"""
+
+        for property_name, property_instance in model_class._model_properties.iteritems():
+            if isinstance(property_instance, Constant):
+                continue
+            yield payload, property_name, property_instance
+
+            value = payload.get(property_name)
+            if isinstance(property_instance, Object) and isinstance(value, dict):
+                for position in self._positions(property_instance.model_class(value), value):
+                    yield position
+            elif isinstance(property_instance, List) and isinstance(property_instance.property, Object) and \
+                    isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        for position in self._positions(property_instance.property.model_class(item), item):
+                            yield position
+
+    def _invalid_values(self, property_instance, value):
+        """Candidate invalid values for a property"""
+
+        required, validators = property_instance.validation_plan(None)
+        candidates = [None] if required else []
+
+        if isinstance(property_instance, Union):
+            candidates.extend([{property_instance.discriminator: u'unknown'}, u'foo'])
+        elif isinstance(property_instance, Object):
+            candidates.extend([u'foo', 42, {}])
+        elif isinstance(property_instance, List):
+            candidates.extend([u'foo', {}])
+            if property_instance.max_size is not None:
+                candidates.append([value[0] if value else None] * (property_instance.max_size + 1))
+            if property_instance.property is not None:
+                candidates.append([None])
+        elif isinstance(property_instance, Dict):
+            candidates.extend([u'foo', [1]])
+            if property_instance.mapping is not None:
+                candidates.append(dict(value or {}, unknown_key=1))
+            if property_instance.values is not None:
+                candidates.append({u'key': object()})
+        elif isinstance(property_instance, String):
+            candidates.extend([42.5, [u'foo']])
+            low, high = _length_bounds(validators)
+            if low > 0:
+                candidates.append(u'x' * (low - 1))
+            if high < 1000:
+                candidates.append(u'x' * (high + 1))
+            if any(getattr(validator, 'name', None) == 'choices' for validator in validators):
+                candidates.append(u'not one of the choices')
+            if isinstance(value, basestring) and not _passes(validators, value + u'\n'):
+                candidates.append(value + u'\n')  # Near miss for end anchors
+        elif isinstance(property_instance, (Integer, Boolean, DateTime)):
+            candidates.extend([u'foo', 42.5, [1]])
+            if isinstance(property_instance, Integer):
+                candidates.extend([sys.maxint + 1, 2 ** 70])  # Near misses: longs are not integers
+            elif isinstance(property_instance, DateTime):
+                candidates.append(u'2016-01-01T00:00:00\n')
+
+        return candidates or [object()]
+
+
+def _length_bounds(validators):
+    low, high = 0, 1000
+
+    for validator in validators:
+        if getattr(validator, 'name', None) == 'min_length':
+            low = max(low, validator.argument)
+        elif getattr(validator, 'name', None) == 'max_length':
+            high = min(high, validator.argument)
+
+    return low, high
+
+
+def _passes(validators, value):
+    try:
+        for validator in validators:
+            validator(value)
+    except AssertionError:
+        return False
+
+    return True
+
+
+def reference_engine(model_class, payload):
+    """Model.from_dict() followed by Model.validate() - returns the errors, or None if from_dict() itself failed"""
+
+    try:
+        model_instance = model_class.from_dict(payload)
+    except (InvalidModelError, CannotSetPropertyError):
+        return None
+
+    try:
+        model_instance.validate()
+    except InvalidModelError as e:
+        return e.errors
+
+    return {}
+
+
+def _dict_errors(model_class, payload):
+    try:
+        model_class.validate_dict(payload)
+    except InvalidModelError as e:
+        return e.errors
+
+    return {}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    raise TypeError('Not JSON serializable')
+
+
+def _json_accepts(model_class, payload):
+    try:
+        document = json.dumps(payload, default=_json_default)
+    except (TypeError, ValueError):
+        return None  # Not a JSON payload: no opinion
+
+    try:
+        model_class.from_json(document).validate()
+    except (InvalidModelError, CodecError, CannotSetPropertyError):
+        return False
+
+    return True
+
+
+_compiled_schemas = {}
+
+
+def _schema_accepts(model_class, payload):
+    try:
+        document = json.loads(json.dumps(payload, default=_json_default))
+    except (TypeError, ValueError):
+        return None  # Not a JSON payload: no opinion
+
+    is_valid = _compiled_schemas.get(model_class)
+    if is_valid is None:
+        is_valid = _compiled_schemas[model_class] = compile_schema(model_class.json_schema())
+
+    return is_valid(document)
+
+
+# name: (function(model_class, payload), whether it returns errors rather than a boolean)
+ENGINES = {
+    'validate_dict': (_dict_errors, True),
+    'check_dict': (lambda model_class, payload: model_class.check_dict(payload).errors, True),
+    'from_json': (_json_accepts, False),
+    'schema': (_schema_accepts, False),
+}
+
+
+def differential(model_class, payloads, engines=None):
+    """Run payloads through the reference engine and other engines - returns the disagreements, as (engine name,
+    payload, reference outcome, engine outcome) tuples
+
+    :type model_class: Model
+    :param payloads
+    :param engines: engine names (see ENGINES), all of them by default
+    """
+
+    disagreements = []
+    engines = [(name, ENGINES[name]) for name in sorted(engines if engines is not None else ENGINES)]
+
+    for payload in payloads:
+        reference_errors = reference_engine(model_class, payload)
+        for name, (engine, returns_errors) in engines:
+            outcome = engine(model_class, payload)
+            if outcome is None:
+                continue
+            elif returns_errors and reference_errors is not None:
+                agree = outcome == reference_errors
+            else:
+                agree = (len(outcome) == 0 if returns_errors else outcome) == (reference_errors == {})
+            if not agree:
+                disagreements.append((name, payload, reference_errors, outcome))
+
+    return disagreements
+
+
+def throughput(function, model_class, payloads):
+    """Payloads per second
+
+    :param function: an engine
+    :type model_class: Model
+    :param payloads
+    """
+
+    start = time.time()
+
+    for payload in payloads:
+        function(model_class, payload)
+
+    return len(payloads) / max(time.time() - start, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzzing harness')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--invalid-rate', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    generator = PayloadGenerator(BlogPost, seed=args.seed)
+    payloads = list(generator.payloads(args.count, args.invalid_rate))
+    rejected_count = sum(1 for payload in payloads if reference_engine(BlogPost, payload) != {})
+
+    print('%d payloads, %d rejected by the reference engine' % (len(payloads), rejected_count))
+    print('%-15s %10.0f payloads/s' % ('reference', throughput(reference_engine, BlogPost, payloads)))
+    for name in sorted(ENGINES):
+        print('%-15s %10.0f payloads/s' % (name, throughput(ENGINES[name][0], BlogPost, payloads)))
+
+    disagreements = differential(BlogPost, payloads)
+    for name, payload, reference_outcome, outcome in disagreements[:10]:
+        print('%s disagrees: %r gives %r rather than %r' % (name, payload, outcome, reference_outcome))
+
+    if disagreements:
+        raise SystemExit('%d disagreements' % len(disagreements))
+
+
+if __name__ == '__main__':
+    main()
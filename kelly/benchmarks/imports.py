@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks.imports
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Import time benchmark: every scenario is run in fresh interpreters, and reports the median wall time and the number of
+modules loaded on top of a bare interpreter. With --details, the slowest imports of each scenario are listed, much like
+`python -X importtime` does on Python 3.7+.
+
+$ python -m kelly.benchmarks.imports --runs 20 --details
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SCENARIOS = (
+    ('import kelly', 'import kelly'),
+    ('error constants', 'from kelly import ERROR_INVALID, InvalidModelError'),
+    ('properties', 'from kelly import String, Integer'),
+    ('models', 'from kelly import Model, String'),
+    ('model definition', 'from kelly import Model, String\nclass Author(Model):\n    name = String()'),
+    ('JSON', 'from kelly import Model, String\nclass Author(Model):\n    name = String()\nAuthor(name=u"P").to_json()'),
+)
+
+_probe = '''
+import sys, time
+modules = set(sys.modules)
+start = time.time()
+%s
+elapsed = time.time() - start
+sys.stdout.write('%%f %%d' %% (elapsed, len(set(sys.modules) - modules)))
+'''
+
+_import_time_probe = '''
+import __builtin__, sys, time
+original_import = __builtin__.__import__
+timings = {}
+def timed_import(name, *args, **kwargs):
+    loaded = set(sys.modules)
+    start = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        for module_name in set(sys.modules) - loaded:
+            if sys.modules[module_name] is not None:
+                timings.setdefault(module_name, time.time() - start)
+__builtin__.__import__ = timed_import
+%s
+__builtin__.__import__ = original_import
+for module_name, elapsed in timings.items():
+    sys.stdout.write('%%f %%s\\n' %% (elapsed, module_name))
+'''
+
+
+def measure(statement, runs):
+    """Run a statement in fresh interpreters - returns the median time (in seconds) and the number of loaded modules
+
+    :param statement
+    :param runs
+    """
+
+    timings = []
+    module_count = 0
+
+    for _ in xrange(runs):
+        output = subprocess.check_output([sys.executable, '-c', _probe % statement], env=_environment())
+        elapsed, module_count = output.split()
+        timings.append(float(elapsed))
+
+    timings.sort()
+
+    return timings[len(timings) // 2], int(module_count)
+
+
+def slowest_imports(statement, count=10):
+    """List the slowest imports of a statement, with their cumulative time in seconds - the equivalent of Python 3.7+
+    `python -X importtime`, which Python 2 lacks
+
+    :param statement
+    :param count
+    """
+
+    output = subprocess.check_output([sys.executable, '-c', _import_time_probe % statement], env=_environment())
+    imports = []
+
+    for line in output.splitlines():
+        cumulative_time, module_name = line.split()
+        imports.append((float(cumulative_time), module_name))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+def _environment():
+    """Make sure child interpreters import this copy of kelly"""
+
+    environment = dict(os.environ)
+    package_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [package_directory, environment.get('PYTHONPATH')]))
+
+    return environment
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--details', action='store_true')
+    args = parser.parse_args()
+
+    for name, statement in SCENARIOS:
+        elapsed, module_count = measure(statement, args.runs)
+        print('%-20s %8.2f ms %5d modules' % (name, elapsed * 1000, module_count))
+
+        for cumulative_time, module_name in slowest_imports(statement) if args.details else ():
+            print('    %-30s %8.2f ms' % (module_name, cumulative_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
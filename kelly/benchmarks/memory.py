@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks.memory
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Memory benchmark: how much a model instance costs, and how many objects each operation leaves behind. Every scenario is
+run in a fresh interpreter, and reports:
+
+* instance_bytes: the deep size of an instance (sys.getsizeof, summed over everything it refers to), with objects
+  shared between instances (such as interned strings or cached values) amortized over many instances;
+* <operation>_objects: the number of garbage collected objects created by an operation (construction, from_dict(),
+  validate(), dict()) and still alive afterwards, its result included;
+* peak_bytes: the peak memory used while decoding, validating and casting a batch of instances - measured with
+  tracemalloc when it is available (Python 3.4+, or a pytracemalloc build), from the resident set size otherwise.
+
+Results are compared against a baseline (memory_baseline.json, next to this file), and the command fails if any of
+them grew by more than the tolerance. Use --save to store a new baseline.
+
+$ python -m kelly.benchmarks.memory --count 2000
+$ python -m kelly.benchmarks.memory --save
+
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+from kelly.benchmarks.imports import _environment
+from kelly.benchmarks.samples import BlogPost, Reading, Settings, blog_post_dict, reading_dict, settings_dict
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2, unless built with pytracemalloc
+    tracemalloc = None
+
+SCENARIOS = (
+    ('flat', Reading, reading_dict),
+    ('list of 100 objects', BlogPost, lambda index: blog_post_dict(index, revision_count=100)),
+    ('wide dict mapping', Settings, settings_dict),
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'memory_baseline.json')
+
+_probe = '''
+import json, sys
+from kelly.benchmarks.memory import measure
+sys.stdout.write(json.dumps(measure(%r, %d)))
+'''
+
+# Objects shared by every instance, not part of their cost
+_skipped_types = (type, type(sys), type(len), type(lambda: None))
+
+
+def deep_size(value):
+    """Size of a value in bytes, including everything it refers to - every object is counted once, and classes,
+    modules and functions are not counted
+
+    :param value
+    """
+
+    seen = set()
+    stack = [value]
+    size = 0
+
+    while len(stack) > 0:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _skipped_types):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            stack.extend(current.iterkeys())
+            stack.extend(current.itervalues())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+
+    return size
+
+
+def count_objects(function, repeat):
+    """Average number of garbage collected objects created by a function and still alive afterwards, results included -
+    an approximation, as objects recycled from CPython free lists are not always counted
+
+    :param function
+    :param repeat
+    """
+
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()  # The generation 0 count is then the number of tracked objects created minus those freed
+
+    try:
+        results = []
+        before = gc.get_count()[0]
+        for _ in xrange(repeat):
+            results.append(function())
+        created = gc.get_count()[0] - before
+    finally:
+        if enabled:
+            gc.enable()
+
+    return float(max(created, 0)) / repeat
+
+
+def peak_bytes(function):
+    """Peak memory used by a function, in bytes
+
+    :param function
+    """
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    import resource
+
+    gc.collect()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    function()
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return (after - before) * (1 if sys.platform == 'darwin' else 1024)  # Kilobytes, except on OS X
+
+
+def measure(scenario_name, count):
+    """Measure a scenario in the current interpreter - returns a dict of results
+
+    :param scenario_name
+    :param count: the number of instances to build
+    """
+
+    model_class, build_dict = dict((name, (model_class, build_dict)) for name, model_class, build_dict
+                                   in SCENARIOS)[scenario_name]
+    payloads = [build_dict(index) for index in xrange(count)]
+
+    def run():
+        decoded = [model_class.from_dict(payload) for payload in payloads]
+        for decoded_instance in decoded:
+            decoded_instance.validate()
+        return [dict(decoded_instance) for decoded_instance in decoded]
+
+    results = {'peak_bytes': peak_bytes(run)}  # First, as the resident set size only tells about its highest point
+
+    instance = model_class.from_dict(payloads[0])
+    values = dict((property_name, getattr(instance, property_name)) for property_name in model_class._model_properties)
+
+    instances = [model_class.from_dict(payload) for payload in payloads]
+    results['instance_bytes'] = (deep_size(instances) - deep_size([None] * count)) // count
+    del instances
+
+    repeat = min(count, 1000)
+    results['construct_objects'] = count_objects(lambda: model_class(**values), repeat)
+    results['from_dict_objects'] = count_objects(lambda: model_class.from_dict(payloads[0]), repeat)
+    results['validate_objects'] = count_objects(instance.validate, repeat)
+    results['dict_objects'] = count_objects(lambda: dict(instance), repeat)
+
+    return results
+
+
+def measure_all(count):
+    """Measure every scenario, each in a fresh interpreter
+
+    :param count: the number of instances to build
+    """
+
+    results = {}
+
+    for scenario_name, _, _ in SCENARIOS:
+        output = subprocess.check_output([sys.executable, '-c', _probe % (scenario_name, count)], env=_environment())
+        results[scenario_name] = json.loads(output)
+
+    return results
+
+
+def peak_method():
+    return 'tracemalloc' if tracemalloc is not None else 'rusage'
+
+
+def compare(results, baseline, tolerance, count):
+    """List the results that grew by more than the tolerance - peak memory is skipped if the baseline was measured
+    another way, or for another instance count
+
+    :param results: as returned by measure_all()
+    :param baseline: a stored baseline
+    :param tolerance: e.g. 0.05 for 5%
+    :param count: the number of instances the results were measured with
+    """
+
+    regressions = []
+
+    for scenario_name, scenario_results in sorted(results.iteritems()):
+        baseline_results = baseline['scenarios'].get(scenario_name, {})
+        for metric, value in sorted(scenario_results.iteritems()):
+            if metric not in baseline_results:
+                continue
+            elif metric == 'peak_bytes' and (baseline.get('peak'), baseline.get('count')) != (peak_method(), count):
+                continue
+            reference = baseline_results[metric]
+            if value - reference > max(reference * tolerance, 1):
+                regressions.append((scenario_name, metric, reference, value))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory benchmark')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.05)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    results = measure_all(args.count)
+
+    for scenario_name, _, _ in SCENARIOS:
+        print(scenario_name)
+        for metric, value in sorted(results[scenario_name].iteritems()):
+            print('    %-20s %12.1f' % (metric, value))
+
+    if args.save:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'python': sys.version.split()[0], 'peak': peak_method(), 'count': args.count,
+                       'scenarios': results}, baseline_file, indent=2, sort_keys=True)
+        return
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, args.tolerance, args.count)
+
+    for scenario_name, metric, reference, value in regressions:
+        print('Regression: %s, %s went from %.1f to %.1f' % (scenario_name, metric, reference, value))
+
+    if len(regressions) > 0:
+        raise SystemExit('Memory usage grew by more than %d%%' % (args.tolerance * 100))
+
+
+if __name__ == '__main__':
+    main()
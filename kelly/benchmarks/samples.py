@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks.samples
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Representative models & payloads used by benchmarks.
+
+"""
+
+from uuid import uuid4
+from datetime import datetime
+from kelly import Model, String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, choices, min_length, \
+    max_length, regex, model_validator, ERROR_REQUIRED
+
+
+class Author(Model):
+    name = String(validators=[min_length(2)])
+
+
+class Revision(Model):
+    id = Uuid(default_value=uuid4)
+    changes = String(default_value=u'Fake changes')
+
+
+class BlogPost(Model):
+    id = Uuid(default_value=uuid4)
+    title = String(validators=[min_length(3), max_length(100), regex(r'^([A-Za-z0-9- !.]*)$')])
+    status = String(validators=[choices([u'draft', u'published'])])
+    body = String(default_value=u'Lorem ipsum')
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String()})
+    published = Boolean()
+    likes = Integer(required=False)
+    category = String(required=False)
+    tags = List(property=String(validators=[min_length(3)]))
+    author = Object(model_class=Author)
+    created_on = DateTime(default_value=datetime.now)
+    revisions = List(required=False, property=Object(model_class=Revision))
+
+    @model_validator(error_key='category')
+    def category_or_tags(self):
+        assert self.tags is not None or self.category is not None, ERROR_REQUIRED
+
+
+def blog_post_dict(index=0, revision_count=2):
+    """Build a valid blog post payload, as returned by dict(blog_post)
+
+    :param index: makes payloads slightly different from each other
+    :param revision_count
+    """
+
+    return dict(BlogPost(title=u'Hello world %d' % index, status=u'published', published=True, likes=index,
+                         tags=[u'foo', u'bar'], meta_data={'corrector': u'Pierre', 'reviewer': u'Moinax'},
+                         author=Author(name=u'Pierre'), revisions=[Revision() for _ in xrange(revision_count)]))
+
+
+class Reading(Model):
+    """A flat model: scalar properties only"""
+
+    id = Uuid(default_value=uuid4)
+    sensor = String(validators=[min_length(2)])
+    value = Integer()
+    unit = String(validators=[choices([u'C', u'F'])])
+    calibrated = Boolean()
+    taken_on = DateTime(default_value=datetime.now)
+
+
+def reading_dict(index=0):
+    return dict(Reading(sensor=u'sensor-%d' % (index % 10), value=index, unit=u'C', calibrated=True))
+
+
+SETTINGS_WIDTH = 200
+
+
+class Settings(Model):
+    """A wide dict mapping, like configuration payloads"""
+
+    name = String()
+    values = Dict(mapping={'setting_%03d' % index: Integer() for index in xrange(SETTINGS_WIDTH)})
+
+
+def settings_dict(index=0):
+    return {'name': u'settings-%d' % index,
+            'values': {'setting_%03d' % setting: index + setting for setting in xrange(SETTINGS_WIDTH)}}
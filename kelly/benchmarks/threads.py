@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.benchmarks.threads
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Concurrent validation stress benchmark: models are decoded and validated from a thread pool, and results are checked
+against a single-threaded run.
+
+$ python -m kelly.benchmarks.threads --threads 8 --count 20000
+
+"""
+
+import argparse
+import time
+from multiprocessing.pool import ThreadPool
+from kelly import InvalidModelError
+from kelly.benchmarks.samples import BlogPost, blog_post_dict
+
+
+def build_payloads(count):
+    """Every third payload is invalid"""
+
+    payloads = []
+
+    for index in xrange(count):
+        payload = blog_post_dict(index)
+        if index % 3 == 0:
+            payload['title'] = None
+        payloads.append(payload)
+
+    return payloads
+
+
+def validate_payload(payload):
+    """Return None if the payload is valid, its errors otherwise"""
+
+    try:
+        BlogPost.from_dict(payload).validate()
+    except InvalidModelError as e:
+        return e.errors
+
+    return None
+
+
+def run(payloads, threads):
+    """Validate payloads with a pool of threads - returns the results and the elapsed time
+
+    :param payloads
+    :param threads
+    """
+
+    pool = ThreadPool(threads)
+
+    try:
+        start = time.time()
+        results = pool.map(validate_payload, payloads, chunksize=max(1, len(payloads) // (threads * 8)))
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent validation stress benchmark')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.count)
+    reference_results, reference_elapsed = run(payloads, 1)
+    results, elapsed = run(payloads, args.threads)
+
+    if results != reference_results:
+        raise SystemExit('Concurrent validation results differ from single-threaded ones')
+
+    print('1 thread:   %8.0f payloads/s' % (len(payloads) / reference_elapsed))
+    print('%-2d threads: %8.0f payloads/s' % (args.threads, len(payloads) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.changes
+~~~~~~~~~~~~~
+
+Field-level differences between model instances, and patches built from them.
+
+A patch (or delta) is a plain dict: {'set': {path: value}, 'unset': [path]}, where values are dict-casted just like
+dict(model) does. Only dict keys are ever unset. Paths are dotted, so patches only support dicts whose keys are strings
+without dots. Frozen models cannot be patched.
+
+> delta = make_patch(stored_blog_post, blog_post)
+> payload = encode_patch(delta)
+> ...
+> stored_blog_post.apply_patch(decode_patch(payload))
+
+"""
+
+from errors import ERROR_EXTRA, ERROR_INVALID, CodecError, InvalidModelError, CannotSetPropertyError
+from base import Model as BaseModel
+from properties import List, Dict
+from codecs import _encode_value, _decode_value, _decoding_errors
+
+_missing = object()
+
+
+class _LimitReached(Exception):
+    pass
+
+
+def diff(model_instance, other_model_instance, limit=None):
+    """List the paths of the properties that differ between two instances of the same model class. Nested models, lists
+    and dicts are walked, so paths look like 'author.name', 'revisions.1.changes' or 'meta_data.reviewer'. Values that
+    are the same object are never compared.
+
+    > if diff(stored_blog_post, blog_post, limit=1):
+    >     save(blog_post)
+
+    :type model_instance: Model
+    :type other_model_instance: Model
+    :param limit: stop as soon as that many differences are found
+    """
+
+    return _diff(model_instance, other_model_instance, limit, False)
+
+
+def _diff(model_instance, other_model_instance, limit, patching):
+    if type(model_instance) is not type(other_model_instance):
+        raise TypeError('Cannot diff instances of different model classes')
+
+    changes = []
+
+    try:
+        _diff_models(changes, limit, patching, '', model_instance, other_model_instance)
+    except _LimitReached:
+        pass
+
+    return changes
+
+
+def _diff_models(changes, limit, patching, prefix, model_instance, other_model_instance):
+    for property_name in model_instance._model_property_names:
+        _diff_values(changes, limit, patching, prefix + property_name, getattr(model_instance, property_name),
+                     getattr(other_model_instance, property_name))
+
+
+def _diff_values(changes, limit, patching, path, value, other_value):
+    if value is other_value:
+        return
+    elif isinstance(value, BaseModel) and type(value) is type(other_value):
+        _diff_models(changes, limit, patching, path + '.', value, other_value)
+    elif isinstance(value, list) and isinstance(other_value, list) and len(value) == len(other_value):
+        for index, item in enumerate(value):
+            _diff_values(changes, limit, patching, '%s.%d' % (path, index), item, other_value[index])
+    elif isinstance(value, dict) and isinstance(other_value, dict):
+        for inner_key, inner_value in value.iteritems():
+            if inner_key in other_value:
+                _diff_values(changes, limit, patching, _inner_path(path, inner_key, patching), inner_value,
+                             other_value[inner_key])
+            else:
+                _add_change(changes, limit, _inner_path(path, inner_key, patching))
+        for inner_key in other_value:
+            if inner_key not in value:
+                _add_change(changes, limit, _inner_path(path, inner_key, patching))
+    elif value != other_value:
+        _add_change(changes, limit, path)
+
+
+def _inner_path(path, inner_key, patching):
+    """The path of a dict value - patches look keys up by path segment, so they must be strings without dots"""
+
+    if patching and (not isinstance(inner_key, basestring) or '.' in inner_key):
+        raise ValueError('Cannot patch dict key %r of %s: keys must be strings without dots' % (inner_key, path))
+
+    return '%s.%s' % (path, inner_key)
+
+
+def _add_change(changes, limit, path):
+    changes.append(path)
+
+    if limit is not None and len(changes) >= limit:
+        raise _LimitReached()
+
+
+def make_patch(model_instance, other_model_instance):
+    """Build the delta that turns model_instance into other_model_instance - a ValueError is raised for changed dicts
+    whose keys cannot be written as path segments (see kelly.changes)
+
+    :type model_instance: Model
+    :type other_model_instance: Model
+    """
+
+    delta = {'set': {}, 'unset': []}
+
+    for path in _diff(model_instance, other_model_instance, None, True):
+        value = _get_path(other_model_instance, path)
+        if value is _missing:
+            delta['unset'].append(path)
+        else:
+            delta['set'][path] = _to_dict(value)
+
+    return delta
+
+
+def encode_patch(delta):
+    """Encode a delta to a compact binary string (see kelly.codecs)
+
+    :param delta
+    """
+
+    buf = bytearray()
+    _encode_value(buf, delta)
+
+    return str(buf)
+
+
+def decode_patch(data):
+    """Decode a binary string produced by encode_patch()
+
+    :param data
+    """
+
+    try:
+        return _decode_value(bytearray(data), 0, None)[0]
+    except _decoding_errors:
+        raise CodecError('Invalid patch payload')
+
+
+def apply_patch(model_instance, delta, context=None):
+    """Apply a delta to a model instance, validating only what changed. The model is left untouched if the patched
+    values are invalid, or if a frozen model lies along a patched path.
+
+    :type model_instance: Model
+    :param delta
+    :param context: an arbitrary validation context (any string will do)
+    """
+
+    undo = []
+    # Models along the changed paths: id -> [model, path prefix, names of changed properties, names of properties
+    # holding changes]
+    touched = {}
+
+    try:
+        for path, value in delta.get('set', {}).iteritems():
+            container, key, property_instance = _walk(model_instance, path, touched)
+            if property_instance is not None and value is not None:
+                value = property_instance.from_dict(value)
+            undo.append((container, key, _get(container, key)))
+            _set(container, key, value)
+
+        for path in delta.get('unset', []):
+            container, key, _ = _walk(model_instance, path, touched)
+            if not isinstance(container, dict):
+                raise InvalidModelError(errors={path: ERROR_INVALID})
+            undo.append((container, key, container.pop(key, _missing)))
+
+        errors = {}
+        for touched_model, prefix, property_names, holding_names in touched.itervalues():
+            touched_errors = {}
+            for property_name in property_names:
+                touched_model._validate_property(touched_errors, property_name, context)
+            touched_model._run_model_validators(touched_errors, context, holding_names)
+            for error_key, error in touched_errors.iteritems():
+                errors[prefix + error_key] = error
+
+        if len(errors) > 0:
+            raise InvalidModelError(errors)
+    except Exception:
+        for container, key, old_value in reversed(undo):
+            if old_value is _missing:
+                container.pop(key, None)
+            else:
+                _set(container, key, old_value)
+        raise
+
+
+def _walk(model_instance, path, touched):
+    """Find the container and key a path points to, along with the property describing the value (if any). Models
+    found along the way are recorded in touched, so that the model validators reading the properties holding the
+    change are run.
+    """
+
+    segments = path.split('.')
+    container = model_instance
+    property_instance = None
+    prefix = ''
+
+    for index, segment in enumerate(segments):
+        if isinstance(container, BaseModel):
+            if container.frozen:  # Lists and dicts held by frozen models are part of their content hash
+                raise CannotSetPropertyError('Cannot patch frozen models')
+            property_instance = container._model_properties.get(segment)
+            if property_instance is None:
+                raise InvalidModelError(errors={prefix + segment: ERROR_EXTRA})
+            key = segment
+            touched_model = touched.setdefault(id(container), [container, prefix, set(), set()])
+            touched_model[3].add(segment)
+            innermost_model_segment = touched_model, segment
+        elif isinstance(container, list):
+            try:
+                key = int(segment)
+                container[key]
+            except (ValueError, IndexError):
+                raise InvalidModelError(errors={path: ERROR_INVALID})
+            property_instance = property_instance.property if isinstance(property_instance, List) else None
+        elif isinstance(container, dict):
+            key = segment
+            property_instance = property_instance.inner_property(segment) if isinstance(property_instance, Dict) \
+                else None
+        else:
+            raise InvalidModelError(errors={path: ERROR_INVALID})
+
+        if index == len(segments) - 1:
+            # Only the property of the innermost model holding the changed value needs to be validated
+            touched_model, property_name = innermost_model_segment
+            touched_model[2].add(property_name)
+            return container, key, property_instance
+
+        container = _get(container, key)
+        prefix += segment + '.'
+        if container is _missing:
+            raise InvalidModelError(errors={path: ERROR_INVALID})
+
+
+def _get(container, key):
+    if isinstance(container, BaseModel):
+        return getattr(container, key)
+    elif isinstance(container, dict):
+        return container.get(key, _missing)
+
+    return container[key]
+
+
+def _set(container, key, value):
+    if isinstance(container, BaseModel):
+        setattr(container, key, value)
+    else:
+        container[key] = value
+
+
+def _get_path(model_instance, path):
+    value = model_instance
+
+    for segment in path.split('.'):
+        value = _get(value, int(segment) if isinstance(value, list) else segment)
+        if value is _missing:
+            break
+
+    return value
+
+
+def _to_dict(value):
+    if isinstance(value, BaseModel):
+        return dict(value)
+    elif isinstance(value, list):
+        return [_to_dict(item) for item in value]
+    elif isinstance(value, dict):
+        return {inner_key: _to_dict(inner_value) for inner_key, inner_value in value.iteritems()}
+
+    return value
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.codecs
+~~~~~~~~~~~~
+
+Compact binary encoding of models.
+
+Properties are written positionally, following the (sorted) model property table, so property names never end up in
+the payload. Every encoded model carries a fingerprint of its schema: decoding a payload against a model class whose
+properties have changed fails instead of silently shifting values.
+
+> payload = encode(blog_post)
+> restored_blog_post = decode(payload, BlogPost)
+
+"""
+
+import struct
+import zlib
+from datetime import datetime
+from errors import CodecError, CannotSetPropertyError
+from base import Model as BaseModel
+from properties import List, Dict, Object, Union
+
+MAGIC = 0x4b  # 'K'
+FORMAT_VERSION = 1
+
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INTEGER = 0x03
+TAG_FLOAT = 0x04
+TAG_BYTES = 0x05
+TAG_UNICODE = 0x06
+TAG_DATETIME = 0x07
+TAG_LIST = 0x08
+TAG_DICT = 0x09
+TAG_MODEL = 0x0a
+
+_header = struct.Struct('>BBI')
+_fingerprint = struct.Struct('>I')
+_float = struct.Struct('>d')
+_datetime = struct.Struct('>HBBBBBI')
+
+# What decoding corrupted data may raise: truncated data, invalid UTF-8 or datetimes, unhashable dict keys, huge
+# lengths, deep nesting, and values that the model cannot hold (e.g. an integer for a DateTime, a Constant mismatch)
+_decoding_errors = (IndexError, ValueError, TypeError, struct.error, OverflowError, RuntimeError, AttributeError,
+                    CannotSetPropertyError)
+
+
+def property_signature(property_instance):
+    """Describe a property type, including the types of its inner properties
+
+    :param property_instance
+    """
+
+    if isinstance(property_instance, List) and property_instance.property is not None:
+        return 'List[%s]' % property_signature(property_instance.property)
+    elif isinstance(property_instance, Dict) and property_instance.mapping is not None:
+        return 'Dict{%s}' % ','.join('%s:%s' % (inner_key, property_signature(property_instance.mapping[inner_key]))
+                                     for inner_key in sorted(property_instance.mapping))
+    elif isinstance(property_instance, Dict) and property_instance.values is not None:
+        return 'Dict{*:%s}' % property_signature(property_instance.values)
+    elif isinstance(property_instance, Union):
+        mapping = property_instance.mapping
+        return 'Union<%s:%s>' % (property_instance.discriminator,
+                                 ','.join('%s=%s' % (value, mapping[value].__name__) for value in sorted(mapping)))
+    elif isinstance(property_instance, Object):
+        return 'Object<%s>' % property_instance._model_class.__name__
+
+    return type(property_instance).__name__
+
+
+def schema_fingerprint(model_class):
+    """Compute (and cache on the class) a 32-bit fingerprint of the model property table
+
+    :type model_class: Model
+    """
+
+    fingerprint = model_class.__dict__.get('_schema_fingerprint')
+
+    if fingerprint is None:
+        signature = '%s(%s)' % (model_class.__name__, ','.join(
+            '%s=%s' % (property_name, property_signature(model_class._model_properties[property_name]))
+            for property_name in model_class._model_property_names))
+        fingerprint = zlib.crc32(signature) & 0xffffffff
+        model_class._schema_fingerprint = fingerprint
+
+    return fingerprint
+
+
+def encode(model_instance):
+    """Encode a model instance to a compact binary string
+
+    :type model_instance: Model
+    """
+
+    buf = bytearray(_header.pack(MAGIC, FORMAT_VERSION, schema_fingerprint(type(model_instance))))
+    _encode_model_values(buf, model_instance)
+
+    return str(buf)
+
+
+def decode(data, model_class):
+    """Decode a binary string produced by encode() into a model instance
+
+    :param data
+    :type model_class: Model
+    """
+
+    data = bytearray(data)
+
+    try:
+        magic, version, fingerprint = _header.unpack_from(data, 0)
+    except struct.error:
+        raise CodecError('Truncated payload')
+
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise CodecError('Unsupported payload format')
+    if fingerprint != schema_fingerprint(model_class):
+        raise CodecError('Payload schema does not match %s' % model_class.__name__)
+
+    try:
+        model_instance, offset = _decode_model_values(data, _header.size, model_class)
+    except (IndexError, struct.error):
+        raise CodecError('Truncated payload')
+    except _decoding_errors:
+        raise CodecError('Corrupted payload')
+
+    if offset != len(data):
+        raise CodecError('Trailing data after payload')
+
+    return model_instance
+
+
+def _encode_varint(buf, number):
+    while number > 0x7f:
+        buf.append((number & 0x7f) | 0x80)
+        number >>= 7
+    buf.append(number)
+
+
+def _decode_varint(data, offset):
+    number = 0
+    shift = 0
+
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, offset
+        shift += 7
+
+
+def _encode_model_values(buf, model_instance):
+    for property_name in model_instance._model_property_names:
+        _encode_value(buf, getattr(model_instance, property_name))
+
+
+def _encode_value(buf, value):
+    if value is None:
+        buf.append(TAG_NONE)
+    elif value is True:
+        buf.append(TAG_TRUE)
+    elif value is False:
+        buf.append(TAG_FALSE)
+    elif isinstance(value, (int, long)):
+        buf.append(TAG_INTEGER)
+        _encode_varint(buf, value << 1 if value >= 0 else (-value << 1) - 1)  # Zigzag encoding
+    elif isinstance(value, float):
+        buf.append(TAG_FLOAT)
+        buf.extend(_float.pack(value))
+    elif isinstance(value, unicode):
+        encoded = value.encode('utf-8')
+        buf.append(TAG_UNICODE)
+        _encode_varint(buf, len(encoded))
+        buf.extend(encoded)
+    elif isinstance(value, str):
+        buf.append(TAG_BYTES)
+        _encode_varint(buf, len(value))
+        buf.extend(value)
+    elif isinstance(value, datetime):
+        if value.tzinfo is not None:
+            raise CodecError('Cannot encode timezone-aware datetimes')
+        buf.append(TAG_DATETIME)
+        buf.extend(_datetime.pack(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                                  value.microsecond))
+    elif isinstance(value, list):
+        buf.append(TAG_LIST)
+        _encode_varint(buf, len(value))
+        for item in value:
+            _encode_value(buf, item)
+    elif isinstance(value, dict):
+        buf.append(TAG_DICT)
+        _encode_varint(buf, len(value))
+        for inner_key, inner_value in value.iteritems():
+            _encode_value(buf, inner_key)
+            _encode_value(buf, inner_value)
+    elif isinstance(value, BaseModel):
+        buf.append(TAG_MODEL)
+        buf.extend(_fingerprint.pack(schema_fingerprint(type(value))))
+        _encode_model_values(buf, value)
+    else:
+        raise CodecError('Cannot encode values of type %s' % type(value).__name__)
+
+
+def _decode_model_values(data, offset, model_class):
+    properties = model_class._model_properties
+    kwargs = {}
+
+    for property_name in model_class._model_property_names:
+        kwargs[property_name], offset = _decode_value(data, offset, properties[property_name])
+
+    return model_class(**kwargs), offset
+
+
+def _decode_value(data, offset, property_instance):
+    """Decode a single value - the property is needed to find out the class of nested models
+
+    :param data
+    :param offset
+    :param property_instance
+    """
+
+    tag = data[offset]
+    offset += 1
+
+    if tag == TAG_NONE:
+        return None, offset
+    elif tag == TAG_TRUE:
+        return True, offset
+    elif tag == TAG_FALSE:
+        return False, offset
+    elif tag == TAG_INTEGER:
+        number, offset = _decode_varint(data, offset)
+        return (number >> 1) if not number & 1 else -((number + 1) >> 1), offset
+    elif tag == TAG_FLOAT:
+        return _float.unpack_from(data, offset)[0], offset + _float.size
+    elif tag == TAG_UNICODE or tag == TAG_BYTES:
+        length, offset = _decode_varint(data, offset)
+        if offset + length > len(data):
+            raise CodecError('Truncated payload')
+        value = str(data[offset:offset + length])
+        return value.decode('utf-8') if tag == TAG_UNICODE else value, offset + length
+    elif tag == TAG_DATETIME:
+        return datetime(*_datetime.unpack_from(data, offset)), offset + _datetime.size
+    elif tag == TAG_LIST:
+        length, offset = _decode_varint(data, offset)
+        item_property = property_instance.property if isinstance(property_instance, List) else None
+        value = []
+        for _ in xrange(length):
+            item, offset = _decode_value(data, offset, item_property)
+            value.append(item)
+        return value, offset
+    elif tag == TAG_DICT:
+        length, offset = _decode_varint(data, offset)
+        dict_property = property_instance if isinstance(property_instance, Dict) else None
+        value = {}
+        for _ in xrange(length):
+            inner_key, offset = _decode_value(data, offset, None)
+            inner_property = dict_property.inner_property(inner_key) if dict_property is not None else None
+            value[inner_key], offset = _decode_value(data, offset, inner_property)
+        return value, offset
+    elif tag == TAG_MODEL:
+        if not isinstance(property_instance, Object):
+            raise CodecError('Cannot decode a nested model without an Object property')
+        fingerprint = _fingerprint.unpack_from(data, offset)[0]
+        if isinstance(property_instance, Union):
+            model_class = _union_model_classes(property_instance).get(fingerprint)
+            if model_class is None:
+                raise CodecError('Payload schema does not match any model class of the union')
+        else:
+            model_class = property_instance._model_class
+            if fingerprint != schema_fingerprint(model_class):
+                raise CodecError('Payload schema does not match %s' % model_class.__name__)
+        return _decode_model_values(data, offset + _fingerprint.size, model_class)
+
+    raise CodecError('Unknown tag 0x%02x' % tag)
+
+
+def _union_model_classes(property_instance):
+    """Model classes of a Union property, by fingerprint (cached on the property)
+
+    :type property_instance: Union
+    """
+
+    model_classes = property_instance.__dict__.get('_model_classes_by_fingerprint')
+
+    if model_classes is None:
+        model_classes = {schema_fingerprint(model_class): model_class
+                         for model_class in property_instance.mapping.itervalues()}
+        property_instance._model_classes_by_fingerprint = model_classes
+
+    return model_classes
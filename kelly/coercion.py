@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.coercion
+~~~~~~~~~~~~~~
+
+Parsers used to coerce raw values (typically decoded from JSON, forms or query strings) to property types.
+
+Every parser returns None when the value cannot be converted: properties then keep the original value, and validation
+rejects it.
+
+"""
+
+import re
+import sys
+from datetime import datetime, timedelta
+
+UUID = None  # uuid.UUID, imported on first use
+
+DATETIME = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6})\d*)?'
+                      r'(?:(Z)|([+-])(\d{2}):?(\d{2}))?\Z')
+INTEGER = re.compile(r'[-+]?\d+\Z')
+CANONICAL_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z')
+
+BOOLEANS = {'true': True, 'false': False, '1': True, '0': False, 'yes': True, 'no': False}
+
+DATETIME_CACHE_SIZE = 4096
+
+# Payloads tend to repeat the same timestamps over and over - datetimes are immutable, so they can be shared
+_datetime_cache = {}
+
+
+def parse_datetime(value):
+    """Parse an ISO 8601 datetime string. Datetimes with a time zone designator are converted to naive UTC datetimes.
+
+    :param value
+    """
+
+    parsed = _datetime_cache.get(value)
+    if parsed is not None:
+        return parsed
+
+    match = DATETIME.match(value)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, utc, offset_sign, offset_hours, offset_minutes = match.groups()
+
+    try:
+        parsed = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                          int(fraction.ljust(6, '0')) if fraction else 0)
+    except ValueError:
+        return None
+
+    if offset_sign is not None:
+        offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+        try:
+            parsed = parsed - offset if offset_sign == '+' else parsed + offset
+        except OverflowError:  # At the edges of the datetime range, e.g. '0001-01-01T00:00:00+01:00'
+            return None
+
+    if len(_datetime_cache) >= DATETIME_CACHE_SIZE:
+        _datetime_cache.clear()
+    _datetime_cache[value] = parsed
+
+    return parsed
+
+
+def parse_integer(value):
+    """Parse an integer string, or convert an integral float
+
+    :param value
+    """
+
+    if isinstance(value, basestring):
+        return int(value) if INTEGER.match(value.strip()) is not None else None
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    return None
+
+
+def parse_boolean(value):
+    """Parse 'true', 'false', '1', '0', 'yes' or 'no' (case insensitive), or convert 0 and 1
+
+    :param value
+    """
+
+    if isinstance(value, basestring):
+        return BOOLEANS.get(value.strip().lower())
+    elif isinstance(value, (int, long)) and value in (0, 1):
+        return bool(value)
+
+    return None
+
+
+def normalize_uuid(value):
+    """Convert UUID instances and any string accepted by uuid.UUID (upper case, braces, no hyphens...) to the canonical,
+    lower case and hyphenated, unicode string
+
+    :param value
+    """
+
+    if isinstance(value, basestring):
+        if CANONICAL_UUID.match(value) is not None:
+            return unicode(value)
+        global UUID
+        if UUID is None:
+            from uuid import UUID  # Deferred, as uuid loads ctypes and subprocess
+        try:
+            return unicode(UUID(value))
+        except ValueError:
+            return None
+
+    # UUID instances only exist once uuid has been imported
+    uuid_module = sys.modules.get('uuid')
+    if uuid_module is not None and isinstance(value, uuid_module.UUID):
+        return unicode(value)
+
+    return None
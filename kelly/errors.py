@@ -23,11 +23,18 @@ class InvalidModelError(Exception):
 class InvalidPropertyError(Exception):
     """Exception raised whenever an attempt is made to validate an invalid value"""
 
-    def __init__(self, error):
+    def __init__(self, error, errors=None):
         self.error = error
+        self.errors = errors  # Inner errors, by key, if any (see Dict.inner_errors())
 
 
 class CannotSetPropertyError(Exception):
     """Exception raised whenever an attempt is made to change the value of a constant property"""
 
-    pass
\ No newline at end of file
+    pass
+
+
+class CodecError(Exception):
+    """Exception raised whenever a model cannot be encoded, or a payload cannot be decoded"""
+
+    pass
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.jsoncodec
+~~~~~~~~~~~~~~~
+
+Direct JSON encoding/decoding of models, walking the model property tables instead of going through dict(model) and
+Model.from_dict().
+
+Decoding is done by a recursive descent parser that knows which property it is reading: String, Integer and Boolean
+values are type-checked as soon as their token is read (arrays and objects as soon as they open), so that invalid
+payloads are rejected before the rest of the document is parsed. Unknown keys are rejected the same way. Documents of
+versioned models, which may be legacy ones, are parsed as plain JSON first, then decoded by Model.from_dict() (see
+kelly.migrations).
+
+"""
+
+import re
+from datetime import datetime
+from coercion import parse_datetime
+from json import JSONEncoder
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+from errors import ERROR_EXTRA, ERROR_INVALID, CodecError, InvalidModelError, InvalidPropertyError
+from base import Model as BaseModel
+from properties import String, Integer, Boolean, DateTime, List, Object
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+
+_scalar_property_types = (String, Integer, Boolean)
+
+
+class _Encoder(JSONEncoder):
+    """Encoder for values that are not described by a model property table (e.g. Dict values)"""
+
+    def default(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        elif isinstance(value, BaseModel):
+            return dict(value)
+
+        return super(_Encoder, self).default(value)
+
+
+_encoder = _Encoder(separators=(',', ':'))
+
+
+def _coerces_containers(property_instance):
+    """Whether a String, Integer or Boolean property may turn JSON arrays or objects into valid values: only custom
+    coercion may do so
+
+    :param property_instance
+    """
+
+    if property_instance.coerce is None or property_instance.coerce is False:
+        return False
+
+    return property_instance.coerce is not True or type(property_instance).coerce_value.__module__ != String.__module__
+
+
+def _is_polymorphic(property_instance):
+    """Object properties that override model_class() need the full value to find out the model class"""
+
+    return type(property_instance).model_class.__func__ is not Object.model_class.__func__
+
+
+def encode(model_instance):
+    """Encode a model instance to a JSON string
+
+    :type model_instance: Model
+    """
+
+    chunks = []
+    _encode_model(chunks, model_instance)
+
+    return ''.join(chunks)
+
+
+def _encode_model(chunks, model_instance):
+    separator = '{'
+
+    if model_instance.schema_version is not None:
+        chunks.append('{%s:%d' % (encode_basestring_ascii(model_instance.schema_version_key),
+                                  model_instance.schema_version))
+        separator = ','
+
+    for property_name in model_instance._model_property_names:
+        property_instance = model_instance._model_properties[property_name]
+        chunks.append(separator)
+        chunks.append(encode_basestring_ascii(property_name))
+        chunks.append(':')
+        _encode_value(chunks, property_instance, getattr(model_instance, property_name))
+        separator = ','
+
+    chunks.append('}' if separator == ',' else '{}')
+
+
+def _encode_value(chunks, property_instance, value):
+    if value is None:
+        chunks.append('null')
+    elif isinstance(value, BaseModel):
+        _encode_model(chunks, value)
+    elif isinstance(property_instance, List) and isinstance(value, list):
+        separator = '['
+        for item in value:
+            chunks.append(separator)
+            _encode_value(chunks, property_instance.property, item)
+            separator = ','
+        chunks.append(']' if separator == ',' else '[]')
+    elif isinstance(value, basestring):
+        chunks.append(encode_basestring_ascii(value))
+    else:
+        chunks.append(_encoder.encode(property_instance.to_dict(value) if property_instance is not None else value))
+
+
+def decode(data, model_class):
+    """Decode a JSON document into a model instance
+
+    :param data: a JSON document (str or unicode)
+    :type model_class: Model
+    """
+
+    if isinstance(data, str):
+        try:
+            data = data.decode('utf-8')
+        except UnicodeDecodeError:
+            raise CodecError('Invalid UTF-8 in JSON document')
+
+    parser = _Parser(data)
+
+    try:
+        model_instance = parser.parse_model(model_class)
+    except ValueError as e:  # Raised by scanstring() on malformed strings
+        raise CodecError(str(e))
+    except RuntimeError:  # Values of untyped properties nested beyond the recursion limit
+        raise CodecError('JSON document nested too deeply')
+
+    parser.skip_whitespace()
+
+    if parser.offset != len(data):
+        raise CodecError('Trailing data at offset %d' % parser.offset)
+
+    return model_instance
+
+
+class _Parser(object):
+    """Recursive descent JSON parser, driven by model property tables"""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def skip_whitespace(self):
+        self.offset = WHITESPACE.match(self.data, self.offset).end()
+
+    def error(self, message='Malformed JSON'):
+        return CodecError('%s at offset %d' % (message, self.offset))
+
+    def expect(self, character):
+        self.skip_whitespace()
+        if self.data[self.offset:self.offset + 1] != character:
+            raise self.error('Expected %r' % character)
+        self.offset += 1
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.data[self.offset:self.offset + 1]
+
+    def parse_model(self, model_class):
+        if model_class.schema_version is not None:
+            if self.peek() != '{':
+                raise self.error('Expected \'{\'')
+            return model_class.from_dict(self.parse_value())
+
+        properties = model_class._model_properties
+        kwargs = {}
+
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.offset += 1
+            return model_class(**kwargs)
+
+        while True:
+            self.expect('"')
+            property_name, self.offset = scanstring(self.data, self.offset)
+            self.expect(':')
+
+            property_instance = properties.get(property_name)
+            if property_instance is None:
+                raise InvalidModelError(errors={property_name: ERROR_EXTRA})
+
+            try:
+                kwargs[property_name] = self.parse_property_value(property_instance)
+            except InvalidPropertyError as e:
+                error_key = property_instance.error_key if property_instance.error_key is not None else property_name
+                raise InvalidModelError(errors={error_key: e.error})
+
+            character = self.peek()
+            self.offset += 1
+            if character == '}':
+                return model_class(**kwargs)
+            elif character != ',':
+                self.offset -= 1
+                raise self.error('Expected \',\' or \'}\'')
+
+    def parse_property_value(self, property_instance):
+        """Parse a value, checking its type against the property as early as possible
+
+        :param property_instance
+        """
+
+        character = self.peek()
+
+        if character == 'n':
+            return self.parse_value()
+        elif isinstance(property_instance, _scalar_property_types):
+            if (character == '[' or character == '{') and not _coerces_containers(property_instance):
+                raise InvalidPropertyError(ERROR_INVALID)
+            value = property_instance.from_dict(self.parse_value())  # Coercion, if any
+            try:
+                property_instance._do_validate(value)
+            except AssertionError as e:
+                raise InvalidPropertyError(e.message)
+            return value
+        elif isinstance(property_instance, DateTime):
+            if character != '"':
+                raise InvalidPropertyError(ERROR_INVALID)
+            value = parse_datetime(self.parse_value())
+            if value is None:
+                raise InvalidPropertyError(ERROR_INVALID)
+            return value
+        elif isinstance(property_instance, Object) and not _is_polymorphic(property_instance):
+            if character != '{':
+                raise InvalidPropertyError(ERROR_INVALID)
+            try:
+                return self.parse_model(property_instance._model_class)
+            except InvalidModelError:
+                raise InvalidPropertyError(ERROR_INVALID)
+        elif isinstance(property_instance, List) and property_instance.property is not None:
+            if character != '[':
+                raise InvalidPropertyError(ERROR_INVALID)
+            return self.parse_list(property_instance.property)
+
+        return property_instance.from_dict(self.parse_value())
+
+    def parse_list(self, item_property):
+        value = []
+
+        self.expect('[')
+
+        if self.peek() == ']':
+            self.offset += 1
+            return value
+
+        while True:
+            try:
+                value.append(self.parse_property_value(item_property))
+            except InvalidPropertyError:
+                raise InvalidPropertyError(ERROR_INVALID)
+
+            character = self.peek()
+            self.offset += 1
+            if character == ']':
+                return value
+            elif character != ',':
+                self.offset -= 1
+                raise self.error('Expected \',\' or \']\'')
+
+    def parse_value(self):
+        """Parse any JSON value"""
+
+        character = self.peek()
+
+        if character == '"':
+            value, self.offset = scanstring(self.data, self.offset + 1)
+            return value
+        elif character == '{':
+            value = {}
+            self.offset += 1
+            if self.peek() == '}':
+                self.offset += 1
+                return value
+            while True:
+                self.expect('"')
+                inner_key, self.offset = scanstring(self.data, self.offset)
+                self.expect(':')
+                value[inner_key] = self.parse_value()
+                character = self.peek()
+                self.offset += 1
+                if character == '}':
+                    return value
+                elif character != ',':
+                    self.offset -= 1
+                    raise self.error('Expected \',\' or \'}\'')
+        elif character == '[':
+            value = []
+            self.offset += 1
+            if self.peek() == ']':
+                self.offset += 1
+                return value
+            while True:
+                value.append(self.parse_value())
+                character = self.peek()
+                self.offset += 1
+                if character == ']':
+                    return value
+                elif character != ',':
+                    self.offset -= 1
+                    raise self.error('Expected \',\' or \']\'')
+
+        for literal, value in (('null', None), ('true', True), ('false', False)):
+            if self.data.startswith(literal, self.offset):
+                self.offset += len(literal)
+                return value
+
+        match = NUMBER.match(self.data, self.offset)
+        if match is None:
+            raise self.error()
+
+        self.offset = match.end()
+        integer, fraction, exponent = match.groups()
+
+        return float(integer + (fraction or '') + (exponent or '')) if fraction or exponent else int(integer)
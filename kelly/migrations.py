@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.migrations
+~~~~~~~~~~~~~~~~
+
+Versioned models: legacy dicts are upgraded while they are decoded, without any intermediate copy.
+
+Models declare their schema version, and the steps leading to each version. dict(model) stores the version under
+schema_version_key; dicts without it are version 1.
+
+> class Author(Model):
+>     schema_version = 3
+>     schema_migrations = {
+>         2: [rename('name', 'full_name')],
+>         3: [convert('age', int), fill('country', u'BE')],
+>     }
+>
+>     full_name = String()
+>     age = Integer()
+>     country = String()
+
+For each legacy version, steps are compiled once into a reading plan: every property knows which key of the legacy dict
+holds its value, and which conversions and defaults apply to it. Model._decode() follows that plan, so that nested
+models are upgraded by the same kelly.traversal pass that decodes them; Model.validate_dict() reads legacy values the
+same way (see reader). Versions and steps are checked when the model class is created.
+
+"""
+
+from errors import ERROR_INVALID, InvalidModelError, InvalidPropertyError
+
+RENAME = 'rename'
+FILL = 'fill'
+CONVERT = 'convert'
+
+_missing = object()
+
+
+class Step(object):
+    """Migration step"""
+
+    __slots__ = ('kind', 'name', 'argument')
+
+    def __init__(self, kind, name, argument):
+        self.kind = kind
+        self.name = name
+        self.argument = argument
+
+    def apply(self, value):
+        """Apply the step to the value of its key (_missing if the key is not there) - renames are not applied to
+        values
+
+        :param value
+        """
+
+        if self.kind == CONVERT and value is not _missing and value is not None:
+            try:
+                return self.argument(value)
+            except (ValueError, TypeError):
+                return value  # Left for validation to report
+        elif self.kind == FILL and value is _missing:
+            return self.argument() if callable(self.argument) else self.argument
+
+        return value
+
+
+def rename(old_name, new_name):
+    """The value of old_name moves to new_name"""
+
+    return Step(RENAME, old_name, new_name)
+
+
+def fill(name, value):
+    """Missing values are set to value (which can be a callable)"""
+
+    return Step(FILL, name, value)
+
+
+def convert(name, function):
+    """Values (other than None) are converted by function, e.g. convert('age', int) - values it fails to convert (with a
+    ValueError or TypeError) are kept as they are"""
+
+    return Step(CONVERT, name, function)
+
+
+def decode(model_class, dct):
+    """Decode a dict of any version - mirrors Model._decode()
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    casted = {}
+
+    for property_name, property_instance, value in read(model_class, dct):
+        try:
+            casted[property_name] = property_instance.from_dict(value)
+        except (InvalidPropertyError, InvalidModelError) as e:
+            error_key = property_instance.error_key or property_name
+            raise InvalidModelError(errors={error_key: getattr(e, 'error', ERROR_INVALID)})
+
+    return model_class(**casted)
+
+
+def read(model_class, dct):
+    """Yield (property_name, property_instance, raw value) for every property a dict of any version has a value for
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    for property_name, property_instance, source_key, steps in reading_plan(model_class, version(model_class, dct)):
+        value = dct.get(source_key, _missing) if source_key is not None else _missing
+        for step in steps:
+            value = step.apply(value)
+        if value is not _missing:
+            yield property_name, property_instance, value
+
+
+def reader(model_class, dct):
+    """A function reading property values from a dict of any version, as dct.get(property_name, default) would from
+    the upgraded dict - values are read from the dict itself, which is never upgraded nor copied
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    dict_version = version(model_class, dct)
+
+    if dict_version == model_class.schema_version:
+        return dct.get
+
+    sources = reading_sources(model_class, dict_version)
+
+    def get(property_name, default=None):
+        source_key, steps = sources[property_name]
+        value = dct.get(source_key, _missing) if source_key is not None else _missing
+        for step in steps:
+            value = step.apply(value)
+        return default if value is _missing else value
+
+    return get
+
+
+def upgrade(model_class, dct):
+    """Upgrade a dict to the current version of a model class - nested dicts are left as they are
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    if dct.get(model_class.schema_version_key, 1) == model_class.schema_version:
+        return dct
+
+    upgraded = {property_name: value for property_name, _, value in read(model_class, dct)}
+    upgraded[model_class.schema_version_key] = model_class.schema_version
+
+    return upgraded
+
+
+def version(model_class, dct):
+    """The version of a dict - raises InvalidModelError for unknown versions
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    dict_version = dct.get(model_class.schema_version_key, 1)
+
+    if not isinstance(dict_version, (int, long)) or isinstance(dict_version, bool) or \
+            not 1 <= dict_version <= model_class.schema_version:
+        raise InvalidModelError(errors={model_class.schema_version_key: ERROR_INVALID})
+
+    return dict_version
+
+
+def reading_plan(model_class, dict_version):
+    """Fetch (or compile) the reading plan of a model class for dicts of a given version: a tuple of (property_name,
+    property_instance, source key, steps). Plans are cached on the class.
+
+    :type model_class: Model
+    :param dict_version
+    """
+
+    return _cached(model_class, '_reading_plans', dict_version, _compile)
+
+
+def reading_sources(model_class, dict_version):
+    """The reading plan of a model class for dicts of a given version, by property name: (source key, steps)
+
+    :type model_class: Model
+    :param dict_version
+    """
+
+    return _cached(model_class, '_reading_sources', dict_version, lambda model_class, dict_version: {
+        property_name: (source_key, steps)
+        for property_name, _, source_key, steps in reading_plan(model_class, dict_version)})
+
+
+def check(model_class):
+    """Check the version and migrations of a model class - called when the class is created, so that misdeclared
+    migrations fail right away
+
+    :type model_class: Model
+    """
+
+    current_version = model_class.schema_version
+
+    if not isinstance(current_version, (int, long)) or isinstance(current_version, bool) or current_version < 1:
+        raise ValueError('%s has an invalid schema version %r' % (model_class.__name__, current_version))
+
+    for migration_version, steps in (model_class.schema_migrations or {}).iteritems():
+        if not isinstance(migration_version, (int, long)) or not 2 <= migration_version <= current_version:
+            raise ValueError('%s has migration steps for unknown version %r' % (model_class.__name__,
+                                                                               migration_version))
+        for step in steps:
+            if not isinstance(step, Step):
+                raise ValueError('%s has an invalid migration step for version %d: %r' % (model_class.__name__,
+                                                                                          migration_version, step))
+
+
+def _cached(model_class, attribute_name, dict_version, build):
+    cache = model_class.__dict__.get(attribute_name)
+
+    if cache is None:
+        cache = {}  # Deterministic, see "Thread safety" in README
+        setattr(model_class, attribute_name, cache)
+
+    value = cache.get(dict_version)
+
+    if value is None:
+        value = cache[dict_version] = build(model_class, dict_version)
+
+    return value
+
+
+def _compile(model_class, dict_version):
+    """Trace every property back through the steps leading from dict_version to the current version
+
+    :type model_class: Model
+    :param dict_version
+    """
+
+    migrations = model_class.schema_migrations or {}
+    steps = [step for migration_version in xrange(dict_version + 1, model_class.schema_version + 1)
+             for step in migrations.get(migration_version, ())]
+    plan = []
+
+    for property_name in model_class._model_property_names:
+        source_key = property_name
+        property_steps = []
+        for step in reversed(steps):
+            if step.kind == RENAME:
+                if source_key == step.argument:
+                    source_key = step.name
+                elif source_key == step.name:  # The key was moved away: older values belong to another property
+                    source_key = None
+                    break
+            elif step.name == source_key:
+                property_steps.append(step)
+        property_steps.reverse()
+        plan.append((property_name, model_class._model_properties[property_name], source_key, tuple(property_steps)))
+
+    return tuple(plan)
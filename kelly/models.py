@@ -8,9 +8,19 @@ Model class/metaclass.
 
 """
 
-from errors import ERROR_EXTRA, InvalidModelError, InvalidPropertyError
-from base import Model as BaseModel, Property as BaseProperty
+from errors import ERROR_EXTRA, ERROR_INVALID, InvalidModelError, InvalidPropertyError, CannotSetPropertyError, \
+    CodecError
+from base import Model as BaseModel, Property as BaseProperty, model_registry
 from validators import ModelValidator
+from plans import PlanCache
+from codecs import schema_fingerprint
+from results import VALID, ValidationResult
+from operator import attrgetter
+import traversal
+
+# Optional backends are imported on first use, so that importing models stays cheap, then kept in these globals: later
+# calls never go through the import statement (and its global lock) again
+payloads = projections = changes = migrations = rows = jsoncodec = schema = None
 
 
 class ModelMeta(type):
@@ -20,33 +30,149 @@ class ModelMeta(type):
         cls = type.__new__(mcs, name, bases, dct)
 
         if BaseModel not in bases:  # No need to parse properties / validators on model class itself
-            cls._model_properties = {}
-            cls._model_validators = []
+            model_properties = {}
+            model_validators = []
 
             # First, fetch model properties and model validators from base classes
             for base in bases:
                 if hasattr(base, '_model_properties'):
-                    cls._model_properties.update(base._model_properties)
+                    model_properties.update(base._model_properties)
                 if hasattr(base, '_model_validators'):
-                    cls._model_validators.extend(base._model_validators)
+                    model_validators.extend(base._model_validators)
 
             # Then, parse properties for the model class itself
             for candidate_name, candidate_value in dct.items():
                 if isinstance(candidate_value, BaseProperty):  # Properties setup
-                    cls._model_properties[candidate_name] = candidate_value
+                    model_properties[candidate_name] = candidate_value
                     delattr(cls, candidate_name)
                 elif isinstance(candidate_value, ModelValidator):  # Model validators setup
-                    cls._model_validators.append(candidate_value)
+                    model_validators.append(candidate_value)
                     delattr(cls, candidate_name)
 
+            # Tables are only published once complete, and never mutated afterwards (see "Thread safety" in README)
+            cls._model_properties = model_properties
+            cls._model_validators = tuple(model_validators)
+
+            # Stable positional ordering of properties, used by compact encodings
+            cls._model_property_names = tuple(sorted(model_properties))
+
+            # Property values in that order, as a tuple - compared by __eq__() and hashed by content_hash()
+            cls._model_values = staticmethod(_values_getter(cls._model_property_names))
+
+            # Models that cannot hold nested models skip graph traversals (see kelly.traversal)
+            cls._model_nested = any(traversal.can_nest(property_instance)
+                                    for property_instance in model_properties.itervalues())
+
+            # Versioned models: misdeclared migrations fail right away (see kelly.migrations)
+            if cls.schema_version is not None:
+                global migrations
+                if migrations is None:
+                    import migrations
+                migrations.check(cls)
+
+            # Validation plans: the context-free one is built right away, others on first use
+            cls._validation_plans = PlanCache(cls)
+
+            # Allow references by name, e.g. Object('Comment') for self-referencing models: names are looked up in the
+            # module of the model class declaring the property first (see kelly.base.get_model_class)
+            model_registry['%s.%s' % (cls.__module__, name)] = cls
+            for property_instance in model_properties.itervalues():
+                for object_property in traversal.object_properties(property_instance):
+                    if object_property._declaring_module is None:
+                        object_property._declaring_module = cls.__module__
+
         return cls
 
 
+def _values_getter(property_names):
+    """Build a getter of property values for a model class: attrgetter() fetches them all in one call"""
+
+    if len(property_names) == 0:
+        return lambda model_instance: ()
+    elif len(property_names) == 1:
+        getter = attrgetter(property_names[0])
+        return lambda model_instance: (getter(model_instance),)
+
+    return attrgetter(*property_names)
+
+
+def _result(errors):
+    if len(errors) == 0:
+        return VALID
+
+    return ValidationResult(errors)
+
+
+def _hashable(value):
+    """Convert lists and dicts to hashable equivalents
+
+    :param value
+    """
+
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    elif isinstance(value, dict):
+        return frozenset((inner_key, _hashable(inner_value)) for inner_key, inner_value in value.iteritems())
+    elif isinstance(value, Model):
+        return value.content_hash()
+
+    return value
+
+
+def _freeze(value):
+    """Freeze models nested in a value
+
+    :param value
+    """
+
+    if isinstance(value, Model):
+        value.freeze()
+    elif isinstance(value, list):
+        for item in value:
+            _freeze(item)
+    elif isinstance(value, dict):
+        for inner_value in value.itervalues():
+            _freeze(inner_value)
+
+
+# Instance attributes handled by _restore() itself, or recomputed after unpickling
+_unpickled_attributes = frozenset(['_frozen', '_content_hash'])
+
+
+def _restore(model_class, fingerprint, values, frozen):
+    """Unpickle a model instance: values are trusted, so they are neither processed nor validated again
+
+    :type model_class: Model
+    :param fingerprint: the schema fingerprint of the pickled model class (see kelly.codecs)
+    :param values: property values, following model_class._model_property_names
+    :param frozen
+    """
+
+    if fingerprint != schema_fingerprint(model_class):
+        raise CodecError('Pickled data does not match %s' % model_class.__name__)
+
+    model_instance = BaseModel.__new__(model_class)
+    model_instance.__dict__.update(zip(model_class._model_property_names, values))
+    if frozen:
+        model_instance.__dict__['_frozen'] = True
+
+    return model_instance
+
+
 class Model(BaseModel):
     """Base model class"""
 
     __metaclass__ = ModelMeta
 
+    # A thread pool (e.g. multiprocessing.pool.ThreadPool) running independent concurrent model validators, if any
+    model_validator_pool = None
+
+    # Versioned models: the current version, the steps leading to each version, and the dict key holding the version
+    # (see kelly.migrations)
+    schema_version = None
+    schema_migrations = None
+    schema_version_key = '_version'
+
     def __new__(cls, **kwargs):
         """Provide a default constructor to model classes"""
 
@@ -73,38 +199,161 @@ class Model(BaseModel):
         :param context: an arbitrary validation context (any string will do)
         """
 
+        errors = traversal.validate(self, context)
+
+        if len(errors) > 0:
+            raise InvalidModelError(errors)
+
+    def check(self, context=None):
+        """Validate the model without raising: returns a ValidationResult (see kelly.results)
+
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        return _result(traversal.validate(self, context))
+
+    def _collect_errors(self, context):
+        """Validate the model itself - nested models are validated by kelly.traversal
+
+        :param context
+        """
+
+        plan = self._validation_plans.get(context)
         errors = {}
 
         # Call validate() on Property instances
-        for property_name, property_instance in self._model_properties.iteritems():
-            property_value = getattr(self, property_name)
-
+        for property_name, property_instance, error_key, required, validators in plan.properties:
             try:
-                property_instance.validate(property_value, context)
+                property_instance.validate_with_plan(getattr(self, property_name), required, validators)
             except InvalidPropertyError as e:
-                error_key = property_instance.error_key if property_instance.error_key is not None else property_name
                 errors[error_key] = e.error
 
         # Call model validators
-        for validator in self._model_validators:
-            if validator.context is None or context == validator.context or validator.error_key not in errors:
-                try:
-                    validator(self)
-                except AssertionError as e:
-                    errors[validator.error_key] = e.message
+        self._run_model_validators(errors, context)
+
+        return errors
+
+    @classmethod
+    def validate_dict(cls, dct, context=None):
+        """Validate a dict payload as from_dict(dct).validate(context) would, without building any model instance.
+        Model validators are given a read-only view of the dict (see kelly.payloads).
+
+        > try:
+        >     BlogPost.validate_dict(request.json)
+        > except InvalidModelError as e:
+        >     return 400, e.errors
+
+        :param dct
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        errors = traversal.validate_dict(cls, dct, context)
 
         if len(errors) > 0:
             raise InvalidModelError(errors)
 
+    @classmethod
+    def check_dict(cls, dct, context=None):
+        """Validate a dict payload without raising, like validate_dict(): returns a ValidationResult (see
+        kelly.results)
+
+        :param dct
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        return _result(traversal.validate_dict(cls, dct, context))
+
+    @classmethod
+    def _collect_dict_errors(cls, dct, context):
+        """Validate a dict against the model itself - nested dicts are validated by kelly.traversal
+
+        :param dct
+        :param context
+        """
+
+        global payloads
+        if payloads is None:
+            import payloads
+
+        return payloads.collect_errors(cls, dct, context)
+
+    @classmethod
+    def prepare_contexts(cls, *contexts):
+        """Build validation plans for known contexts ahead of time (e.g. at startup) - the default context (None) is
+        always prepared. Plans for other contexts are built on first use, and kept in a bounded LRU cache.
+
+        > BlogPost.prepare_contexts(None, 'create', 'update', 'publish')
+
+        :param contexts
+        """
+
+        cls._validation_plans.prepare(contexts)
+
+    def _validate_property(self, errors, property_name, context):
+        """Validate a single property, adding its error (if any) to errors
+
+        :param errors
+        :param property_name
+        :param context
+        """
+
+        _, property_instance, error_key, required, validators = \
+            self._validation_plans.get(context).properties_by_name[property_name]
+
+        try:
+            property_instance.validate_with_plan(getattr(self, property_name), required, validators)
+        except InvalidPropertyError as e:
+            errors[error_key] = e.error
+
+    def _run_model_validators(self, errors, context, property_names=None):
+        """Run model validators, adding their errors (if any) to errors
+
+        :param errors
+        :param context
+        :param property_names: only run the model validators that changes to these properties may affect
+        """
+
+        plan = self._validation_plans.get(context)
+        only = plan.affected_model_validators(property_names) if property_names is not None else None
+
+        plan.run_model_validators(self, errors, self.model_validator_pool, only)
+
     def __iter__(self):
         """Allow dict casting"""
 
+        return iter(traversal.cast(self))
+
+    def to_dict(self, only=None, exclude=None):
+        """Cast the model to a dict, like dict(model), optionally keeping some fields only. Fields are dotted paths,
+        such as 'author.name' or 'revisions.*.changes' (see kelly.projections).
+
+        > blog_post.to_dict(only=['id', 'title', 'author.name'])
+
+        :param only: the fields to keep
+        :param exclude: the fields to leave out
+        """
+
+        if only is None and exclude is None:
+            return dict(self)
+
+        global projections
+        if projections is None:
+            import projections
+
+        return projections.to_dict(self, only, exclude)
+
+    def _cast_items(self):
+        """Cast the model itself - nested models are casted by kelly.traversal"""
+
         casted = []
 
         for property_name, property_instance in self._model_properties.iteritems():
             casted.append((property_name, property_instance.to_dict(getattr(self, property_name))))
 
-        return iter(casted)
+        if self.schema_version is not None:
+            casted.append((self.schema_version_key, self.schema_version))
+
+        return casted
 
     def __setattr__(self, name, value):
         """Some properties may choose to transform the value provided to them.
@@ -114,10 +363,98 @@ class Model(BaseModel):
         """
 
         if name in self._model_properties:
+            if self.__dict__.get('_frozen', False):
+                raise CannotSetPropertyError('Cannot set properties of frozen models')
             value = self._model_properties[name].process_value(value)
 
         return super(Model, self).__setattr__(name, value)
 
+    def __eq__(self, other):
+        """Models are equal if they are of the same class and all their property values are equal. Values are fetched
+        by a getter built once per class, then compared as tuples: comparison stops at the first difference, skips
+        identical values, and never serializes anything. As equal models must hash equally, only frozen models are
+        hashable (see __hash__).
+
+        :param other
+        """
+
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+
+        return self._model_values(self) == self._model_values(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        """Only frozen models are hashable: models are compared by value, so their hash is based on their (cached)
+        content, which must not change anymore. Unfrozen models raise a TypeError, like lists and dicts do.
+        """
+
+        if not self.__dict__.get('_frozen', False):
+            raise TypeError('Unfrozen models are unhashable, freeze() them first')
+
+        content_hash = self.__dict__.get('_content_hash')
+        if content_hash is None:
+            content_hash = self.content_hash()
+            object.__setattr__(self, '_content_hash', content_hash)
+
+        return content_hash
+
+    def content_hash(self):
+        """Compute a hash of the model content, consistent with model equality - nested lists and dicts included"""
+
+        return hash((type(self), tuple(_hashable(value) for value in self._model_values(self))))
+
+    def __reduce__(self):
+        """Compact pickling: property values are pickled positionally (no property names), along with the schema
+        fingerprint of the model class, so that unpickling with a changed model class fails instead of shifting values.
+        Unpickling skips __new__(), __init__(), defaults and process_value(); other instance attributes (e.g. set in
+        __init__()) are pickled as state, and restored as they are.
+        """
+
+        state = {name: value for name, value in self.__dict__.iteritems()
+                 if name not in self._model_properties and name not in _unpickled_attributes}
+
+        return _restore, (type(self), schema_fingerprint(type(self)),
+                          tuple(getattr(self, property_name) for property_name in self._model_property_names),
+                          self.frozen), state or None
+
+    def apply_patch(self, delta, context=None):
+        """Apply a delta built by kelly.changes.make_patch(). Only the changed properties (and model validators of the
+        models along the changed paths) are validated: if any of them is invalid, the model is left untouched and an
+        InvalidModelError is raised, keyed by path.
+
+        :param delta
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        global changes
+        if changes is None:
+            import changes
+
+        changes.apply_patch(self, delta, context)
+
+    def freeze(self):
+        """Prevent any further property change on the model and its nested models, and make the model hashable.
+        Lists and dicts held by a frozen model must not be mutated either.
+        """
+
+        for property_name in self._model_property_names:
+            _freeze(getattr(self, property_name))
+
+        object.__setattr__(self, '_frozen', True)
+
+        return self
+
+    @property
+    def frozen(self):
+        return self.__dict__.get('_frozen', False)
+
     @classmethod
     def from_dict(cls, dct):
         """Factory method to handle dict model data.
@@ -131,10 +468,93 @@ class Model(BaseModel):
         :type dct: dict
         """
 
+        return traversal.decode(cls, dct)
+
+    @classmethod
+    def _decode(cls, dct):
+        """Decode the model itself - nested models are decoded by kelly.traversal
+
+        :type dct: dict
+        """
+
+        if cls.schema_version is not None:
+            global migrations
+            if migrations is None:
+                import migrations  # Deferred, as only versioned models need it
+
+            return migrations.decode(cls, dct)
+
         casted = {}
 
         for property_name, property_instance in cls._model_properties.iteritems():
             if property_name in dct:
-                casted[property_name] = property_instance.from_dict(dct[property_name])
+                try:
+                    casted[property_name] = property_instance.from_dict(dct[property_name])
+                except (InvalidPropertyError, InvalidModelError) as e:  # e.g. unknown Union discriminator values
+                    error_key = property_instance.error_key or property_name
+                    raise InvalidModelError(errors={error_key: getattr(e, 'error', ERROR_INVALID)})
 
         return cls(**casted)
+
+    @classmethod
+    def from_rows(cls, rows_iterable, columns):
+        """Factory method to build many instances from tuple rows, e.g. DB-API cursor results or CSV readers. Columns
+        are mapped to properties once, and instances are yielded one at a time, so that large result sets can be
+        streamed. Values are not validated.
+
+        > cursor.execute('SELECT id, title, likes FROM blog_posts')
+        > for blog_post in BlogPost.from_rows(cursor, [column[0] for column in cursor.description]):
+        >     ...
+
+        :type cls: Model
+        :param rows_iterable: an iterable of tuples, following columns
+        :param columns: property names
+        """
+
+        global rows
+        if rows is None:
+            import rows
+
+        return rows.from_rows(cls, rows_iterable, columns)
+
+    def to_json(self):
+        """Encode the model to a JSON string, without going through dict(model)"""
+
+        global jsoncodec
+        if jsoncodec is None:
+            import jsoncodec
+
+        return jsoncodec.encode(self)
+
+    @classmethod
+    def from_json(cls, data):
+        """Factory method to handle JSON model data, without going through json.loads() and from_dict(). Property
+        types are checked while parsing, and invalid values raise an InvalidModelError right away. Other validators are
+        not run: call validate() on the instance.
+
+        > blog_post_json = blog_post.to_json()
+        > restored_blog_post = BlogPost.from_json(blog_post_json)
+
+        :type cls: Model
+        :param data: a JSON document (str or unicode)
+        """
+
+        global jsoncodec
+        if jsoncodec is None:
+            import jsoncodec
+
+        return jsoncodec.decode(data, cls)
+
+    @classmethod
+    def json_schema(cls):
+        """JSON Schema of the model JSON representation, built once per class (see kelly.schema). The schema is shared:
+        do not mutate it.
+
+        > is_valid = kelly.schema.compile_schema(BlogPost.json_schema())
+        """
+
+        global schema
+        if schema is None:
+            import schema
+
+        return schema.json_schema(cls)
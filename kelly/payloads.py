@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.payloads
+~~~~~~~~~~~~~~
+
+Validation of raw dict payloads against model property tables, without building any model instance.
+
+Model.validate_dict(dct) answers the same question as Model.from_dict(dct).validate(): missing values are replaced by
+defaults, values are coerced, and unknown keys are ignored. Nested models are walked by kelly.traversal, each nested
+dict being validated once. Model validators run against a read-only view of the dict, and only if there are any.
+
+Unlike from_dict(), which stops at the first value it cannot decode (e.g. an unknown Union discriminator), every
+property is reported.
+
+"""
+
+from types import FunctionType
+from errors import ERROR_INVALID, InvalidModelError, InvalidPropertyError, CannotSetPropertyError
+from properties import List, Dict, Object
+import traversal
+
+# Imported on first use only (see kelly.models)
+random = migrations = None
+
+_missing = object()
+
+
+def collect_errors(model_class, dct, context):
+    """Validate a dict against a model class - nested dicts are validated by kelly.traversal
+
+    :type model_class: Model
+    :type dct: dict
+    :param context
+    """
+
+    try:
+        get = _reader(model_class, dct)
+    except InvalidModelError as e:  # Unknown version
+        return e.errors
+
+    plan = model_class._validation_plans.get(context)
+    errors = {}
+    values = {}
+
+    for property_name, property_instance, error_key, required, validators in plan.properties:
+        value = get(property_name, _missing)
+        try:
+            values[property_name] = _check(property_instance, value, required, validators)
+        except InvalidPropertyError as e:
+            errors[error_key] = e.error
+            values[property_name] = property_instance.default if value is _missing else value
+
+    if plan.model_validators:
+        plan.run_model_validators(ModelView(model_class, values), errors, model_class.model_validator_pool)
+
+    return errors
+
+
+def _check(property_instance, value, required, validators):
+    """Validate a raw value - returns the value the model would hold (raw dicts standing for nested models)
+
+    :param property_instance
+    :param value: the raw value, or _missing
+    :param required
+    :param validators
+    """
+
+    if value is _missing:  # Defaults are regular values
+        value = property_instance.default
+        property_instance.validate_with_plan(value, required, validators)
+        return value
+
+    if value is None:
+        property_instance.validate_with_plan(value, required, validators)
+    elif isinstance(property_instance, Object) and isinstance(value, dict):
+        try:
+            model_class = property_instance.model_class(value)
+        except InvalidPropertyError:
+            raise InvalidPropertyError(ERROR_INVALID)
+        _check_nested_dict(model_class, value)
+        _run_validators(ModelView(model_class, resolve(model_class, value)), validators)
+    elif isinstance(property_instance, List) and property_instance.property is not None and isinstance(value, list):
+        _check_list(property_instance, value)
+        _run_validators(value, validators)
+    elif isinstance(property_instance, Dict) and (property_instance.mapping is not None or
+                                                  property_instance.values is not None) and isinstance(value, dict):
+        _check_mapping(property_instance, value)
+        _run_validators(value, validators)
+    else:
+        value = property_instance.from_dict(value)  # Coercion, if any
+        property_instance.validate_with_plan(value, required, validators)
+
+    return value
+
+
+def _check_nested_dict(model_class, dct):
+    valid = traversal.known_dict_validity(dct, model_class)
+
+    if valid is None:
+        valid = len(traversal.validate_dict(model_class, dct, None)) == 0
+
+    if not valid:
+        raise InvalidPropertyError(ERROR_INVALID)
+
+
+def _check_list(property_instance, value):
+    """Mirrors List._do_validate()"""
+
+    if property_instance.max_size is not None and len(value) > property_instance.max_size:
+        raise InvalidPropertyError(ERROR_INVALID)
+
+    if property_instance.sample_size is not None and len(value) > property_instance.sample_size:
+        global random
+        if random is None:
+            import random  # Deferred, as only sampled lists need it
+        value = random.sample(value, property_instance.sample_size)
+
+    item_property = property_instance.property
+    required, validators = item_property.validation_plan(None)
+
+    # Like List._do_validate(), item errors are reported as is (e.g. 'required' for None items)
+    for item in value:
+        _check(item_property, item, required, validators)
+
+
+def _check_mapping(property_instance, value):
+    """Mirrors Dict._do_validate()"""
+
+    if property_instance.max_size is not None and len(value) > property_instance.max_size:
+        raise InvalidPropertyError(ERROR_INVALID)
+
+    plan = property_instance.inner_plan()
+
+    if property_instance.mapping is not None:
+        provided_keys = value.viewkeys()
+        if not provided_keys <= plan.keys or not plan.required_keys <= provided_keys:
+            raise InvalidPropertyError(ERROR_INVALID)
+        entries = ((plan.properties[inner_key], inner_value) for inner_key, inner_value in value.iteritems())
+    else:
+        entries = (((property_instance.values,) + plan.values, inner_value) for inner_value in value.itervalues())
+
+    try:
+        for (inner_property, required, validators), inner_value in entries:
+            _check(inner_property, inner_value, required, validators)
+    except InvalidPropertyError:
+        raise InvalidPropertyError(ERROR_INVALID)
+
+
+def _reader(model_class, dct):
+    """Mirrors Model._decode(): values of legacy dicts of versioned models are read through their migrations, straight
+    from the dict (see kelly.migrations)"""
+
+    if model_class.schema_version is None:
+        return dct.get
+
+    global migrations
+    if migrations is None:
+        import migrations
+
+    return migrations.reader(model_class, dct)
+
+
+def _run_validators(value, validators):
+    try:
+        for validator in validators:
+            validator(value)
+    except AssertionError as e:
+        raise InvalidPropertyError(e.message)
+
+
+def resolve(model_class, dct):
+    """The values a model decoded from a dict would hold, without validating them (raw dicts standing for nested models)
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    values = {}
+
+    try:
+        get = _reader(model_class, dct)
+    except InvalidModelError:
+        get = dct.get  # Unknown version, reported by collect_errors()
+
+    for property_name, property_instance in model_class._model_properties.iteritems():
+        value = get(property_name, _missing)
+        if value is _missing:
+            values[property_name] = property_instance.default
+        elif isinstance(property_instance, (Object, List, Dict)):
+            values[property_name] = value
+        else:
+            values[property_name] = property_instance.from_dict(value)
+
+    return values
+
+
+class ModelView(object):
+    """Read-only stand-in for a model instance, given to model validators: property values are read from a dict, and
+    nested dicts are wrapped into views as well. Methods of the model class can be called."""
+
+    __slots__ = ('_model_class', '_values')
+
+    def __init__(self, model_class, values):
+        object.__setattr__(self, '_model_class', model_class)
+        object.__setattr__(self, '_values', values)
+
+    def __getattr__(self, name):
+        property_instance = self._model_class._model_properties.get(name)
+
+        if property_instance is None:
+            attribute = getattr(self._model_class, name)
+            if isinstance(attribute, property):
+                return attribute.fget(self)
+            if getattr(attribute, '__self__', None) is not None:  # e.g. class methods
+                return attribute
+            function = getattr(attribute, '__func__', attribute)
+            return function.__get__(self) if isinstance(function, FunctionType) else attribute
+
+        return _view(property_instance, self._values[name])
+
+    def __setattr__(self, name, value):
+        raise CannotSetPropertyError('Cannot set properties of model views')
+
+
+def _view(property_instance, value):
+    if isinstance(property_instance, Object) and isinstance(value, dict):
+        try:
+            model_class = property_instance.model_class(value)
+        except InvalidPropertyError:
+            return value
+        return ModelView(model_class, resolve(model_class, value))
+    elif isinstance(property_instance, List) and property_instance.property is not None and isinstance(value, list):
+        return [_view(property_instance.property, item) for item in value]
+
+    return value
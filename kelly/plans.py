@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.plans
+~~~~~~~~~~~
+
+Context-specialized validation plans.
+
+Which properties are required and which validators apply only depend on the validation context, so model classes work
+it out once per context and cache the result. The plan of the default context (None) is built along with the model
+class; it is kept forever, like plans for contexts passed to Model.prepare_contexts(), and looked up without any
+locking. Other contexts go through a bounded LRU cache, which only locks to build plans.
+
+Model validators are ordered once per plan as well: a validator declaring inputs runs after the model validators whose
+error keys it reads, and is skipped whenever one of its inputs is invalid. Otherwise, cheaper validators run first.
+
+"""
+
+import heapq
+from collections import OrderedDict
+from threading import Lock
+
+PLAN_CACHE_SIZE = 32
+
+
+class ValidationPlan(object):
+    """What validating a model class in a given context involves"""
+
+    __slots__ = ('context', 'properties', 'properties_by_name', 'model_validators', 'model_validator_steps')
+
+    def __init__(self, model_class, context):
+        """Class constructor
+
+        :type model_class: Model
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        self.context = context
+
+        # (property_name, property_instance, error_key, required, validators)
+        self.properties = tuple(
+            (property_name, property_instance,
+             property_instance.error_key if property_instance.error_key is not None else property_name) +
+            property_instance.validation_plan(context)
+            for property_name, property_instance in model_class._model_properties.iteritems())
+        self.properties_by_name = {entry[0]: entry for entry in self.properties}
+
+        # (model_validator, always, input error keys) - other validators only run if their error key is still free
+        self.model_validators = tuple(
+            (validator, validator.context is None or validator.context == context, input_keys)
+            for validator, input_keys in _order_model_validators(model_class, self.properties_by_name))
+
+        # The same, with independent concurrent validators grouped together (see run_model_validators)
+        self.model_validator_steps = _group_concurrent_validators(self.model_validators)
+
+    def affected_model_validators(self, property_names):
+        """The model validators that changes to some properties may affect: those reading any of them (directly, or
+        through other model validators), and those that do not declare their inputs
+
+        :param property_names
+        """
+
+        touched_keys = set(self.properties_by_name[property_name][2] for property_name in property_names)
+        affected = set()
+
+        for validator, _, input_keys in self.model_validators:  # Dependencies come first
+            if validator.inputs is None or not input_keys.isdisjoint(touched_keys):
+                affected.add(validator)
+                touched_keys.add(validator.error_key)
+
+        return affected
+
+    def run_model_validators(self, target, errors, pool=None, only=None):
+        """Run model validators against a model (or a view of a dict), adding their errors (if any) to errors
+
+        :param target
+        :param errors
+        :param pool: a thread pool (e.g. multiprocessing.pool.ThreadPool) for concurrent validators, if any
+        :param only: the model validators to run (e.g. as returned by affected_model_validators()), all by default
+        """
+
+        skipped_keys = set()  # Error keys of validators skipped for invalid inputs: their dependents are skipped too
+
+        if pool is None:
+            for entry in self.model_validators:
+                if (only is None or entry[0] in only) and _runs(entry, errors, skipped_keys):
+                    _apply(entry[0], _call(entry[0], target), errors)
+            return
+
+        for step in self.model_validator_steps:
+            entries = [entry for entry in step if (only is None or entry[0] in only) and
+                       _runs(entry, errors, skipped_keys)]
+            if len(entries) > 1:
+                results = pool.map(lambda validator: _call(validator, target), [entry[0] for entry in entries])
+            else:
+                results = [_call(entry[0], target) for entry in entries]
+            for entry, error in zip(entries, results):  # In order, so that results match sequential runs
+                _apply(entry[0], error, errors)
+
+
+def _runs(entry, errors, skipped_keys):
+    validator, always, input_keys = entry
+
+    if input_keys and not (input_keys.isdisjoint(errors) and input_keys.isdisjoint(skipped_keys)):
+        skipped_keys.add(validator.error_key)
+        return False
+
+    return always or validator.error_key not in errors
+
+
+def _call(validator, target):
+    try:
+        validator(target)
+    except AssertionError as e:
+        return e.message
+
+    return None
+
+
+def _apply(validator, error, errors):
+    if error is not None:
+        errors[validator.error_key] = error
+
+
+def _order_model_validators(model_class, properties_by_name):
+    """Order model validators: dependencies first, then cheapest first, then in their original order. Returns
+    (model_validator, input error keys) pairs.
+
+    :type model_class: Model
+    :param properties_by_name: validation plan entries, by property name
+    """
+
+    validators = model_class._model_validators
+    error_keys = set(validator.error_key for validator in validators)
+    input_keys = []
+
+    for validator in validators:
+        keys = set()
+        for input_name in validator.inputs or ():
+            if input_name in properties_by_name:
+                keys.add(properties_by_name[input_name][2])
+            elif input_name in error_keys:
+                keys.add(input_name)
+            else:
+                raise ValueError('Unknown input %r for model validator %r of %s' %
+                                 (input_name, validator.validator_function.__name__, model_class.__name__))
+        input_keys.append(frozenset(keys))
+
+    # A validator depends on those writing to its inputs, and on earlier ones sharing its error key
+    dependencies = [set() for _ in validators]
+    for index, validator in enumerate(validators):
+        for other_index, other_validator in enumerate(validators):
+            if other_index == index:
+                continue
+            elif other_validator.error_key in input_keys[index] and validator.error_key not in input_keys[index]:
+                dependencies[index].add(other_index)
+            elif other_validator.error_key == validator.error_key and other_index < index:
+                dependencies[index].add(other_index)
+
+    dependents = [set() for _ in validators]
+    for index, validator_dependencies in enumerate(dependencies):
+        for other_index in validator_dependencies:
+            dependents[other_index].add(index)
+
+    ready = [(validator.cost, index) for index, validator in enumerate(validators) if not dependencies[index]]
+    heapq.heapify(ready)
+    order = []
+
+    while ready:
+        _, index = heapq.heappop(ready)
+        order.append(index)
+        for dependent in dependents[index]:
+            dependencies[dependent].discard(index)
+            if not dependencies[dependent]:
+                heapq.heappush(ready, (validators[dependent].cost, dependent))
+
+    if len(order) < len(validators):
+        raise ValueError('Model validators of %s have circular inputs' % model_class.__name__)
+
+    return [(validators[index], input_keys[index]) for index in order]
+
+
+def _group_concurrent_validators(entries):
+    """Group consecutive concurrent validators that do not depend on each other - other validators are steps of their
+    own
+
+    :param entries: ordered model validator entries
+    """
+
+    steps = []
+
+    for entry in entries:
+        validator, _, input_keys = entry
+        step = steps[-1] if steps else None
+        if validator.concurrent and step is not None and step[0][0].concurrent and \
+                all(other[0].error_key not in input_keys and other[0].error_key != validator.error_key
+                    for other in step):
+            step.append(entry)
+        else:
+            steps.append([entry])
+
+    return tuple(tuple(step) for step in steps)
+
+
+class PlanCache(object):
+    """Per model class cache of validation plans - Dict properties keep their inner plans the same way"""
+
+    def __init__(self, owner, size=PLAN_CACHE_SIZE, build=ValidationPlan):
+        """Class constructor
+
+        :param owner: the model class (or property) that plans are built for
+        :param size: the maximum number of plans kept for contexts that were not prepared
+        :param build: a callable building the plan of the owner for a context
+        """
+
+        self.owner = owner
+        self.size = size
+        self.build = build
+        self._prepared = {None: build(owner, None)}  # The default context is always prepared
+        self._recent = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, context):
+        """Fetch (or build) the plan for a context
+
+        :param context
+        """
+
+        plan = self._prepared.get(context)
+        if plan is not None:
+            return plan
+
+        plan = self._recent.get(context)
+        if plan is not None:
+            if self._lock.acquire(False):  # Hits never wait: the LRU order is only updated if nobody holds the lock
+                try:
+                    if self._recent.pop(context, None) is not None:
+                        self._recent[context] = plan
+                finally:
+                    self._lock.release()
+            return plan
+
+        with self._lock:
+            plan = self._recent.pop(context, None)
+            if plan is None:
+                plan = self.build(self.owner, context)
+                if len(self._recent) >= self.size:
+                    self._recent.popitem(last=False)
+            self._recent[context] = plan
+
+        return plan
+
+    def prepare(self, contexts):
+        """Build plans for known contexts ahead of time, and keep them out of the LRU cache
+
+        :param contexts
+        """
+
+        with self._lock:
+            prepared = dict(self._prepared)
+            for context in contexts:
+                prepared[context] = self._recent.pop(context, None) or self.build(self.owner, context)
+
+            # Lookups never lock, so the prepared plans are swapped in one go rather than mutated
+            self._prepared = prepared
+
+    def __len__(self):
+        return len(self._prepared) + len(self._recent)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.projections
+~~~~~~~~~~~~~~~~~
+
+Field-subset serialization: dict casting of selected properties only.
+
+Fields are dotted paths: 'title', 'author.name', 'meta_data.reviewer', or 'revisions.*.changes' ('*' standing for every
+item of a list). Projections are compiled once per model class and field spec, then casting a model costs about one
+attribute read per selected field.
+
+> blog_post.to_dict(only=['id', 'title', 'author.name'])
+> blog_post.to_dict(exclude=['body', 'revisions.*.changes'])
+
+"""
+
+from threading import Lock
+from base import Model as BaseModel
+from properties import Property, List, Dict, Object
+
+PROJECTION_CACHE_SIZE = 256
+
+_absent = object()
+_lock = Lock()
+
+
+def to_dict(model_instance, only=None, exclude=None):
+    """Cast a model instance to a dict, keeping the fields listed in only (if any), but not those listed in exclude
+
+    :type model_instance: Model
+    :param only: dotted paths of the fields to keep
+    :param exclude: dotted paths of the fields to leave out
+    """
+
+    return project(model_instance, projection(type(model_instance), only, exclude))
+
+
+def projection(model_class, only=None, exclude=None):
+    """Fetch (or compile) the projection of a model class for a field spec - the cache is kept on the class
+
+    :type model_class: Model
+    :param only
+    :param exclude
+    """
+
+    key = (tuple(only) if only is not None else None, tuple(exclude) if exclude is not None else ())
+    projections = model_class.__dict__.get('_projections')
+
+    compiled = projections.get(key) if projections is not None else None
+    if compiled is not None:
+        return compiled
+
+    compiled = _compile_model(model_class, _tree(only) if only is not None else None, _tree(key[1]))
+
+    with _lock:
+        # Projections are swapped in rather than mutated, so that lookups never lock (see "Thread safety" in README)
+        projections = dict(model_class.__dict__.get('_projections') or {})
+        if len(projections) >= PROJECTION_CACHE_SIZE:  # Field specs may come from requests: keep the cache bounded
+            projections.clear()
+        projections[key] = compiled
+        model_class._projections = projections
+
+    return compiled
+
+
+def project(model_instance, compiled):
+    """Cast a model instance to a dict, following a compiled projection
+
+    :type model_instance: Model
+    :param compiled: a projection built by projection()
+    """
+
+    casted = {}
+
+    for property_name, plain, projector in compiled:
+        value = getattr(model_instance, property_name)
+        casted[property_name] = value if plain or value is None else projector(value)
+
+    return casted
+
+
+def _tree(paths):
+    """Turn dotted paths into nested dicts, None standing for whole values
+
+    :param paths
+    """
+
+    tree = {}
+
+    for path in paths:
+        node = tree
+        segments = path.split('.')
+        for index, segment in enumerate(segments):
+            if index == len(segments) - 1:
+                node[segment] = None
+            elif node.get(segment, {}) is None:  # The whole value is already selected
+                break
+            else:
+                node = node.setdefault(segment, {})
+
+    return tree
+
+
+def _compile_model(model_class, only, exclude):
+    """Compile the projection of a model class: a tuple of (property name, plain, projector)
+
+    :type model_class: Model
+    :param only: the tree of fields to keep, or None to keep all of them
+    :param exclude: the tree of fields to leave out
+    """
+
+    for property_name in list(only or ()) + list(exclude):
+        if property_name not in model_class._model_properties:
+            raise ValueError('Unknown field %r for %s' % (property_name, model_class.__name__))
+
+    compiled = []
+
+    for property_name in model_class._model_property_names:
+        if only is not None and property_name not in only:
+            continue
+
+        property_instance = model_class._model_properties[property_name]
+        only_fields = only[property_name] if only is not None else None
+        excluded_fields = exclude.get(property_name, _absent)
+
+        if excluded_fields is None:
+            continue
+        elif only_fields is None and excluded_fields is _absent:
+            plain = type(property_instance).to_dict.__func__ is Property.to_dict.__func__
+            compiled.append((property_name, plain, property_instance.to_dict))
+        else:
+            compiled.append((property_name, False, _compile_value(
+                property_instance, only_fields, excluded_fields if excluded_fields is not _absent else {})))
+
+    return tuple(compiled)
+
+
+def _compile_value(property_instance, only, exclude):
+    """Compile a projector for a property value that is only partly selected
+
+    :param property_instance
+    :param only: the tree of fields to keep, or None to keep all of them
+    :param exclude: the tree of fields to leave out
+    """
+
+    if only is None and len(exclude) == 0:  # e.g. 'tags.*'
+        return property_instance.to_dict
+    elif isinstance(property_instance, Object):
+        # Union properties hold models of different classes: each of them must have the selected fields, so that
+        # unknown fields are reported right away rather than when a value shows up
+        declared_classes = property_instance._model_class
+        compiled_by_class = {model_class: _compile_model(model_class, only, exclude) for model_class in
+                             (declared_classes if isinstance(declared_classes, tuple) else (declared_classes,))}
+
+        def project_model(value):
+            if not isinstance(value, BaseModel):
+                return value
+            compiled = compiled_by_class.get(type(value))
+            if compiled is None:  # e.g. subclasses of the declared model class
+                compiled = compiled_by_class[type(value)] = _compile_model(type(value), only, exclude)
+            return project(value, compiled)
+
+        return project_model
+
+    elif isinstance(property_instance, List) and property_instance.property is not None:
+        if set(only or ()) | set(exclude) != {'*'}:
+            raise ValueError('List items are selected with \'*\'')
+        if exclude.get('*', _absent) is None:
+            return lambda value: []
+        project_item = _compile_value(property_instance.property, only['*'] if only is not None else None,
+                                      exclude.get('*', {}))
+
+        return lambda value: [project_item(item) for item in value] if isinstance(value, list) else value
+
+    elif isinstance(property_instance, Dict):
+        projectors = {}
+        for inner_key in set(only or ()) | set(exclude):
+            if property_instance.mapping is not None and inner_key not in property_instance.mapping:
+                raise ValueError('Unknown dict key %r' % inner_key)
+            only_fields = only[inner_key] if only is not None and inner_key in only else None
+            excluded_fields = exclude.get(inner_key, _absent)
+            if only_fields is None and excluded_fields in (None, _absent):
+                continue
+            elif property_instance.inner_property(inner_key) is None:
+                raise ValueError('Cannot select fields of dict values without a mapping or a values property')
+            projectors[inner_key] = _compile_value(property_instance.inner_property(inner_key), only_fields,
+                                                   excluded_fields if excluded_fields is not _absent else {})
+
+        def project_dict(value):
+            if not isinstance(value, dict):
+                return value
+            casted = {}
+            for inner_key, inner_value in value.iteritems():
+                if (only is not None and inner_key not in only) or exclude.get(inner_key, _absent) is None:
+                    continue
+                projector = projectors.get(inner_key)
+                if projector is None:
+                    inner_property = property_instance.inner_property(inner_key)
+                    casted[inner_key] = inner_property.to_dict(inner_value) if inner_property is not None else \
+                        inner_value
+                else:
+                    casted[inner_key] = projector(inner_value) if inner_value is not None else None
+            return casted
+
+        return project_dict
+
+    raise ValueError('Cannot select fields of %s properties' % type(property_instance).__name__)
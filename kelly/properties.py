@@ -9,17 +9,25 @@ Property classes.
 """
 
 from datetime import datetime
-from errors import ERROR_INVALID, ERROR_REQUIRED, InvalidPropertyError
+from errors import ERROR_INVALID, ERROR_REQUIRED, ERROR_EXTRA, InvalidPropertyError
 from kelly.errors import CannotSetPropertyError, InvalidModelError
 from validators import regex
-from base import Model as BaseModel, Property as BaseProperty
+from coercion import parse_datetime, parse_integer, parse_boolean, normalize_uuid
+from base import Model as BaseModel, Property as BaseProperty, get_model_class
 from copy import copy
+from results import VALID, ValidationResult
+from plans import PlanCache
+import traversal
+
+random = None  # Imported on first use, as only sampled lists need it
+
+INTERN_TABLE_SIZE = 4096
 
 
 class Property(BaseProperty):
     """Base property class"""
 
-    def __init__(self, required=True, default_value=None, validators=None, error_key=None):
+    def __init__(self, required=True, default_value=None, validators=None, error_key=None, coerce=None):
         """Class constructor
 
         :param required: True, False, or a callable that takes a context as argument
@@ -27,12 +35,16 @@ class Property(BaseProperty):
         :param default_value
         :param validators
         :param error_key
+        :param coerce: a callable converting raw values in from_dict(), or True to use the built-in coercion of the
+                       property type (see coerce_value)
+        :type coerce: bool | callable
         """
 
         self.required = required
         self.default_value = default_value if callable(default_value) else copy(default_value)
-        self.validators = validators if validators is not None else []
+        self.validators = list(validators) if validators is not None else []  # Never alias the caller's list
         self.error_key = error_key
+        self.coerce = coerce
 
     def process_value(self, value):
         """Override this method in a child class to process values.
@@ -50,17 +62,52 @@ class Property(BaseProperty):
         :param context: an arbitrary validation context (any string will do)
         """
 
+        required, validators = self.validation_plan(context)
+        self.validate_with_plan(value, required, validators)
+
+    def check(self, value, context=None):
+        """Validate the property against the provided value without raising: returns a ValidationResult (see
+        kelly.results)
+
+        :param value
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        try:
+            self.validate(value, context)
+        except InvalidPropertyError as e:
+            return ValidationResult(e.errors, e.error)
+
+        return VALID
+
+    def validation_plan(self, context=None):
+        """Work out what validating in a given context involves: returns whether a value is required, and the
+        validators that apply. Model classes cache this per context (see kelly.plans).
+
+        :param context: an arbitrary validation context (any string will do)
+        """
+
         try:
             required = self.required(context)
         except TypeError:
             required = self.required
 
+        return required, tuple(v for v in self.validators if v.context is None or v.context == context)
+
+    def validate_with_plan(self, value, required, validators):
+        """Validate the property against the provided value, given the result of validation_plan()
+
+        :param value
+        :param required
+        :param validators
+        """
+
         try:
             if value is None and required:
                 assert value is not None, ERROR_REQUIRED
             elif value is not None:
                 self._do_validate(value)
-                for validator in filter(lambda v: v.context is None or v.context == context, self.validators):
+                for validator in validators:
                     validator(value)
         except AssertionError as e:
             raise InvalidPropertyError(e.message)
@@ -73,6 +120,15 @@ class Property(BaseProperty):
 
         raise NotImplementedError()
 
+    def _check_type(self, value):
+        """Cheap type-only check, used when validating a sample of the instances only (see kelly.sampling). Override
+        this method in child classes where _do_validate() does more than checking the type.
+
+        :param value
+        """
+
+        self._do_validate(value)
+
     def to_dict(self, value):
         """Prepare the value for a model dict representation
 
@@ -82,7 +138,19 @@ class Property(BaseProperty):
         return value
 
     def from_dict(self, value):
-        """Prepare the value from a model dict representation
+        """Prepare the value from a model dict representation, coercing it if needed
+
+        :param value
+        """
+
+        if self.coerce is None or self.coerce is False or value is None:
+            return value
+
+        return self.coerce_value(value) if self.coerce is True else self.coerce(value)
+
+    def coerce_value(self, value):
+        """Built-in coercion, used when coerce=True. Override this method in a child class to convert raw values: values
+        that cannot be converted should be returned as is, so that validation rejects them.
 
         :param value
         """
@@ -102,6 +170,50 @@ class Property(BaseProperty):
 class String(Property):
     """String property"""
 
+    def __init__(self, intern=None, **kwargs):
+        """Class constructor
+
+        :param intern: whether to canonicalise values to shared string objects. By default, values are interned only if
+                       a choices validator is provided, the choices themselves being the canonical objects. With
+                       intern=True, the first INTERN_TABLE_SIZE distinct values are shared, later ones are kept as is.
+        :type intern: bool | None
+        """
+
+        super(String, self).__init__(**kwargs)
+
+        self._interned_values = {}
+        for validator in self.validators:
+            if getattr(validator, 'name', None) == 'choices':
+                for allowed_choice in validator.argument:
+                    if isinstance(allowed_choice, basestring):
+                        self._interned_values.setdefault(allowed_choice, allowed_choice)
+
+        self.intern = intern if intern is not None else len(self._interned_values) > 0
+        self._intern_any_value = intern is True
+
+    def process_value(self, value):
+        """Swap the value for its canonical instance if interning is enabled
+
+        :param value
+        """
+
+        if not self.intern or not isinstance(value, basestring):
+            return value
+
+        if self._intern_any_value and len(self._interned_values) < INTERN_TABLE_SIZE:  # Values may come from requests
+            interned_value = self._interned_values.setdefault(value, value)
+        else:
+            interned_value = self._interned_values.get(value, value)
+
+        # u'foo' == 'foo', but we do not want to change the type of the value
+        return interned_value if type(interned_value) is type(value) else value
+
+    def coerce_value(self, value):
+        if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            return unicode(value)
+
+        return value
+
     def _do_validate(self, value):
         assert isinstance(value, basestring), ERROR_INVALID
 
@@ -109,6 +221,11 @@ class String(Property):
 class Integer(Property):
     """String property"""
 
+    def coerce_value(self, value):
+        coerced_value = parse_integer(value)
+
+        return coerced_value if coerced_value is not None else value
+
     def _do_validate(self, value):
         assert isinstance(value, int), ERROR_INVALID
 
@@ -130,6 +247,11 @@ class DateTime(Property):
 
         return value.replace(microsecond=0) if not self.include_microseconds else value
 
+    def coerce_value(self, value):
+        coerced_value = parse_datetime(value) if isinstance(value, basestring) else None
+
+        return coerced_value if coerced_value is not None else value
+
     def _do_validate(self, value):
         assert isinstance(value, datetime), ERROR_INVALID
 
@@ -137,8 +259,8 @@ class DateTime(Property):
 class Uuid(String):
     """UUID property"""
 
-    def __init__(self, required=True, default_value=None, validators=None):
-        super(Uuid, self).__init__(required, default_value, validators)
+    def __init__(self, required=True, default_value=None, validators=None, **kwargs):
+        super(Uuid, self).__init__(required=required, default_value=default_value, validators=validators, **kwargs)
 
         self.validators.append(regex(r'\A[0-9a-f-]{36}\Z'))
 
@@ -146,63 +268,277 @@ class Uuid(String):
     def default(self):
         return None if self.default_value is None else unicode(super(Uuid, self).default)
 
+    def coerce_value(self, value):
+        normalized_value = normalize_uuid(value)
+
+        return normalized_value if normalized_value is not None else value
+
+
+def _max_size(max_size, validators):
+    """Combine an explicit maximum size with the context-free max_length validators of a property
+
+    :param max_size
+    :param validators
+    """
+
+    max_sizes = [validator.argument for validator in validators
+                 if getattr(validator, 'name', None) == 'max_length' and validator.context is None]
+
+    if max_size is not None:
+        max_sizes.append(max_size)
+
+    return min(max_sizes) if len(max_sizes) > 0 else None
+
 
 class List(Property):
     """String property"""
 
-    def __init__(self, property=None, **kwargs):
+    def __init__(self, property=None, max_size=None, sample_size=None, **kwargs):
+        """Class constructor
+
+        :param property: the property that list items are validated against
+        :param max_size: the maximum number of items, checked before any item is validated (context-free max_length
+                         validators are taken into account as well)
+        :param sample_size: only validate a random sample of that many items - only use this for trusted sources
+        """
+
         super(List, self).__init__(**kwargs)
 
         self.property = property
+        self.max_size = _max_size(max_size, self.validators)
+        self.sample_size = sample_size
 
     def _do_validate(self, value):
         assert isinstance(value, list), ERROR_INVALID
+        assert self.max_size is None or len(value) <= self.max_size, ERROR_INVALID
 
         if self.property is not None:
+            if self.sample_size is not None and len(value) > self.sample_size:
+                global random
+                if random is None:
+                    import random  # Deferred, as only sampled lists need it
+                value = random.sample(value, self.sample_size)
+
             try:
                 for single_value in value:
                     self.property.validate(single_value)
             except AssertionError:
                 raise AssertionError(ERROR_INVALID)
 
+    def _check_type(self, value):
+        assert isinstance(value, list), ERROR_INVALID
+
+    def iter_validated(self, items, context=None, chunk_size=1000):
+        """Validate any iterable (e.g. a generator) of items chunk by chunk, without ever building the whole list.
+        Items are yielded once their chunk has been validated, and InvalidPropertyError is raised as soon as an invalid
+        chunk is found or max_size is exceeded. Validators of the list itself are not run.
+
+        :param items
+        :param context: an arbitrary validation context (any string will do)
+        :param chunk_size
+        """
+
+        chunk = []
+        item_count = 0
+
+        for item in items:
+            item_count += 1
+            if self.max_size is not None and item_count > self.max_size:
+                raise InvalidPropertyError(ERROR_INVALID)
+
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                self._validate_chunk(chunk, context)
+                for validated_item in chunk:
+                    yield validated_item
+                chunk = []
+
+        self._validate_chunk(chunk, context)
+        for validated_item in chunk:
+            yield validated_item
+
+    def _validate_chunk(self, chunk, context):
+        if self.property is None:
+            return
+
+        try:
+            for single_value in chunk:
+                self.property.validate(single_value, context)
+        except InvalidPropertyError:
+            raise InvalidPropertyError(ERROR_INVALID)
+
     def to_dict(self, value):
         if value is None or self.property is None:
             return value
 
-        return [dict(item) if isinstance(item, BaseModel) else item for item in value]
+        return [traversal.cast_model(item) if isinstance(item, BaseModel) else item for item in value]
 
     def from_dict(self, value):
-        if value is None or self.property is None:
+        if not isinstance(value, list) or self.property is None:
             return value
 
-        return [self.property.from_dict(item) if isinstance(item, dict) else item for item in value]
+        return [self.property.from_dict(item) for item in value]
 
 
 class Dict(Property):
     """Dict property"""
 
-    def __init__(self, mapping=None, **kwargs):
+    def __init__(self, mapping=None, values=None, max_size=None, **kwargs):
+        """Class constructor
+
+        :param mapping: a dict of properties that inner values are validated against
+        :param values: a property that every inner value is validated against, for dicts with arbitrary keys (e.g.
+                       Dict(values=Integer())) - cannot be combined with a mapping
+        :param max_size: the maximum number of keys, checked before any inner value is validated (context-free
+                         max_length validators are taken into account as well)
+        """
+
+        assert mapping is None or values is None, 'A Dict property takes either a mapping or a values property'
+
         super(Dict, self).__init__(**kwargs)
 
         self.mapping = mapping
+        self.values = values
+        self.max_size = _max_size(max_size, self.validators)
+        self._inner_plans = PlanCache(self, build=_InnerPlan)
+
+        # Whether inner values may hold models, to be casted by to_dict()
+        self._casts_values = traversal.can_nest(self)
+
+    def validate_with_plan(self, value, required, validators):
+        try:
+            super(Dict, self).validate_with_plan(value, required, validators)
+        except InvalidPropertyError as e:
+            if isinstance(value, dict) and (self.mapping is not None or self.values is not None):
+                e.errors = self.inner_errors(value) or None  # Only worked out once the fast path has failed
+            raise
 
     def _do_validate(self, value):
         assert isinstance(value, dict), ERROR_INVALID
+        assert self.max_size is None or len(value) <= self.max_size, ERROR_INVALID
 
         if self.mapping is not None:
+            plan = self.inner_plan()
+            provided_keys = value.viewkeys()
+            # Unknown and missing keys are rejected before any inner value is validated
+            assert provided_keys <= plan.keys and plan.required_keys <= provided_keys, ERROR_INVALID
+            try:
+                for inner_key, inner_value in value.iteritems():
+                    inner_property, required, validators = plan.properties[inner_key]
+                    inner_property.validate_with_plan(inner_value, required, validators)
+            except InvalidPropertyError:
+                raise AssertionError(ERROR_INVALID)
+        elif self.values is not None:
+            required, validators = self.inner_plan().values
+            validate_with_plan = self.values.validate_with_plan
             try:
-                for inner_key in self.mapping:
-                    inner_value = value.get(inner_key)
-                    self.mapping[inner_key].validate(inner_value)
-                for provided_key in value:
-                    assert provided_key in self.mapping, ERROR_INVALID
-            except (AssertionError, InvalidPropertyError):
+                for inner_value in value.itervalues():
+                    validate_with_plan(inner_value, required, validators)
+            except InvalidPropertyError:
                 raise AssertionError(ERROR_INVALID)
 
+    def _check_type(self, value):
+        assert isinstance(value, dict), ERROR_INVALID
+
+    def inner_errors(self, value, context=None):
+        """Validate inner values against the mapping or values property - returns the errors, by key (unknown keys
+        being reported as ERROR_EXTRA)
+
+        :param value: a dict
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        plan = self.inner_plan(context)
+        errors = {}
+
+        if self.mapping is not None:
+            provided_keys = value.viewkeys()
+            for inner_key in provided_keys - plan.keys:
+                errors[inner_key] = ERROR_EXTRA
+            for inner_key in plan.required_keys - provided_keys:
+                errors[inner_key] = ERROR_REQUIRED
+            for inner_key in provided_keys & plan.keys:
+                inner_property, required, validators = plan.properties[inner_key]
+                try:
+                    inner_property.validate_with_plan(value[inner_key], required, validators)
+                except InvalidPropertyError as e:
+                    errors[inner_key] = e.error
+        elif self.values is not None:
+            required, validators = plan.values
+            for inner_key, inner_value in value.iteritems():
+                try:
+                    self.values.validate_with_plan(inner_value, required, validators)
+                except InvalidPropertyError as e:
+                    errors[inner_key] = e.error
+
+        return errors
+
+    def inner_plan(self, context=None):
+        """Key-indexed validation plan of inner values, built once per context and cached like model validation
+        plans (see kelly.plans)
+
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        return self._inner_plans.get(context)
+
+    def inner_property(self, inner_key):
+        """The property that the value of a given key is validated against, if any
+
+        :param inner_key
+        """
+
+        return self.mapping.get(inner_key) if self.mapping is not None else self.values
+
+    def to_dict(self, value):
+        if not self._casts_values or not isinstance(value, dict):
+            return value
+        elif self.mapping is not None:
+            return {inner_key: self.mapping[inner_key].to_dict(inner_value) if inner_key in self.mapping else
+                    inner_value for inner_key, inner_value in value.iteritems()}
+
+        return {inner_key: self.values.to_dict(inner_value) for inner_key, inner_value in value.iteritems()}
+
+    def from_dict(self, value):
+        value = super(Dict, self).from_dict(value)
+
+        if not isinstance(value, dict):
+            return value
+        elif self.mapping is not None:
+            return {inner_key: self.mapping[inner_key].from_dict(inner_value) if inner_key in self.mapping else
+                    inner_value for inner_key, inner_value in value.iteritems()}
+        elif self.values is not None:
+            return {inner_key: self.values.from_dict(inner_value) for inner_key, inner_value in value.iteritems()}
+
+        return value
+
+
+class _InnerPlan(object):
+    """What validating the inner values of a Dict property in a given context involves"""
+
+    __slots__ = ('keys', 'required_keys', 'properties', 'values')
+
+    def __init__(self, dict_property, context):
+        mapping = dict_property.mapping or {}
+
+        # inner_key: (inner_property, required, validators)
+        self.properties = {inner_key: (inner_property,) + inner_property.validation_plan(context)
+                           for inner_key, inner_property in mapping.iteritems()}
+        self.keys = frozenset(mapping)
+        self.required_keys = frozenset(inner_key for inner_key, entry in self.properties.iteritems() if entry[1])
+
+        # (required, validators) of the values property
+        self.values = dict_property.values.validation_plan(context) if dict_property.values is not None else None
+
 
 class Boolean(Property):
     """Boolean property"""
 
+    def coerce_value(self, value):
+        coerced_value = parse_boolean(value)
+
+        return coerced_value if coerced_value is not None else value
+
     def _do_validate(self, value):
         assert value in [True, False], ERROR_INVALID
 
@@ -211,30 +547,70 @@ class Object(Property):
     """Object property"""
 
     def __init__(self, model_class, **kwargs):
+        """Class constructor
+
+        :param model_class: a model class, or its name for models that are not defined yet (e.g. Object('Comment') in
+            the Comment class itself)
+        """
+
         super(Object, self).__init__(**kwargs)
 
         self._model_class = model_class
+        self._declaring_module = None  # Set by the model metaclass, for names to be looked up there first
+
+    @property
+    def _model_class(self):
+        """The model class, looked up by name the first time it is needed if necessary"""
+
+        if self._resolved_model_class is None:
+            self._resolved_model_class = get_model_class(self._model_class_reference, self._declaring_module)
+
+        return self._resolved_model_class
+
+    @_model_class.setter
+    def _model_class(self, model_class):
+        self._model_class_reference = model_class
+        self._resolved_model_class = None if isinstance(model_class, basestring) else model_class
 
     def _do_validate(self, value):
         assert isinstance(value, self._model_class), ERROR_INVALID
 
         if isinstance(value, BaseModel):
+            self._validate_model(value)
+
+    def _check_type(self, value):
+        assert isinstance(value, self._model_class), ERROR_INVALID
+
+    def _validate_model(self, value):
+        """Nested models validated by the current traversal (see kelly.traversal) are not validated twice
+
+        :param value
+        """
+
+        valid = traversal.known_validity(value)
+
+        if valid is None:
             try:
                 value.validate()
             except InvalidModelError:
                 raise AssertionError(ERROR_INVALID)
+        elif not valid:
+            raise AssertionError(ERROR_INVALID)
 
     def to_dict(self, value):
         if value is None:
             return None
 
-        return dict(value)
+        return traversal.cast_model(value)
 
     def from_dict(self, value):
-        if value is None:
-            return None
+        if not isinstance(value, dict):  # None, or already a model instance
+            return value
+
+        model_class = self.model_class(value)
+        model_instance = traversal.decoded_model(value, model_class)
 
-        return self.model_class(value).from_dict(value)
+        return model_instance if model_instance is not None else model_class.from_dict(value)
 
     def model_class(self, value):
         """Override in child classes if you need something more flexible, such as a model class that varies depending
@@ -246,6 +622,43 @@ class Object(Property):
         return self._model_class
 
 
+class Union(Object):
+    """Discriminated union property: the model class is picked from a mapping, depending on the value of a discriminator
+    key. Typically, each model class has a Constant property for the discriminator.
+
+    > events = List(property=Union('type', {'click': ClickEvent, 'scroll': ScrollEvent}))
+    """
+
+    def __init__(self, discriminator, mapping, **kwargs):
+        """Class constructor
+
+        :param discriminator: the name of the key (or property) holding the discriminator value
+        :param mapping: a dict of discriminator values to model classes
+        """
+
+        super(Union, self).__init__(model_class=tuple(mapping.values()), **kwargs)
+
+        self.discriminator = discriminator
+        self.mapping = dict(mapping)
+        self._discriminator_values = {model_class: value for value, model_class in self.mapping.iteritems()}
+
+    def _do_validate(self, value):
+        # Exact classes are found in O(1), subclasses are still accepted
+        assert type(value) in self._discriminator_values or isinstance(value, self._model_class), ERROR_INVALID
+        self._validate_model(value)
+
+    def model_class(self, value):
+        """Unknown discriminator values are rejected right away
+
+        :param value
+        """
+
+        try:
+            return self.mapping[value.get(self.discriminator)]
+        except (KeyError, TypeError):
+            raise InvalidPropertyError(ERROR_INVALID)
+
+
 class Constant(Property):
     """Constant property"""
 
@@ -263,7 +676,8 @@ class Constant(Property):
         if value != self.value:
             raise CannotSetPropertyError('Cannot set value of Constant properties')
 
-        return value
+        # Share the constant itself rather than keeping an equal copy on every instance
+        return self.value if type(value) is type(self.value) else value
 
     @property
     def default(self):
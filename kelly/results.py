@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.results
+~~~~~~~~~~~~~
+
+Validation results, for code that validates in bulk and would rather not catch one exception per invalid value.
+
+Model.check(), Model.check_dict() and Property.check() return a ValidationResult rather than raising; valid values all
+share the VALID result, so that nothing is allocated for them. A ValidationSummary counts errors by field and code over
+a batch, keeping a few samples only.
+
+> summary = ValidationSummary()
+> for line_number, row in enumerate(rows):
+>     summary.add(Order.check_dict(row), label=line_number)
+> print(summary.most_common(10))
+
+"""
+
+from collections import Counter
+
+
+class ValidationResult(object):
+    """Outcome of a validation: true if valid"""
+
+    __slots__ = ('errors', 'error')
+
+    def __init__(self, errors=None, error=None):
+        """Class constructor
+
+        :param errors: errors by key (by error key for models, by inner key for Dict properties)
+        :param error: the error of a property value, if any
+        """
+
+        self.errors = errors if errors is not None else {}
+        self.error = error
+
+    @property
+    def valid(self):
+        return self.error is None and len(self.errors) == 0
+
+    def __nonzero__(self):
+        return self.valid
+
+    def __eq__(self, other):
+        return isinstance(other, ValidationResult) and (self.errors, self.error) == (other.errors, other.error)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        if self.valid:
+            return '<ValidationResult valid>'
+
+        return '<ValidationResult %r>' % (self.errors if self.error is None else self.error)
+
+
+VALID = ValidationResult()
+
+
+class ValidationSummary(object):
+    """Error counts over a batch of validation results - results themselves are not kept"""
+
+    def __init__(self, sample_size=10):
+        """Class constructor
+
+        :param sample_size: the number of invalid results to keep as samples (with their labels)
+        """
+
+        self.sample_size = sample_size
+        self.total = 0
+        self.invalid = 0
+        self.counts = Counter()  # (field, code): count
+        self.samples = []  # (label, errors)
+
+    def add(self, result, label=None):
+        """Count a result
+
+        :type result: ValidationResult
+        :param label: what the result is about (e.g. a line number), kept along with samples
+        """
+
+        self.total += 1
+
+        if result.valid:
+            return
+
+        self.invalid += 1
+        errors = result.errors if result.error is None else {None: result.error}
+        for field, code in errors.iteritems():
+            self.counts[(field, code)] += 1
+
+        if len(self.samples) < self.sample_size:
+            self.samples.append((label, dict(errors)))
+
+    def update(self, results):
+        """Count results from any iterable
+
+        :param results
+        """
+
+        for result in results:
+            self.add(result)
+
+        return self
+
+    def merge(self, other):
+        """Add the counts of another summary, e.g. one built by another worker
+
+        :type other: ValidationSummary
+        """
+
+        self.total += other.total
+        self.invalid += other.invalid
+        self.counts.update(other.counts)
+        self.samples.extend(other.samples[:max(self.sample_size - len(self.samples), 0)])
+
+        return self
+
+    @property
+    def valid(self):
+        return self.total - self.invalid
+
+    def by_field(self):
+        """Error counts by field"""
+
+        return self._group(0)
+
+    def by_code(self):
+        """Error counts by code (e.g. ERROR_REQUIRED)"""
+
+        return self._group(1)
+
+    def most_common(self, count=None):
+        """The most frequent ((field, code), count) pairs
+
+        :param count
+        """
+
+        return self.counts.most_common(count)
+
+    def as_dict(self):
+        """A plain summary, for reports"""
+
+        return {'total': self.total, 'valid': self.valid, 'invalid': self.invalid, 'by_field': self.by_field(),
+                'by_code': self.by_code(), 'samples': list(self.samples)}
+
+    def _group(self, index):
+        grouped = Counter()
+
+        for key, count in self.counts.iteritems():
+            grouped[key[index]] += count
+
+        return dict(grouped)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.rows
+~~~~~~~~~~
+
+Bulk construction of model instances from tuple rows (DB-API cursors, CSV readers...).
+
+Columns are mapped to properties once, up front. Rows are then copied straight into instance dicts: no kwargs dict, no
+setattr() per property and no check for extra keys per row. process_value() is only called for properties that
+actually transform values (e.g. interned strings, DateTime without microseconds).
+
+"""
+
+from itertools import izip
+from errors import ERROR_EXTRA, InvalidModelError
+from base import Model as BaseModel
+from properties import Property, String
+
+
+def from_rows(model_class, rows, columns):
+    """Build model instances from rows, lazily: rows can be any iterable, including a generator or a DB-API cursor.
+
+    :type model_class: Model
+    :param rows: an iterable of tuples (or any sequence), following columns
+    :param columns: property names
+    """
+
+    columns = tuple(columns)
+    model_properties = model_class._model_properties
+
+    extra_columns = [column for column in columns if column not in model_properties]
+    if len(extra_columns) > 0:
+        raise InvalidModelError(errors={extra_column: ERROR_EXTRA for extra_column in extra_columns})
+    if len(set(columns)) != len(columns):
+        raise ValueError('Duplicate columns')
+
+    processors = tuple((column, model_properties[column].process_value) for column in columns
+                       if _processes_values(model_properties[column]))
+    defaults = tuple((property_name, property_instance)
+                     for property_name, property_instance in model_properties.iteritems()
+                     if property_name not in columns)
+
+    return _iter_instances(model_class, rows, columns, processors, defaults)
+
+
+def _processes_values(property_instance):
+    if isinstance(property_instance, String) and not property_instance.intern:
+        return False  # String.process_value() only interns values
+
+    return type(property_instance).process_value.__func__ is not Property.process_value.__func__
+
+
+def _has_custom_init(model_class):
+    """Whether a model class overrides __init__(), which then has to be called with a kwargs dict for every row"""
+
+    return model_class.__init__.__func__ is not BaseModel.__init__.__func__
+
+
+def _iter_instances(model_class, rows, columns, processors, defaults):
+    column_count = len(columns)
+    custom_init = _has_custom_init(model_class)
+
+    for row in rows:
+        if len(row) != column_count:
+            raise ValueError('Expected %d values per row, got %d' % (column_count, len(row)))
+
+        model_instance = BaseModel.__new__(model_class)
+        values = model_instance.__dict__
+        values.update(izip(columns, row))
+
+        for property_name, process_value in processors:
+            values[property_name] = process_value(values[property_name])
+        for property_name, property_instance in defaults:
+            values[property_name] = property_instance.process_value(property_instance.default)
+
+        if custom_init:
+            model_instance.__init__(**dict(izip(columns, row)))
+
+        yield model_instance
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.sampling
+~~~~~~~~~~~~~~
+
+Sampling validation, for high-volume streams from trusted producers.
+
+A fraction of the instances is fully validated (Model.validate()); the others only go through cheap type checks: no
+validators, no model validators, and nested models, lists and dicts are not looked into. Whenever the error rate of the
+fully validated instances, over a sliding window, goes above a threshold, every instance is fully validated until it
+goes back down.
+
+> policy = SamplingPolicy(rate=0.05)
+> for event in events:
+>     policy.validate(event)
+> log(policy.counters)
+
+"""
+
+import random
+from collections import deque
+from threading import Lock
+from errors import ERROR_INVALID, ERROR_REQUIRED, InvalidModelError
+
+MODE_FULL = 'full'
+MODE_TYPES = 'types'
+
+
+class SamplingPolicy(object):
+    """Validation policy - instances can be shared across threads"""
+
+    def __init__(self, rate=0.01, window=1000, error_threshold=0.01, seed=None):
+        """Class constructor
+
+        :param rate: the fraction of instances that are fully validated
+        :param window: the number of fully validated instances the error rate is computed on
+        :param error_threshold: the error rate above which every instance is fully validated
+        :param seed: seed of the random generator picking instances, for reproducible runs
+        """
+
+        assert 0 <= rate <= 1 and 0 <= error_threshold <= 1 and window > 0
+
+        self.rate = rate
+        self.error_threshold = error_threshold
+        self.escalated = False
+        self.counters = {'full': 0, 'full_errors': 0, 'types': 0, 'types_errors': 0, 'escalations': 0}
+
+        self._random = random.Random(seed)
+        self._window = deque(maxlen=window)
+        self._window_errors = 0
+        self._lock = Lock()
+
+    def validate(self, model_instance, context=None):
+        """Fully validate the instance, or only check property types, depending on the policy. Raises an
+        InvalidModelError just like Model.validate(). Returns the mode that was used (MODE_FULL or MODE_TYPES).
+
+        :type model_instance: Model
+        :param context: an arbitrary validation context (any string will do)
+        """
+
+        if self.escalated or self._random.random() < self.rate:
+            try:
+                model_instance.validate(context)
+            except InvalidModelError:
+                self._record(MODE_FULL, False)
+                raise
+            self._record(MODE_FULL, True)
+            return MODE_FULL
+
+        errors = check_types(model_instance, context)
+        self._record(MODE_TYPES, len(errors) == 0)
+        if len(errors) > 0:
+            raise InvalidModelError(errors)
+
+        return MODE_TYPES
+
+    @property
+    def error_rate(self):
+        """The error rate of the fully validated instances in the sliding window"""
+
+        return float(self._window_errors) / len(self._window) if len(self._window) > 0 else 0.0
+
+    def _record(self, mode, valid):
+        with self._lock:
+            self.counters[mode] += 1
+            if not valid:
+                self.counters[mode + '_errors'] += 1
+
+            if mode == MODE_FULL:
+                if len(self._window) == self._window.maxlen:
+                    self._window_errors -= self._window[0]
+                self._window.append(0 if valid else 1)
+                self._window_errors += 0 if valid else 1
+
+                escalated = self.error_rate > self.error_threshold
+                if escalated and not self.escalated:
+                    self.counters['escalations'] += 1
+                self.escalated = escalated
+
+
+def check_types(model_instance, context=None):
+    """Cheap type-only checks: required values and property types - returns the errors
+
+    :type model_instance: Model
+    :param context: an arbitrary validation context (any string will do)
+    """
+
+    errors = {}
+
+    for property_name, property_instance, error_key, required, _ in \
+            model_instance._validation_plans.get(context).properties:
+        value = getattr(model_instance, property_name)
+        if value is None:
+            if required:
+                errors[error_key] = ERROR_REQUIRED
+        else:
+            try:
+                property_instance._check_type(value)
+            except AssertionError:
+                errors[error_key] = ERROR_INVALID
+
+    return errors
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.schema
+~~~~~~~~~~~~
+
+JSON Schema (draft 4) export of model classes, and a compiled validator for the schemas it produces.
+
+Schemas describe the JSON representation of models (as produced by Model.to_json()), and are generated from the model
+property tables and the context-free min_length, max_length, regex and choices validators. Nested models are written
+once in "definitions" and referenced, so self-referencing models are supported.
+
+The schema accepts a payload if and only if Model.from_json() followed by validate() does, except for what JSON Schema
+cannot express:
+
+* model validators and custom property validators are left out, so the schema may accept invalid payloads;
+* sampled lists (List(sample_size=...)) are fully checked by the schema;
+* the schema is stricter on types: booleans are not integers, and numbers are not booleans;
+* DateTime values are checked against the ISO 8601 format, but not against the calendar.
+
+> schema = BlogPost.json_schema()
+> is_valid = compile_schema(schema)
+> if not is_valid(json.loads(payload)):
+>     reject(payload)
+
+"""
+
+import re
+import sys
+from properties import String, Integer, Boolean, DateTime, List, Dict, Object, Union, Constant
+
+SCHEMA_URI = 'http://json-schema.org/draft-04/schema#'
+
+# ECMA 262 equivalent of kelly.coercion.DATETIME (minus the calendar checks done by parse_datetime)
+DATETIME_PATTERN = r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$'
+
+
+def json_schema(model_class):
+    """Build (and cache on the class) the JSON Schema of a model class. The schema is shared: do not mutate it.
+
+    :type model_class: Model
+    """
+
+    schema = model_class.__dict__.get('_json_schema')
+
+    if schema is None:
+        schema = _SchemaBuilder(model_class).build()
+        model_class._json_schema = schema
+
+    return schema
+
+
+class _SchemaBuilder(object):
+    """Collects the definitions of all the model classes reachable from a root model class"""
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.names = {model_class: None}  # The root model is referenced as '#'
+        self.pending = []
+
+    def build(self):
+        schema = {'$schema': SCHEMA_URI}
+        schema.update(self.model_schema(self.model_class))
+
+        definitions = {}
+        while self.pending:
+            model_class = self.pending.pop()
+            definitions[self.names[model_class]] = self.model_schema(model_class)
+        if definitions:
+            schema['definitions'] = definitions
+
+        return schema
+
+    def reference(self, model_class):
+        if model_class not in self.names:
+            name = model_class.__name__
+            if name in self.names.values():  # Two model classes with the same name
+                name = '%s.%s' % (model_class.__module__, name)
+            self.names[model_class] = name
+            self.pending.append(model_class)
+
+        name = self.names[model_class]
+
+        return {'$ref': '#/definitions/%s' % name if name is not None else '#'}
+
+    def model_schema(self, model_class):
+        schema = self.mapping_schema(model_class._model_properties, defaults=True)
+
+        # Documents of versioned models carry their version: the schema describes current documents only
+        if model_class.schema_version is not None:
+            schema['properties'][model_class.schema_version_key] = {'enum': [model_class.schema_version]}
+            schema['required'] = sorted(schema.get('required', []) + [model_class.schema_version_key])
+
+        return schema
+
+    def mapping_schema(self, mapping, defaults=False):
+        schema = {'type': 'object', 'properties': {}, 'additionalProperties': False}
+        required_names = []
+
+        for property_name in sorted(mapping):
+            property_instance = mapping[property_name]
+            required, validators = property_instance.validation_plan(None)
+            schema['properties'][property_name] = self.property_schema(property_instance, required, validators)
+
+            # Missing model values are replaced by defaults: only values without any default have to be provided
+            if required and (not defaults or property_instance.default_value is None):
+                required_names.append(property_name)
+
+        if required_names:
+            schema['required'] = required_names
+
+        return schema
+
+    def property_schema(self, property_instance, required, validators):
+        if isinstance(property_instance, Constant):
+            return {'enum': [property_instance.value]}  # Constants cannot be set to null
+        elif isinstance(property_instance, Union):
+            schema = {'oneOf': [self.reference(property_instance.mapping[value])
+                                for value in sorted(property_instance.mapping)]}
+        elif isinstance(property_instance, Object):
+            schema = self.reference(property_instance._model_class)
+        elif isinstance(property_instance, String):
+            schema = {'type': 'string'}
+        elif isinstance(property_instance, Boolean):
+            schema = {'type': 'boolean'}
+        elif isinstance(property_instance, Integer):
+            schema = {'type': 'integer', 'minimum': -sys.maxint - 1, 'maximum': sys.maxint}  # ints, not longs
+        elif isinstance(property_instance, DateTime):
+            schema = {'type': 'string', 'format': 'date-time', 'pattern': DATETIME_PATTERN}
+        elif isinstance(property_instance, List):
+            schema = {'type': 'array'}
+            if property_instance.property is not None:
+                schema['items'] = self.property_schema(property_instance.property,
+                                                       *property_instance.property.validation_plan(None))
+            if property_instance.max_size is not None:
+                schema['maxItems'] = property_instance.max_size
+        elif isinstance(property_instance, Dict):
+            if property_instance.mapping is not None:
+                schema = self.mapping_schema(property_instance.mapping)
+            elif property_instance.values is not None:
+                schema = {'type': 'object', 'additionalProperties': self.property_schema(
+                    property_instance.values, *property_instance.values.validation_plan(None))}
+            else:
+                schema = {'type': 'object'}
+            if property_instance.max_size is not None:
+                schema['maxProperties'] = property_instance.max_size
+        else:
+            schema = {}
+
+        _add_validators(schema, validators)
+
+        return _nullable(schema) if not required else schema
+
+
+_length_keywords = {'string': ('minLength', 'maxLength'), 'array': ('minItems', 'maxItems'),
+                    'object': ('minProperties', 'maxProperties')}
+
+
+def _add_validators(schema, validators):
+    """Translate the validators JSON Schema can express
+
+    :param schema
+    :param validators
+    """
+
+    min_keyword, max_keyword = _length_keywords.get(schema.get('type'), (None, None))
+
+    for validator in validators:
+        name = getattr(validator, 'name', None)
+        if name == 'choices':
+            schema['enum'] = list(validator.argument)
+        elif name == 'min_length' and min_keyword is not None:
+            schema[min_keyword] = max(schema.get(min_keyword, 0), validator.argument)
+        elif name == 'max_length' and max_keyword is not None:
+            schema[max_keyword] = min(schema.get(max_keyword, validator.argument), validator.argument)
+        elif name == 'regex' and schema.get('type') == 'string':
+            schema.setdefault('allOf', []).append({'pattern': _ecma_pattern(validator.argument)})
+
+    # A single pattern does not need allOf
+    if len(schema.get('allOf', ())) == 1:
+        schema['pattern'] = schema.pop('allOf')[0]['pattern']
+
+
+def _ecma_pattern(pattern):
+    """Convert a Python regex (matched with re.match, so anchored at the start) to an ECMA 262 pattern. Unlike '$' in
+    ECMA 262, '$' in Python also matches before a trailing newline.
+
+    :param pattern
+    """
+
+    if pattern.startswith(r'\A'):
+        pattern = pattern[2:]
+    elif pattern.startswith('^'):
+        pattern = pattern[1:]
+
+    return '^(?:%s)' % _replace_anchors(pattern, {'$': r'(?=\n?$)', r'\Z': '$'})
+
+
+def _python_pattern(pattern):
+    """Convert an ECMA 262 pattern to a Python regex (matched with re.search)
+
+    :param pattern
+    """
+
+    return _replace_anchors(pattern, {'$': r'\Z'})
+
+
+def _replace_anchors(pattern, replacements):
+    """Replace end anchors ('$' or '\\Z') found outside character classes
+
+    :param pattern
+    :param replacements: a dict of anchors to their replacement
+    """
+
+    parts = []
+    index = 0
+    in_class = False
+
+    while index < len(pattern):
+        token = pattern[index:index + 2] if pattern[index] == '\\' else pattern[index]
+        index += len(token)
+        if in_class:
+            in_class = token != ']'
+        elif token == '[':
+            in_class = True
+            for literal_prefix in ('^]', ']', '^'):  # A ']' right after the opening bracket is a literal
+                if pattern.startswith(literal_prefix, index):
+                    token += literal_prefix
+                    index += len(literal_prefix)
+                    break
+        else:
+            token = replacements.get(token, token)
+        parts.append(token)
+
+    return ''.join(parts)
+
+
+def _nullable(schema):
+    """Allow null on top of what a schema accepts
+
+    :param schema
+    """
+
+    if not schema:
+        return schema
+    elif 'type' in schema:
+        schema['type'] = [schema['type'], 'null']
+        if 'enum' in schema:
+            schema['enum'].append(None)
+        return schema
+
+    return {'anyOf': [schema, {'type': 'null'}]}
+
+
+_types = {
+    'null': lambda value: value is None,
+    'boolean': lambda value: isinstance(value, bool),
+    'integer': lambda value: isinstance(value, (int, long)) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, long, float)) and not isinstance(value, bool),
+    'string': lambda value: isinstance(value, basestring),
+    'array': lambda value: isinstance(value, list),
+    'object': lambda value: isinstance(value, dict),
+}
+
+
+def compile_schema(schema):
+    """Compile a schema produced by json_schema() into a function that checks decoded JSON documents (as returned by
+    json.loads()) and returns True or False. Only the keywords used by json_schema() are supported.
+
+    :param schema
+    """
+
+    compiler = _Compiler(schema)
+
+    return compiler.compile(schema)
+
+
+class _Compiler(object):
+    def __init__(self, root_schema):
+        self.root_schema = root_schema
+        self.compiled_references = {}
+
+    def compile(self, schema):
+        checks = []
+
+        if '$ref' in schema:
+            return self.reference(schema['$ref'])
+        if 'type' in schema:
+            types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+            type_checks = tuple(_types[type_name] for type_name in types)
+            checks.append(lambda value: any(type_check(value) for type_check in type_checks))
+        if 'enum' in schema:
+            checks.append(_enum_check(schema['enum']))
+        if 'pattern' in schema:
+            checks.append(_string_check(re.compile(_python_pattern(schema['pattern'])).search))
+        for sub_schema in schema.get('allOf', ()):
+            checks.append(self.compile(sub_schema))
+        if 'anyOf' in schema:
+            any_checks = tuple(self.compile(sub_schema) for sub_schema in schema['anyOf'])
+            checks.append(lambda value: any(any_check(value) for any_check in any_checks))
+        if 'oneOf' in schema:
+            one_checks = tuple(self.compile(sub_schema) for sub_schema in schema['oneOf'])
+            checks.append(lambda value: sum(1 for one_check in one_checks if one_check(value)) == 1)
+        if 'minimum' in schema:
+            checks.append(_number_check(lambda number, minimum=schema['minimum']: number >= minimum))
+        if 'maximum' in schema:
+            checks.append(_number_check(lambda number, maximum=schema['maximum']: number <= maximum))
+        for keyword, value_type, size_check in _size_keywords:
+            if keyword in schema:
+                checks.append(_size_check(value_type, size_check, schema[keyword]))
+        if 'items' in schema:
+            checks.append(_items_check(self.compile(schema['items'])))
+        if 'properties' in schema or 'required' in schema or isinstance(schema.get('additionalProperties'), dict):
+            checks.append(self.object_check(schema))
+
+        if len(checks) == 1:
+            return checks[0]
+
+        return lambda value: all(check(value) for check in checks)
+
+    def reference(self, reference):
+        """References are compiled once, and resolved lazily so that recursive schemas compile"""
+
+        if reference not in self.compiled_references:
+            self.compiled_references[reference] = None
+            if reference == '#':
+                referenced_schema = self.root_schema
+            else:
+                referenced_schema = self.root_schema['definitions'][reference[len('#/definitions/'):]]
+            self.compiled_references[reference] = self.compile(referenced_schema)
+
+        return lambda value: self.compiled_references[reference](value)
+
+    def object_check(self, schema):
+        property_checks = {property_name: self.compile(property_schema)
+                           for property_name, property_schema in schema.get('properties', {}).iteritems()}
+        required_names = frozenset(schema.get('required', ()))
+        additional_properties = schema.get('additionalProperties', True)
+        allow_additional = additional_properties is not False
+        additional_check = self.compile(additional_properties) if isinstance(additional_properties, dict) else None
+
+        def check(value):
+            if not isinstance(value, dict):
+                return True
+            if not required_names.issubset(value):
+                return False
+            for inner_key, inner_value in value.iteritems():
+                property_check = property_checks.get(inner_key)
+                if property_check is None:
+                    if not allow_additional or additional_check is not None and not additional_check(inner_value):
+                        return False
+                elif not property_check(inner_value):
+                    return False
+            return True
+
+        return check
+
+
+_size_keywords = (
+    ('minLength', basestring, lambda size, limit: size >= limit),
+    ('maxLength', basestring, lambda size, limit: size <= limit),
+    ('minItems', list, lambda size, limit: size >= limit),
+    ('maxItems', list, lambda size, limit: size <= limit),
+    ('minProperties', dict, lambda size, limit: size >= limit),
+    ('maxProperties', dict, lambda size, limit: size <= limit),
+)
+
+
+def _size_check(value_type, size_check, limit):
+    return lambda value: not isinstance(value, value_type) or size_check(len(value), limit)
+
+
+def _number_check(number_check):
+    return lambda value: not _types['number'](value) or number_check(value)
+
+
+def _string_check(string_check):
+    return lambda value: not isinstance(value, basestring) or string_check(value) is not None
+
+
+def _items_check(item_check):
+    return lambda value: not isinstance(value, list) or all(item_check(item) for item in value)
+
+
+def _enum_check(allowed_values):
+    # JSON tells booleans and numbers apart: True is not 1
+    allowed_values = tuple((type(allowed_value) is bool, allowed_value) for allowed_value in allowed_values)
+
+    return lambda value: (type(value) is bool, value) in allowed_values
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.store
+~~~~~~~~~~~
+
+Columnar, memory-mapped storage of large collections of models of a single class.
+
+Integer, Boolean, DateTime and String properties get a column of their own (strings being stored in a heap, addressed
+through an offsets array), while any other property (Object, List, Dict...) is stored in a side table of values
+encoded with kelly.codecs. Reading a store does not materialize models: rows are lazy views that only decode the
+properties that are actually accessed.
+
+> write('blog_posts.kst', BlogPost, blog_posts)
+> with Store('blog_posts.kst', BlogPost) as store:
+>     total_likes = sum(store.column('likes'))
+
+"""
+
+import mmap
+import struct
+from datetime import datetime, timedelta
+from errors import CodecError
+from properties import Integer, Boolean, DateTime, String
+from codecs import schema_fingerprint, _encode_value, _decode_value, _decoding_errors
+
+MAGIC = 'KLST'
+FORMAT_VERSION = 1
+
+KIND_INTEGER = 1
+KIND_BOOLEAN = 2
+KIND_DATETIME = 3
+KIND_STRING = 4
+KIND_ENCODED = 5
+
+# Per-row flags
+FLAG_NULL = 0
+FLAG_VALUE = 1
+FLAG_FALSE = 1
+FLAG_TRUE = 2
+FLAG_UNICODE = 1
+FLAG_BYTES = 2
+
+EPOCH = datetime(1970, 1, 1)
+
+_header = struct.Struct('<4sBxxxIQI')
+_column = struct.Struct('<BxxxxxxxQQQQ')
+_int64 = struct.Struct('<q')
+_offset = struct.Struct('<Q')
+_offsets = struct.Struct('<QQ')
+
+
+def column_kind(property_instance):
+    """Find out how the values of a property are stored
+
+    :param property_instance
+    """
+
+    if isinstance(property_instance, Boolean):
+        return KIND_BOOLEAN
+    elif isinstance(property_instance, Integer):
+        return KIND_INTEGER
+    elif isinstance(property_instance, DateTime):
+        return KIND_DATETIME
+    elif isinstance(property_instance, String):
+        return KIND_STRING
+
+    return KIND_ENCODED
+
+
+class _ColumnWriter(object):
+    """Accumulates the values of a single column before they are written"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.flags = bytearray()
+        self.values = bytearray()
+        self.heap = bytearray()
+
+        # Heap-backed columns store row boundaries: row i spans offsets i and i + 1
+        if kind == KIND_STRING or kind == KIND_ENCODED:
+            self.values.extend(_offset.pack(0))
+
+    def append(self, value):
+        if value is None:
+            self.flags.append(FLAG_NULL)
+        elif self.kind == KIND_BOOLEAN:
+            if value is not True and value is not False:
+                raise CodecError('Cannot store %r in a Boolean column' % (value,))
+            self.flags.append(FLAG_TRUE if value else FLAG_FALSE)
+        elif self.kind == KIND_INTEGER:
+            if not isinstance(value, (int, long)) or not -2 ** 63 <= value < 2 ** 63:
+                raise CodecError('Cannot store %r in an Integer column' % (value,))
+            self.flags.append(FLAG_VALUE)
+        elif self.kind == KIND_DATETIME:
+            if not isinstance(value, datetime) or value.tzinfo is not None:
+                raise CodecError('Cannot store %r in a DateTime column' % (value,))
+            self.flags.append(FLAG_VALUE)
+            delta = value - EPOCH
+            value = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        elif self.kind == KIND_STRING:
+            if isinstance(value, unicode):
+                self.flags.append(FLAG_UNICODE)
+                self.heap.extend(value.encode('utf-8'))
+            elif isinstance(value, str):
+                self.flags.append(FLAG_BYTES)
+                self.heap.extend(value)
+            else:
+                raise CodecError('Cannot store %r in a String column' % (value,))
+        else:
+            self.flags.append(FLAG_VALUE)
+            _encode_value(self.heap, value)
+
+        if self.kind == KIND_INTEGER or self.kind == KIND_DATETIME:
+            self.values.extend(_int64.pack(value if value is not None else 0))
+        elif self.kind == KIND_STRING or self.kind == KIND_ENCODED:
+            self.values.extend(_offset.pack(len(self.heap)))
+
+
+def _pad(output, position):
+    """Keep numeric arrays 8-byte aligned"""
+
+    padding = -position % 8
+    output.write('\x00' * padding)
+
+    return position + padding
+
+
+def write(path, model_class, model_instances):
+    """Write a collection of models to a columnar file. Columns are built in memory (as compact arrays) before being
+    written. Returns the number of rows.
+
+    :param path
+    :type model_class: Model
+    :param model_instances: any iterable of model_class instances
+    """
+
+    property_names = model_class._model_property_names
+    writers = [_ColumnWriter(column_kind(model_class._model_properties[property_name]))
+               for property_name in property_names]
+    row_count = 0
+
+    for model_instance in model_instances:
+        if not isinstance(model_instance, model_class):
+            raise CodecError('Cannot store %r in a %s store' % (model_instance, model_class.__name__))
+        for property_name, writer in zip(property_names, writers):
+            writer.append(getattr(model_instance, property_name))
+        row_count += 1
+
+    with open(path, 'wb') as output:
+        position = _header.size + _column.size * len(writers)
+        output.write(_header.pack(MAGIC, FORMAT_VERSION, schema_fingerprint(model_class), row_count, len(writers)))
+
+        # The column directory is computed before any column data is written
+        directory = []
+        for writer in writers:
+            position += -position % 8
+            flags_offset = position
+            position += len(writer.flags)
+            position += -position % 8
+            values_offset = position
+            position += len(writer.values)
+            heap_offset = position
+            position += len(writer.heap)
+            directory.append((writer.kind, flags_offset, values_offset, heap_offset, len(writer.heap)))
+
+        for entry in directory:
+            output.write(_column.pack(*entry))
+
+        position = _header.size + _column.size * len(writers)
+        for writer in writers:
+            position = _pad(output, position)
+            output.write(writer.flags)
+            position = _pad(output, position + len(writer.flags))
+            output.write(writer.values)
+            position += len(writer.values)
+            output.write(writer.heap)
+            position += len(writer.heap)
+
+    return row_count
+
+
+class Column(object):
+    """Lazy, read-only sequence of the values of a single property"""
+
+    def __init__(self, store, property_instance, kind, flags_offset, values_offset, heap_offset):
+        self._data = store._data
+        self._length = len(store)
+        self.property = property_instance
+        self.kind = kind
+        self._flags_offset = flags_offset
+        self._values_offset = values_offset
+        self._heap_offset = heap_offset
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('Column index out of range')
+
+        data = self._data
+        flag = ord(data[self._flags_offset + index])
+
+        if flag == FLAG_NULL:
+            return None
+        elif self.kind == KIND_BOOLEAN:
+            return flag == FLAG_TRUE
+        elif self.kind == KIND_INTEGER:
+            return _int64.unpack_from(data, self._values_offset + index * 8)[0]
+        elif self.kind == KIND_DATETIME:
+            return EPOCH + timedelta(microseconds=_int64.unpack_from(data, self._values_offset + index * 8)[0])
+
+        start, end = _offsets.unpack_from(data, self._values_offset + index * 8)
+        value = data[self._heap_offset + start:self._heap_offset + end]
+
+        try:
+            if self.kind == KIND_STRING:
+                return value.decode('utf-8') if flag == FLAG_UNICODE else value
+
+            return _decode_value(bytearray(value), 0, self.property)[0]
+        except _decoding_errors:
+            raise CodecError('Corrupted store value')
+
+    def __iter__(self):
+        for index in xrange(self._length):
+            yield self[index]
+
+
+class RowView(object):
+    """Lazy view over a single row of a store - properties are read from the columns when accessed"""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            column = self._store._columns[name]
+        except KeyError:
+            raise AttributeError(name)
+
+        return column[self._index]
+
+    def __iter__(self):
+        """Allow dict casting, just like models"""
+
+        for property_name in self._store.model_class._model_property_names:
+            property_instance = self._store.model_class._model_properties[property_name]
+            yield property_name, property_instance.to_dict(getattr(self, property_name))
+
+    def to_model(self):
+        """Materialize the row as a model instance"""
+
+        model_class = self._store.model_class
+
+        return model_class(**{property_name: getattr(self, property_name)
+                              for property_name in model_class._model_property_names})
+
+
+class Store(object):
+    """Read-only, memory-mapped columnar store"""
+
+    def __init__(self, path, model_class):
+        """Class constructor
+
+        :param path
+        :type model_class: Model
+        """
+
+        self.model_class = model_class
+        self._file = open(path, 'rb')
+
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, fingerprint, self._length, column_count = _header.unpack_from(self._data, 0)
+        except (ValueError, struct.error, mmap.error):
+            self._file.close()
+            raise CodecError('Not a store file')
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise CodecError('Unsupported store format')
+        if fingerprint != schema_fingerprint(model_class) or column_count != len(model_class._model_property_names):
+            self.close()
+            raise CodecError('Store schema does not match %s' % model_class.__name__)
+
+        self._columns = {}
+        for column_index, property_name in enumerate(model_class._model_property_names):
+            kind, flags_offset, values_offset, heap_offset, _ = _column.unpack_from(
+                self._data, _header.size + column_index * _column.size)
+            self._columns[property_name] = Column(self, model_class._model_properties[property_name], kind,
+                                                  flags_offset, values_offset, heap_offset)
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('Store index out of range')
+
+        return RowView(self, index)
+
+    def __iter__(self):
+        for index in xrange(self._length):
+            yield RowView(self, index)
+
+    def column(self, property_name):
+        """Lazy sequence of the values of a single property
+
+        :param property_name
+        """
+
+        return self._columns[property_name]
@@ -8,13 +8,16 @@ Basic feature tests.
 
 """
 
+import json
 from uuid import uuid4
 from kelly import Model, String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, InvalidModelError, \
     InvalidPropertyError, min_length, max_length, regex, choices, ERROR_REQUIRED, model_validator
 from nose.tools import assert_raises
 from datetime import datetime
 from kelly.errors import CannotSetPropertyError
-from kelly.properties import Constant
+from kelly.properties import Constant, Union
+from kelly.base import Model as BaseModel
+from kelly import rows as kelly_rows, properties
 
 
 def test_string_invalid_1():
@@ -75,6 +78,61 @@ def test_string_choices():
 
     assert cm.exception.error == 'invalid'
 
+    # Choices given as a set are still looked up by hash, and unhashable values are simply invalid
+    String(validators=[choices({'published', 'draft'})]).validate('draft')
+    assert_raises(AssertionError, choices({'published', 'draft'}), ['draft'])
+    choices([['published'], ['draft']])(['draft'])
+
+
+def test_string_choices_interned():
+    """Values matching a choice are swapped for the choice object itself"""
+
+    draft = u'draft'
+
+    class Foo(Model):
+        status = String(validators=[choices([u'published', draft])])
+        title = String()
+
+    foo_1 = Foo.from_dict({'status': u''.join([u'dra', u'ft']), 'title': u''.join([u'ti', u'tle'])})
+    foo_2 = Foo.from_dict({'status': u''.join([u'dra', u'ft']), 'title': u''.join([u'ti', u'tle'])})
+
+    assert foo_1.status is draft
+    assert foo_2.status is draft
+    assert foo_1.title is not foo_2.title
+
+    foo_1.status = u'not_a_status'
+    assert foo_1.status == u'not_a_status'
+    assert u'not_a_status' not in Foo._model_properties['status']._interned_values
+
+
+def test_string_interned():
+    """Explicitly interned strings are shared between instances"""
+
+    class Foo(Model):
+        country = String(intern=True)
+
+    foo_1 = Foo(country=u''.join([u'B', u'E']))
+    foo_2 = Foo.from_dict({'country': u''.join([u'B', u'E'])})
+
+    assert foo_1.country is foo_2.country
+
+    # The table is bounded: values past its size are kept as they are
+    country = Foo._model_properties['country']
+    for index in range(properties.INTERN_TABLE_SIZE + 10):
+        country.process_value(u'country %d' % index)
+
+    assert len(country._interned_values) == properties.INTERN_TABLE_SIZE
+    assert country.process_value(u''.join([u'B', u'E'])) is foo_1.country
+
+
+def test_string_not_interned():
+    """Interning can be turned off, even with a choices validator"""
+
+    belgium = u'BE'
+    test_string = String(intern=False, validators=[choices([belgium])])
+
+    assert test_string.process_value(u''.join([u'B', u'E'])) is not belgium
+
 
 def test_string_required():
     """By default, a value is required"""
@@ -224,6 +282,64 @@ def test_list_valid_2():
     assert True
 
 
+def test_list_max_size():
+    """Oversized lists are rejected before any item is validated"""
+
+    class CountingString(String):
+        validated = 0
+
+        def _do_validate(self, value):
+            CountingString.validated += 1
+            super(CountingString, self)._do_validate(value)
+
+    test_list = List(property=CountingString(), validators=[max_length(3)])
+    test_list.validate(['a', 'b', 'c'])
+
+    assert test_list.max_size == 3
+    assert CountingString.validated == 3
+
+    with assert_raises(InvalidPropertyError):
+        test_list.validate(['a'] * 1000)
+
+    assert CountingString.validated == 3
+    assert List(max_size=10, validators=[max_length(5), max_length(2, context='foo')]).max_size == 5
+
+
+def test_list_sample_size():
+    """Only a sample of the items is validated"""
+
+    test_list = List(property=String(), sample_size=5)
+    test_list.validate(['a'] * 100)
+
+    with assert_raises(InvalidPropertyError):
+        test_list.validate([3] * 100)
+
+
+def test_list_iter_validated():
+    """Generators are validated chunk by chunk"""
+
+    consumed = []
+
+    def items(count, invalid_at=None):
+        for index in xrange(count):
+            consumed.append(index)
+            yield 'item' if index != invalid_at else 5
+
+    test_list = List(property=String(), max_size=50)
+
+    assert list(test_list.iter_validated(items(45), chunk_size=10)) == ['item'] * 45
+
+    del consumed[:]
+    with assert_raises(InvalidPropertyError):
+        list(test_list.iter_validated(items(45, invalid_at=12), chunk_size=10))
+    assert len(consumed) == 20
+
+    del consumed[:]
+    with assert_raises(InvalidPropertyError):
+        list(test_list.iter_validated(items(1000), chunk_size=10))
+    assert len(consumed) == 51
+
+
 def test_list_default_mutable():
     """Mutating the property default value after providing it should not result in an altered default"""
 
@@ -277,6 +393,16 @@ def test_dict_valid_1():
     assert True
 
 
+def test_dict_max_size():
+    """Oversized dicts are rejected"""
+
+    test_dict = Dict(max_size=2)
+    test_dict.validate({'foo': 1, 'bar': 2})
+
+    with assert_raises(InvalidPropertyError):
+        test_dict.validate({'foo': 1, 'bar': 2, 'baz': 3})
+
+
 def test_dict_default_mutable():
     """Mutating the property default value after providing it should not result in an altered default"""
 
@@ -288,6 +414,74 @@ def test_dict_default_mutable():
     assert test_dict.default == {}
 
 
+def test_dict_inner_errors():
+    """Inner errors are reported by key"""
+
+    test_dict = Dict(mapping={'foo': String(), 'bar': Integer(), 'baz': Integer(required=False)})
+    test_dict.validate({'foo': u'foo', 'bar': 1})
+
+    with assert_raises(InvalidPropertyError) as cm:
+        test_dict.validate({'foo': 3, 'qux': 4})
+
+    assert cm.exception.error == 'invalid'
+    assert cm.exception.errors == {'foo': 'invalid', 'bar': 'required', 'qux': 'extra'}
+    assert test_dict.inner_errors({'foo': u'foo', 'bar': 1}) == {}
+
+
+def test_dict_values():
+    """Every value is validated against the values property"""
+
+    test_dict = Dict(values=Integer(), max_size=3)
+    test_dict.validate({})
+    test_dict.validate({'foo': 1, 'bar': 2})
+
+    with assert_raises(InvalidPropertyError) as cm:
+        test_dict.validate({'foo': 1, 'bar': u'2', 'baz': None})
+
+    assert cm.exception.errors == {'bar': 'invalid', 'baz': 'required'}
+    assert test_dict.from_dict({'foo': 1}) == {'foo': 1}
+
+    # Inner plans are kept in a bounded cache
+    for index in xrange(100):
+        test_dict.inner_errors({'foo': 1}, context='context %d' % index)
+    assert len(test_dict._inner_plans) == 1 + test_dict._inner_plans.size
+
+    class Settings(Model):
+        authors = Dict(values=Object(model_class=Author))
+
+    settings = Settings(authors={'foo': Author(name=u'Pierre')})
+    settings.validate()
+    settings.authors['bar'] = Author()
+
+    with assert_raises(InvalidModelError) as cm:
+        settings.validate()
+
+    assert cm.exception.errors == {'authors': 'invalid'}
+    assert isinstance(Settings.from_dict({'authors': {'foo': {'name': u'Pierre'}}}).authors['foo'], Author)
+
+
+def test_dict_models_round_trip():
+    """Models held by Dict properties are casted to dicts, and decoded back"""
+
+    class Settings(Model):
+        authors = Dict(values=Object(model_class=Author))
+        roles = Dict(mapping={'owner': Object(model_class=Author), 'label': String()}, required=False)
+        counts = Dict(values=Integer(), required=False)
+
+    counts = {'foo': 1}
+    settings = Settings(authors={'foo': Author(name=u'Pierre')}, roles={'owner': Author(name=u'Moinax'), 'label': u'x'},
+                        counts=counts)
+    settings_dict = dict(settings)
+
+    assert settings_dict['authors'] == {'foo': {'name': u'Pierre'}}
+    assert settings_dict['roles'] == {'owner': {'name': u'Moinax'}, 'label': u'x'}
+    assert settings_dict['counts'] is counts  # Nothing to cast
+    assert json.loads(json.dumps(settings_dict)) == settings_dict
+    assert Settings.from_dict(settings_dict) == settings
+    assert settings.to_dict(only=['authors', 'roles.owner']) == {'authors': {'foo': {'name': u'Pierre'}},
+                                                                 'roles': {'owner': {'name': u'Moinax'}}}
+
+
 def test_boolean_invalid():
     """3 is boolean"""
 
@@ -355,6 +549,51 @@ def test_object_default_mutable():
     assert test_object.default.bar == "baz"
 
 
+class ClickEvent(Model):
+    type = Constant(value=u'click')
+    x = Integer()
+
+
+class ScrollEvent(Model):
+    type = Constant(value=u'scroll')
+    offset = Integer()
+
+
+class EventStream(Model):
+    events = List(property=Union('type', {u'click': ClickEvent, u'scroll': ScrollEvent}))
+
+
+def test_union_from_dict():
+    """Model classes are picked from the discriminator value"""
+
+    stream = EventStream.from_dict({'events': [{'type': u'click', 'x': 3}, {'type': u'scroll', 'offset': 5}]})
+
+    assert isinstance(stream.events[0], ClickEvent)
+    assert isinstance(stream.events[1], ScrollEvent)
+    stream.validate()
+
+
+def test_union_unknown_discriminator():
+    """Unknown discriminator values are rejected right away"""
+
+    for events in ([{'type': u'hover'}], [{'x': 3}]):
+        with assert_raises(InvalidModelError) as cm:
+            EventStream.from_dict({'events': events})
+
+        assert cm.exception.errors == {'events': 'invalid'}
+
+
+def test_union_validate():
+    """Only mapped model classes are valid"""
+
+    test_union = Union('type', {u'click': ClickEvent})
+    test_union.validate(ClickEvent(x=1))
+
+    for invalid_value in (ScrollEvent(offset=1), ClickEvent(x=u'foo'), {'type': u'click', 'x': 1}):
+        with assert_raises(InvalidPropertyError):
+            test_union.validate(invalid_value)
+
+
 def test_constant_invalid_1():
     """2 is invalid"""
 
@@ -557,3 +796,78 @@ def test_model_context():
     test_animal_2.validate()
     test_animal_2.validate(context='academic')
     test_animal_2.validate(context='unknown context')
+
+
+def test_model_context_plans():
+    """Validation plans are cached per context, in a bounded cache unless prepared"""
+
+    class Plant(Model):
+        name = String(validators=[min_length(5, context='academic')], required=lambda c: c != 'draft')
+
+    Plant.prepare_contexts(None, 'academic')
+
+    assert len(Plant._validation_plans) == 2
+
+    Plant(name=None).validate(context='draft')
+    Plant(name='Rose').validate()
+
+    with assert_raises(InvalidModelError):
+        Plant(name='Rose').validate(context='academic')
+
+    assert len(Plant._validation_plans) == 3
+
+    for index in xrange(100):
+        Plant(name='Rose').validate(context='context %d' % index)
+
+    assert len(Plant._validation_plans) == 2 + Plant._validation_plans.size
+    assert Plant._validation_plans.get('academic') is Plant._validation_plans.get('academic')
+    assert Plant._validation_plans.get('draft').properties_by_name['name'][3] is False
+
+
+def test_model_from_rows():
+    """Test bulk model instantiation from tuple rows"""
+
+    columns = ('title', 'likes', 'published', 'updated_on')
+    rows = ((u'Post %d' % index, index, True, datetime(2016, 1, 1, 0, 0, index % 60)) for index in xrange(1000))
+
+    blog_posts = list(BlogPost.from_rows(rows, columns))
+
+    assert len(blog_posts) == 1000
+    assert all(isinstance(blog_post, BlogPost) for blog_post in blog_posts)
+    assert blog_posts[42].title == u'Post 42' and blog_posts[42].likes == 42
+    assert blog_posts[42].updated_on == datetime(2016, 1, 1, 0, 0, 42)
+    assert blog_posts[42].body == u'Lorem ipsum' and isinstance(blog_posts[42].created_on, datetime)
+    assert blog_posts[42].id != blog_posts[43].id
+    assert blog_posts[42].foo == 'bar'  # Custom __init__() is called
+    assert blog_posts[42] == BlogPost(**dict(zip(columns, (u'Post 42', 42, True, datetime(2016, 1, 1, 0, 0, 42))),
+                                            id=blog_posts[42].id, created_on=blog_posts[42].created_on))
+
+    # Values are processed, but not validated
+    class Event(Model):
+        name = String(validators=[choices([u'click', u'scroll'])])
+        happened_on = DateTime(include_microseconds=False)
+
+    events = list(Event.from_rows([(u'click', datetime(2016, 1, 1, 0, 0, 0, 42)), (u'drag', None)],
+                                  ['name', 'happened_on']))
+    assert events[0].happened_on == datetime(2016, 1, 1)
+
+    # Plain models skip __init__(), and the kwargs dict it would need
+    assert not kelly_rows._has_custom_init(Event) and kelly_rows._has_custom_init(BlogPost)
+    base_init = BaseModel.__init__
+
+    def init(self, **kwargs):
+        raise AssertionError('__init__() should not be called')
+
+    BaseModel.__init__ = init
+    try:
+        assert len(list(Event.from_rows([(u'click', None)] * 10, ['name', 'happened_on']))) == 10
+    finally:
+        BaseModel.__init__ = base_init
+    assert events[0].name is Event._model_properties['name'].validators[0].argument[0]
+    assert_raises(InvalidModelError, events[1].validate)
+
+    with assert_raises(InvalidModelError) as cm:
+        BlogPost.from_rows([], ['title', 'foo'])
+    assert cm.exception.errors == {'foo': 'extra'}
+
+    assert_raises(ValueError, list, BlogPost.from_rows([(u'Hello', 3)], ['title']))
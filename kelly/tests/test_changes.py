@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_changes
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Model equality, hashing, diff & patch tests.
+
+"""
+
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, List, Dict, Object, CannotSetPropertyError, InvalidModelError, CodecError, \
+    ERROR_INVALID, diff, min_length, model_validator
+from kelly.changes import make_patch, encode_patch, decode_patch
+
+
+class Author(Model):
+    name = String()
+
+
+class Revision(Model):
+    changes = String()
+
+
+class BlogPost(Model):
+    title = String()
+    likes = Integer(required=False)
+    meta_data = Dict(required=False)
+    author = Object(model_class=Author)
+    revisions = List(property=Object(model_class=Revision), required=False)
+
+
+def _blog_post(**kwargs):
+    blog_post_data = dict(title=u'Hello', likes=3, meta_data={'reviewer': u'Moinax'}, author=Author(name=u'Pierre'),
+                          revisions=[Revision(changes=u'foo'), Revision(changes=u'bar')])
+    blog_post_data.update(kwargs)
+
+    return BlogPost(**blog_post_data)
+
+
+def test_equality():
+    """Models with equal values are equal, nested models included"""
+
+    assert _blog_post() == _blog_post()
+    assert not _blog_post() != _blog_post()
+    assert _blog_post() != _blog_post(author=Author(name=u'Moinax'))
+    assert _blog_post() != _blog_post(revisions=[])
+    assert Author(name=u'Pierre') == Author(name=u'Pierre') != Author(name=u'Moinax')
+    assert Author(name=u'Pierre') != Revision(changes=u'Pierre')
+    assert Author(name=u'Pierre') != {'name': u'Pierre'}
+
+
+def test_hash():
+    """Only frozen models are hashable, equal models hashing equally"""
+
+    blog_post = _blog_post()
+
+    assert_raises(TypeError, hash, blog_post)
+    assert_raises(TypeError, set, [blog_post, _blog_post()])
+    assert_raises(TypeError, hash, Author(name=u'Pierre'))
+
+    blog_post.freeze()
+
+    assert blog_post.frozen
+    assert blog_post.author.frozen
+    assert hash(blog_post) == hash(_blog_post().freeze())
+    assert hash(blog_post) == blog_post.content_hash()
+    assert len({blog_post, _blog_post().freeze(), _blog_post(likes=4).freeze()}) == 2
+
+    with assert_raises(CannotSetPropertyError):
+        blog_post.title = u'Goodbye'
+
+    with assert_raises(CannotSetPropertyError):
+        blog_post.revisions[0].changes = u'baz'
+
+
+def test_diff():
+    """Changed paths are listed"""
+
+    blog_post = _blog_post()
+
+    assert diff(blog_post, _blog_post()) == []
+
+    other_blog_post = _blog_post(likes=None, meta_data={'reviewer': u'Pierre', 'corrector': u'Moinax'},
+                                 author=Author(name=u'Moinax'))
+    other_blog_post.revisions[1].changes = u'baz'
+
+    changes = diff(blog_post, other_blog_post)
+
+    assert sorted(changes) == ['author.name', 'likes', 'meta_data.corrector', 'meta_data.reviewer',
+                               'revisions.1.changes']
+    assert diff(blog_post, _blog_post(revisions=[])) == ['revisions']
+
+
+def test_diff_limit():
+    """Diffing stops once the limit is reached"""
+
+    assert len(diff(_blog_post(), _blog_post(title=u'Bye', likes=5), limit=1)) == 1
+
+    with assert_raises(TypeError):
+        diff(Author(name=u'Pierre'), Revision(changes=u'Pierre'))
+
+
+class Comment(Model):
+    text = String(validators=[min_length(3)])
+    author = String(required=False)
+
+    @model_validator('text')
+    def not_shouting(self):
+        assert self.text is None or self.text != self.text.upper(), ERROR_INVALID
+
+
+class Thread(Model):
+    title = String()
+    comments = List(property=Object(model_class=Comment))
+    meta_data = Dict(required=False)
+
+
+def _thread():
+    return Thread(title=u'Hello', comments=[Comment(text=u'First !'), Comment(text=u'Second')],
+                  meta_data={'views': 3, 'tags': [u'foo']})
+
+
+def test_patch():
+    """Applying the patch built from two models turns the first one into the second one"""
+
+    thread = _thread()
+    other_thread = _thread()
+    other_thread.comments[1].author = u'Pierre'
+    other_thread.meta_data = {'views': 4, 'pinned': True}
+
+    delta = make_patch(thread, other_thread)
+
+    assert delta == {'set': {'comments.1.author': u'Pierre', 'meta_data.views': 4, 'meta_data.pinned': True},
+                     'unset': ['meta_data.tags']}
+
+    thread.apply_patch(decode_patch(encode_patch(delta)))
+
+    assert thread == other_thread
+
+
+def test_patch_dict_keys():
+    """Dicts whose keys cannot be written as path segments are diffed, but not patched"""
+
+    blog_post = _blog_post(meta_data={1: u'a'})
+    other_blog_post = _blog_post(meta_data={1: u'b'})
+
+    assert diff(blog_post, other_blog_post) == ['meta_data.1']
+    assert_raises(ValueError, make_patch, blog_post, other_blog_post)
+    assert_raises(ValueError, make_patch, _blog_post(meta_data={'a.b': 1}), _blog_post(meta_data={}))
+
+
+def test_patch_frozen():
+    """Frozen models are never patched, nor are models holding them along the patched paths"""
+
+    blog_post = _blog_post(meta_data={'reviewer': u'Moinax', 'tags': [u'foo']})
+    other_blog_post = _blog_post(meta_data={'reviewer': u'Moinax', 'tags': [u'bar']})
+    delta = make_patch(blog_post, other_blog_post)
+
+    blog_post.freeze()
+    content_hash = hash(blog_post)
+    assert_raises(CannotSetPropertyError, blog_post.apply_patch, delta)
+    assert blog_post.meta_data['tags'] == [u'foo'] and hash(blog_post) == content_hash
+
+    blog_post = _blog_post(author=Author(name=u'Pierre').freeze())
+    assert_raises(CannotSetPropertyError, blog_post.apply_patch, {'set': {'title': u'Hi', 'author.name': u'Moinax'}})
+    assert blog_post.title == u'Hello' and blog_post.author.name == u'Pierre'
+
+
+def test_patch_nested_model():
+    """Whole nested models can be patched"""
+
+    thread = _thread()
+    other_thread = _thread()
+    other_thread.comments = [Comment(text=u'Third')]
+
+    thread.apply_patch(make_patch(thread, other_thread))
+
+    assert isinstance(thread.comments[0], Comment)
+    assert thread == other_thread
+
+
+def test_patch_validates_touched_properties_only():
+    """Untouched invalid properties are not validated, touched ones are - and the model is left untouched"""
+
+    thread = _thread()
+    thread.title = None
+    thread.comments.append(Comment(text=u'x'))
+
+    thread.apply_patch({'set': {'comments.0.author': u'Pierre'}})
+    assert thread.comments[0].author == u'Pierre'
+
+    with assert_raises(InvalidModelError) as cm:
+        thread.apply_patch({'set': {'comments.1.author': u'Moinax', 'comments.1.text': u'SHOUTING'}})
+
+    assert cm.exception.errors == {'comments.1.text': ERROR_INVALID}
+    assert thread.comments[1].author is None
+    assert thread.comments[1].text == u'Second'
+
+
+def test_patch_runs_affected_model_validators_only():
+    """Model validators declaring inputs only run if the patch touches one of them"""
+
+    calls = []
+
+    class Event(Model):
+        title = String()
+        start = Integer()
+        end = Integer()
+        author = Object(model_class=Author, required=False)
+
+        @model_validator('end', inputs=['start', 'end'])
+        def in_order(self):
+            calls.append('in_order')
+            assert self.start <= self.end, ERROR_INVALID
+
+        @model_validator('duration', inputs=['end'])
+        def not_too_long(self):
+            calls.append('not_too_long')
+
+        @model_validator('author', inputs=['author'])
+        def known_author(self):
+            calls.append('known_author')
+
+        @model_validator('title')
+        def anything(self):
+            calls.append('anything')
+
+    event = Event(title=u'Hello', start=1, end=2, author=Author(name=u'Pierre'))
+
+    event.apply_patch({'set': {'title': u'Hi'}})
+    assert calls == ['anything']
+
+    del calls[:]
+    event.apply_patch({'set': {'author.name': u'Moinax'}})
+    assert sorted(calls) == ['anything', 'known_author']
+
+    del calls[:]
+    with assert_raises(InvalidModelError) as cm:
+        event.apply_patch({'set': {'start': 3}})
+    assert cm.exception.errors == {'end': ERROR_INVALID}
+    assert sorted(calls) == ['anything', 'in_order']  # not_too_long reads the invalid end, and is skipped
+    assert event.start == 1
+
+
+def test_decode_invalid_patch():
+    payload = encode_patch({'set': {'title': 4.2}, 'unset': []})
+
+    for invalid_payload in (payload[:-3], payload[:5], '\xff'):
+        assert_raises(CodecError, decode_patch, invalid_payload)
+
+
+def test_patch_invalid_path():
+    """Patches must match the model structure"""
+
+    thread = _thread()
+
+    for delta in ({'set': {'foo': 1}}, {'set': {'comments.9.text': u'foo'}}, {'set': {'title.foo': u'foo'}},
+                  {'unset': ['title']}):
+        with assert_raises(InvalidModelError):
+            thread.apply_patch(delta)
+
+    assert thread == _thread()
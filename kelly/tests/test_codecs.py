@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_codecs
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Binary encoding tests.
+
+"""
+
+import json
+import pickle
+import random
+from uuid import uuid4
+from datetime import datetime
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, Uuid, List, Dict, Object, Union, Boolean, DateTime, CodecError, \
+    CannotSetPropertyError, Constant
+from kelly.codecs import encode, decode, schema_fingerprint
+
+
+class Author(Model):
+    name = String()
+
+
+class Revision(Model):
+    id = Uuid(default_value=uuid4)
+    changes = String(default_value='Fake changes LOL')
+
+
+class BlogPost(Model):
+    id = Uuid(default_value=uuid4)
+    title = String()
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String()})
+    published = Boolean()
+    likes = Integer(required=False)
+    tags = List(property=String())
+    author = Object(model_class=Author)
+    created_on = DateTime(default_value=datetime.now)
+    revisions = List(required=False, property=Object(model_class=Revision))
+
+
+def _blog_post():
+    return BlogPost(title=u'Hello world !', tags=[u'foo', u'bar'], published=True, likes=-8,
+                    meta_data={'corrector': 'Pierre', 'reviewer': u'Moinax'}, author=Author(name=u'Pierre'),
+                    revisions=[Revision(), Revision()])
+
+
+def test_round_trip():
+    """Decoding an encoded model gives back an identical model"""
+
+    blog_post = _blog_post()
+    restored_blog_post = decode(encode(blog_post), BlogPost)
+
+    assert isinstance(restored_blog_post, BlogPost)
+    assert isinstance(restored_blog_post.author, Author)
+    assert isinstance(restored_blog_post.revisions[0], Revision)
+    assert dict(restored_blog_post) == dict(blog_post)
+    assert restored_blog_post.likes == -8
+    assert isinstance(restored_blog_post.title, unicode)
+    assert isinstance(restored_blog_post.meta_data['corrector'], str)
+    restored_blog_post.validate()
+
+
+def test_compact():
+    """Property names are not part of the payload"""
+
+    blog_post = _blog_post()
+    payload = encode(blog_post)
+    blog_post_dict = dict(blog_post)
+
+    blog_post_dict['created_on'] = blog_post_dict['created_on'].isoformat()
+
+    assert len(payload) < len(json.dumps(blog_post_dict)) * 2 / 3
+    assert 'meta_data' not in payload
+
+
+def test_fingerprint():
+    """The fingerprint changes along with the property table"""
+
+    class Foo(Model):
+        bar = String()
+
+    class Bar(Model):
+        bar = Integer()
+
+    class Baz(Model):
+        bar = List(property=String())
+
+    class Qux(Model):
+        bar = List(property=Integer())
+
+    fingerprints = set(schema_fingerprint(model_class) for model_class in (Foo, Bar, Baz, Qux))
+
+    assert len(fingerprints) == 4
+    assert schema_fingerprint(Foo) == schema_fingerprint(Foo)
+
+    with assert_raises(CodecError):
+        decode(encode(Foo(bar=u'baz')), Bar)
+
+
+def test_nested_fingerprint():
+    """Nested models are checked against their own fingerprint"""
+
+    class Inner(Model):
+        foo = String()
+
+    class Outer(Model):
+        inner = Object(model_class=Inner)
+
+    payload = encode(Outer(inner=Inner(foo=u'bar')))
+
+    class Inner(Model):
+        foo = Integer()
+
+    class Outer(Model):
+        inner = Object(model_class=Inner)
+
+    with assert_raises(CodecError):
+        decode(payload, Outer)
+
+
+def test_values():
+    """Scalars, containers and edge cases"""
+
+    class Foo(Model):
+        number = Integer()
+        flag = Boolean(required=False)
+        when = DateTime()
+        anything = Dict()
+        items = List()
+
+    foo = Foo(number=2 ** 70, flag=None, when=datetime(2016, 2, 29, 23, 59, 59, 999999),
+              anything={u'é': [1.5, u'ü', None, {'nested': True}]}, items=[])
+    restored_foo = decode(encode(foo), Foo)
+
+    assert dict(restored_foo) == dict(foo)
+
+
+def test_invalid_payloads():
+    """Truncated or corrupted payloads are rejected"""
+
+    payload = encode(_blog_post())
+
+    for invalid_payload in (payload[:3], payload[:-1], payload + '\x00', 'X' + payload[1:]):
+        with assert_raises(CodecError):
+            decode(invalid_payload, BlogPost)
+
+
+def test_corrupted_payloads():
+    """Corrupted values (invalid UTF-8, impossible datetimes, unhashable dict keys) are rejected as well"""
+
+    class Foo(Model):
+        name = String()
+        created_at = DateTime()
+        meta_data = Dict()
+
+    payload = encode(Foo(name=u'ab', created_at=datetime(2020, 1, 1), meta_data={u'a': 1}))
+    assert decode(payload, Foo).name == u'ab'
+
+    corrupted_payloads = [payload.replace('\x06\x02ab', '\x06\x02\xff\xfe'),  # Invalid UTF-8
+                          payload.replace('\x07\x07\xe4\x01', '\x07\x07\xe4\x0d'),  # Month 13
+                          payload.replace('\x06\x01a', '\x08\x01\x00')]  # A list as a dict key
+    for corrupted_payload in corrupted_payloads:
+        assert corrupted_payload != payload
+        with assert_raises(CodecError):
+            decode(corrupted_payload, Foo)
+
+
+def test_mismatched_values():
+    """Values the model cannot hold, huge lengths and random corruptions are rejected as well"""
+
+    class Sample(Model):
+        kind = Constant(u'a')
+        created_at = DateTime(include_microseconds=False, required=False)
+        tags = List(property=String(), required=False)
+
+    payload = encode(Sample())
+    header, body = payload[:6], payload[6:]
+    assert body == '\x00\x06\x01a\x00'  # created_at, kind, tags
+
+    corrupted_payloads = [header + '\x03\x02\x06\x01a\x00',  # An integer for a DateTime
+                          header + '\x00\x06\x01a\x08' + '\xff' * 10 + '\x01',  # A huge list length
+                          header + '\x00\x06\x01b\x00']  # A Constant mismatch
+    for corrupted_payload in corrupted_payloads:
+        with assert_raises(CodecError):
+            decode(corrupted_payload, Sample)
+
+    payload = bytearray(encode(_blog_post()))
+    generator = random.Random(0)
+    for _ in xrange(500):
+        corrupted_payload = bytearray(payload)
+        for _ in xrange(generator.randint(1, 4)):
+            corrupted_payload[generator.randrange(6, len(payload))] = generator.randrange(256)
+        try:
+            decode(str(corrupted_payload), BlogPost)
+        except CodecError:
+            pass
+
+
+def test_unsupported_value():
+    """Only plain values can be encoded"""
+
+    class Foo(Model):
+        bar = String()
+
+    with assert_raises(CodecError):
+        encode(Foo(bar=object()))
+
+
+def test_union():
+    """Union members are decoded to the right model class"""
+
+    class Click(Model):
+        x = Integer()
+
+    class Scroll(Model):
+        offset = Integer()
+
+    class Stream(Model):
+        events = List(property=Union('type', {u'click': Click, u'scroll': Scroll}))
+
+    stream = decode(encode(Stream(events=[Click(x=1), Scroll(offset=2)])), Stream)
+
+    assert isinstance(stream.events[0], Click)
+    assert isinstance(stream.events[1], Scroll)
+    assert stream.events[1].offset == 2
+
+
+def test_pickle():
+    blog_post = _blog_post()
+
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        restored_blog_post = pickle.loads(pickle.dumps(blog_post, protocol))
+        assert restored_blog_post == blog_post
+        assert isinstance(restored_blog_post.revisions[0], Revision)
+        assert not restored_blog_post.frozen
+        restored_blog_post.validate()
+
+    # Property names are not pickled
+    payload = pickle.dumps([_blog_post() for _ in xrange(10)], pickle.HIGHEST_PROTOCOL)
+    assert 'meta_data' not in payload and 'title' not in payload
+    assert len(payload) < len(pickle.dumps([_blog_post().__dict__ for _ in xrange(10)], pickle.HIGHEST_PROTOCOL))
+
+    # Frozen models stay frozen
+    blog_post.freeze()
+    restored_blog_post = pickle.loads(pickle.dumps(blog_post, pickle.HIGHEST_PROTOCOL))
+    assert restored_blog_post.frozen and restored_blog_post.author.frozen
+    assert hash(restored_blog_post) == hash(blog_post)
+    assert_raises(CannotSetPropertyError, setattr, restored_blog_post, 'title', u'Hi')
+
+
+class Draft(Model):
+    title = String()
+
+    def __init__(self, **kwargs):
+        super(Draft, self).__init__(**kwargs)
+        self.editor = u'Pierre'
+
+
+def test_pickle_instance_attributes():
+    """Attributes that are not properties are pickled as well"""
+
+    draft = Draft(title=u'Hello')
+    draft.revision_count = 3
+
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        restored_draft = pickle.loads(pickle.dumps(draft, protocol))
+        assert restored_draft == draft
+        assert restored_draft.editor == u'Pierre' and restored_draft.revision_count == 3
+
+    # Models without any such attribute have no state to pickle
+    assert Author(name=u'Pierre').__reduce__()[2] is None
+
+
+def test_pickle_schema_change():
+    """Unpickling with a changed model class fails"""
+
+    global Author
+
+    payload = pickle.dumps(Author(name=u'Pierre'), pickle.HIGHEST_PROTOCOL)
+    original_author_class = Author
+
+    class Author(Model):
+        name = String()
+        age = Integer(required=False)
+
+    try:
+        assert_raises(CodecError, pickle.loads, payload)
+    finally:
+        Author = original_author_class
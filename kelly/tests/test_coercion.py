@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_coercion
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Type coercion tests.
+
+"""
+
+from uuid import UUID
+from datetime import datetime
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, InvalidModelError
+from kelly.coercion import parse_datetime
+
+
+class Author(Model):
+    id = Uuid(coerce=True)
+    born_on = DateTime(coerce=True, required=False)
+
+
+class Order(Model):
+    reference = String(coerce=True)
+    amount = Integer(coerce=True)
+    paid = Boolean(coerce=True)
+    created_on = DateTime(coerce=True)
+    authors = List(property=Object(model_class=Author))
+    quantities = List(property=Integer(coerce=True))
+    meta_data = Dict(mapping={'weight': Integer(coerce=True), 'label': String()})
+    raw_amount = Integer(required=False)
+    rounded = Integer(required=False, coerce=lambda value: int(round(float(value))))
+
+
+def test_from_dict_coercion():
+    """Raw values are coerced in from_dict()"""
+
+    order = Order.from_dict({
+        'reference': 12, 'amount': '-42', 'paid': 'TRUE', 'created_on': '2016-02-29T12:30:15.25',
+        'authors': [{'id': '{C5A2C3B6-0F5B-4B4E-9D0A-2C2D5E8A4F11}', 'born_on': '1980-01-01T00:00:00+02:00'}],
+        'quantities': ['1', 2, 3.0], 'meta_data': {'weight': '5', 'label': 'heavy'}, 'raw_amount': None,
+        'rounded': '4.6'})
+
+    assert order.reference == u'12'
+    assert order.amount == -42
+    assert order.paid is True
+    assert order.created_on == datetime(2016, 2, 29, 12, 30, 15, 250000)
+    assert order.authors[0].id == u'c5a2c3b6-0f5b-4b4e-9d0a-2c2d5e8a4f11'
+    assert order.authors[0].born_on == datetime(1979, 12, 31, 22, 0, 0)
+    assert order.quantities == [1, 2, 3]
+    assert order.meta_data == {'weight': 5, 'label': 'heavy'}
+    assert order.rounded == 5
+    order.validate()
+
+
+def test_no_coercion_by_default():
+    """Properties do not coerce values unless asked to"""
+
+    class Foo(Model):
+        amount = Integer()
+
+    foo = Foo.from_dict({'amount': '42'})
+
+    assert foo.amount == '42'
+
+    with assert_raises(InvalidModelError):
+        foo.validate()
+
+
+def test_invalid_values_are_kept():
+    """Values that cannot be coerced are kept as is, and rejected by validation"""
+
+    order = Order.from_dict({'reference': u'foo', 'amount': 'forty two', 'paid': 'maybe', 'created_on': 'yesterday',
+                             'authors': [{'id': 'not a uuid'}], 'quantities': [],
+                             'meta_data': {'weight': 1, 'label': u'light'}})
+
+    assert order.amount == 'forty two'
+    assert order.paid == 'maybe'
+    assert order.created_on == 'yesterday'
+
+    with assert_raises(InvalidModelError) as cm:
+        order.validate()
+
+    assert set(cm.exception.errors) == {'amount', 'paid', 'created_on', 'authors'}
+
+
+def test_uuid_coercion():
+    """UUID instances are converted too"""
+
+    assert Uuid(coerce=True).from_dict(UUID(int=1)) == u'00000000-0000-0000-0000-000000000001'
+
+
+def test_parse_datetime_cache():
+    """Parsed datetimes are shared"""
+
+    assert parse_datetime('2016-01-01T00:00:00Z') is parse_datetime('2016-01-01T00:00:00Z')
+    assert parse_datetime('2016-02-30T00:00:00') is None
+
+
+def test_parse_datetime_range_edges():
+    """Time zone offsets pushing datetimes out of range leave values uncoerced"""
+
+    assert parse_datetime('0001-01-01T00:00:00-01:00') == datetime(1, 1, 1, 1)
+    assert parse_datetime('9999-12-31T23:59:59+01:00') == datetime(9999, 12, 31, 22, 59, 59)
+
+    for value in ('0001-01-01T00:00:00+01:00', '9999-12-31T23:59:59-01:00'):
+        assert parse_datetime(value) is None
+
+        author = Author.from_dict({'id': u'00000000-0000-0000-0000-000000000001', 'born_on': value})
+        assert author.born_on == value
+        assert_raises(InvalidModelError, author.validate)
+        assert_raises(InvalidModelError, Author.from_json, '{"born_on": "%s"}' % value)
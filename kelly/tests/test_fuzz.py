@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_fuzz
+~~~~~~~~~~~~~~~~~~~~~
+
+Differential tests: validation engines must accept and reject the same random payloads.
+
+"""
+
+from kelly import Model, String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, Union, Constant, choices, \
+    min_length, max_length, regex
+from kelly.benchmarks.fuzz import PayloadGenerator, differential, reference_engine, throughput, ENGINES
+
+
+class Author(Model):
+    name = String(validators=[min_length(2), max_length(20)])
+    email = String(required=False, validators=[regex(r'[a-z]+@[a-z]+\Z')])
+
+
+class ClickEvent(Model):
+    type = Constant(u'click')
+    x = Integer(coerce=True)
+
+
+class ScrollEvent(Model):
+    type = Constant(u'scroll')
+    offset = Integer()
+
+
+class Comment(Model):
+    text = String()
+    replies = List(property=Object('%s.Comment' % __name__), required=False)
+
+
+class BlogPost(Model):
+    id = Uuid()
+    title = String(validators=[min_length(3), max_length(100), regex(r'^[A-Za-z0-9 !.-]*$')])
+    status = String(validators=[choices([u'draft', u'published'])])
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String(required=False)})
+    scores = Dict(values=Integer(), required=False, max_size=3)
+    published = Boolean()
+    created_on = DateTime(required=False)
+    tags = List(property=String(validators=[min_length(3)]), max_size=3)
+    author = Object(model_class=Author)
+    comments = List(property=Object(model_class=Comment), required=False)
+    events = List(property=Union('type', {'click': ClickEvent, 'scroll': ScrollEvent}), required=False)
+
+
+def test_generator():
+    generator = PayloadGenerator(BlogPost, seed=1)
+
+    for _ in xrange(50):
+        assert reference_engine(BlogPost, generator.valid()) == {}
+        assert reference_engine(BlogPost, generator.invalid()) != {}
+
+
+def test_differential():
+    payloads = list(PayloadGenerator(BlogPost, seed=2).payloads(400, invalid_rate=0.5))
+
+    assert differential(BlogPost, payloads) == []
+    assert throughput(ENGINES['validate_dict'][0], BlogPost, payloads[:10]) > 0
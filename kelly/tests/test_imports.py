@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_imports
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Lazy loading tests - run in fresh interpreters, as the test process has already imported everything.
+
+"""
+
+from nose.tools import assert_raises
+import kelly
+from kelly.benchmarks.imports import SCENARIOS, measure, slowest_imports
+
+
+def _loaded_kelly_modules(statement):
+    return set(module_name for _, module_name in slowest_imports(statement, count=None)
+               if module_name.startswith('kelly'))
+
+
+def test_lazy_loading():
+    assert _loaded_kelly_modules('import kelly') == {'kelly'}
+    assert _loaded_kelly_modules('from kelly import ERROR_INVALID') == {'kelly', 'kelly.errors'}
+
+    loaded_modules = _loaded_kelly_modules('from kelly import Model, String')
+    assert 'kelly.models' in loaded_modules
+    assert 'kelly.jsoncodec' not in loaded_modules and 'kelly.changes' not in loaded_modules
+
+    assert 'uuid' not in set(module_name for _, module_name in slowest_imports('from kelly import Uuid', count=None))
+
+
+def test_deferred_imports_run_once():
+    """Backends imported on first use are kept: later calls never go through the import statement"""
+
+    import __builtin__
+    from kelly import Model, String
+
+    class Author(Model):
+        name = String()
+
+    author = Author.from_json(Author(name=u'Pierre').to_json())
+    author.to_dict(only=['name'])
+    Author.validate_dict({'name': u'Pierre'})
+    original_import = __builtin__.__import__
+
+    def forbidden_import(name, *args, **kwargs):
+        raise AssertionError('%s imported again' % name)
+
+    __builtin__.__import__ = forbidden_import
+    try:
+        assert Author.from_json(author.to_json()) == author
+        assert author.to_dict(only=['name']) == {'name': u'Pierre'}
+        Author.validate_dict({'name': u'Pierre'})
+    finally:
+        __builtin__.__import__ = original_import
+
+
+def test_exports():
+    assert set(dir(kelly)) >= set(kelly.__all__)
+    assert kelly.Model.__module__ == 'kelly.models'
+    assert kelly.diff.__module__ == 'kelly.changes'
+    assert_raises(AttributeError, getattr, kelly, 'NoSuchName')
+
+
+def test_benchmark():
+    for _, statement in SCENARIOS:
+        elapsed, module_count = measure(statement, 1)
+        assert elapsed > 0 and module_count > 0
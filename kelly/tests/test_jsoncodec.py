@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_jsoncodec
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Direct JSON encoding/decoding tests.
+
+"""
+
+import json
+from uuid import uuid4
+from datetime import datetime
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, Uuid, List, Dict, Object, Boolean, DateTime, InvalidModelError, \
+    CodecError, ERROR_EXTRA
+
+
+class Author(Model):
+    name = String()
+
+
+class Revision(Model):
+    id = Uuid(default_value=uuid4)
+    changes = String(default_value='Fake changes LOL')
+
+
+class BlogPost(Model):
+    id = Uuid(default_value=uuid4)
+    title = String(error_key='text')
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String()})
+    published = Boolean()
+    likes = Integer(required=False)
+    tags = List(property=String())
+    author = Object(model_class=Author)
+    created_on = DateTime(default_value=datetime.now)
+    revisions = List(required=False, property=Object(model_class=Revision))
+
+
+def _blog_post():
+    return BlogPost(title=u'Hello world ! é', tags=[u'foo', u'bar'], published=True, likes=8,
+                    meta_data={'corrector': 'Pierre', 'reviewer': u'Moinax'}, author=Author(name=u'Pierre'),
+                    revisions=[Revision(), Revision()])
+
+
+def test_to_json():
+    """to_json() gives the same document as dumping dict(model)"""
+
+    blog_post = _blog_post()
+    blog_post_dict = dict(blog_post)
+    blog_post_dict['created_on'] = blog_post_dict['created_on'].isoformat()
+
+    assert json.loads(blog_post.to_json()) == blog_post_dict
+
+
+def test_round_trip():
+    """from_json(to_json()) gives back an identical model"""
+
+    blog_post = _blog_post()
+    restored_blog_post = BlogPost.from_json(blog_post.to_json())
+
+    assert isinstance(restored_blog_post.author, Author)
+    assert isinstance(restored_blog_post.revisions[1], Revision)
+    assert restored_blog_post.created_on == blog_post.created_on
+    assert dict(restored_blog_post) == dict(blog_post)
+    restored_blog_post.validate()
+
+
+def test_from_json_defaults():
+    """Missing properties get their default value, whitespace is fine"""
+
+    blog_post = BlogPost.from_json(' { "title" : "Hello" , "tags" : [ ] , "likes": null } ')
+
+    assert blog_post.title == u'Hello'
+    assert blog_post.tags == []
+    assert blog_post.likes is None
+    assert blog_post.id is not None
+
+
+def test_from_json_invalid_type():
+    """Invalid types are rejected as soon as they are parsed, the rest of the document does not even need to be valid"""
+
+    with assert_raises(InvalidModelError) as cm:
+        BlogPost.from_json('{"likes": "eight", "title": garbage')
+
+    assert cm.exception.errors == {'likes': 'invalid'}
+
+    with assert_raises(InvalidModelError) as cm:
+        BlogPost.from_json('{"title": 5}')
+
+    assert cm.exception.errors == {'text': 'invalid'}
+
+    for invalid_document in ('{"tags": ["foo", 3]}', '{"author": {"name": false}}', '{"published": "yes"}',
+                             '{"created_on": "yesterday"}', '{"revisions": {}}'):
+        with assert_raises(InvalidModelError):
+            BlogPost.from_json(invalid_document)
+
+    # Arrays and objects given to scalar properties are rejected before being parsed, however deep they are
+    for invalid_document in ('{"likes": %s' % ('[' * 5000), '{"title": {"a": garbage', '{"published": [1, 2]}'):
+        with assert_raises(InvalidModelError):
+            BlogPost.from_json(invalid_document)
+
+    class Tag(Model):
+        name = String(coerce=lambda value: u','.join(value) if isinstance(value, list) else value)
+
+    assert Tag.from_json('{"name": ["foo", "bar"]}').name == u'foo,bar'
+
+
+def test_from_json_extra():
+    """Unknown keys are rejected"""
+
+    with assert_raises(InvalidModelError) as cm:
+        BlogPost.from_json('{"foo": 1}')
+
+    assert cm.exception.errors == {'foo': ERROR_EXTRA}
+
+
+def test_from_json_malformed():
+    """Malformed documents raise a CodecError"""
+
+    for malformed_document in ('', '[]', '{"title": "foo"', '{"title": "foo"} x', '{"title" "foo"}',
+                               '{"title": "foo\\x"}', '{"meta_data": {"a": tru}}', '\xff'):
+        with assert_raises(CodecError):
+            BlogPost.from_json(malformed_document)
+
+    # Untyped values nested beyond the recursion limit
+    class Document(Model):
+        extra = Dict()
+
+    with assert_raises(CodecError):
+        Document.from_json('{"extra": {"a": %s%s}}' % ('[' * 5000, ']' * 5000))
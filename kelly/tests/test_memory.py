@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_memory
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Memory benchmark tests.
+
+"""
+
+import sys
+from kelly import Model, String
+from kelly.benchmarks.memory import SCENARIOS, deep_size, count_objects, measure, compare, peak_method
+
+
+class Author(Model):
+    name = String()
+
+
+class Point(object):
+    __slots__ = ('x',)  # Not recycled from a free list, unlike lists and dicts
+
+
+def test_deep_size():
+    name = u'Pierre'
+
+    assert deep_size(name) == sys.getsizeof(name)
+    assert deep_size([name, name]) == sys.getsizeof([name, name]) + sys.getsizeof(name)  # Shared objects count once
+    assert deep_size(Author(name=name)) == sys.getsizeof(Author(name=name)) + deep_size({'name': name})
+
+
+def test_count_objects():
+    assert 0.9 <= count_objects(Point, 100) <= 1.1
+    assert count_objects(lambda: Author(name=u'Pierre'), 100) >= 1
+
+
+def test_measure():
+    for scenario_name, _, _ in SCENARIOS:
+        results = measure(scenario_name, 10)
+        assert results['instance_bytes'] > 0
+        assert results['construct_objects'] >= 1 and results['dict_objects'] >= 1
+
+    results = {'flat': {'instance_bytes': 1000, 'peak_bytes': 10000}}
+    baseline = {'peak': peak_method(), 'count': 10, 'scenarios': {'flat': {'instance_bytes': 990, 'peak_bytes': 1000}}}
+
+    assert compare(results, baseline, 0.05, 10) == [('flat', 'peak_bytes', 1000, 10000)]
+    assert compare(results, baseline, 0.05, 20) == []  # Peak memory depends on the instance count
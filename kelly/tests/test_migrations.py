@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_migrations
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Versioned models & migration tests.
+
+"""
+
+import json
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, List, Object, InvalidModelError, ERROR_INVALID, rename, fill, convert
+from kelly import migrations
+from kelly.migrations import reading_plan
+
+
+class Author(Model):
+    schema_version = 3
+    schema_migrations = {
+        2: [rename('name', 'full_name')],
+        3: [convert('age', int), fill('country', u'BE')],
+    }
+
+    full_name = String()
+    age = Integer()
+    country = String()
+
+
+class BlogPost(Model):
+    schema_version = 2
+    schema_migrations = {
+        2: [rename('title', 'headline'), fill('title', u'Untitled'), rename('writers', 'authors')],
+    }
+
+    title = String()
+    headline = String()
+    authors = List(property=Object(model_class=Author))
+
+
+def test_decode_legacy():
+    author = Author.from_dict({'name': u'Pierre', 'age': u'42'})
+    assert (author.full_name, author.age, author.country) == (u'Pierre', 42, u'BE')
+
+    author = Author.from_dict({'_version': 2, 'full_name': u'Pierre', 'age': u'7', 'country': u'FR'})
+    assert (author.full_name, author.age, author.country) == (u'Pierre', 7, u'FR')
+
+    # Current dicts carry their version, and are read as they are
+    assert dict(author) == {'_version': 3, 'full_name': u'Pierre', 'age': 7, 'country': u'FR'}
+    assert Author.from_dict(dict(author)) == author
+    assert Author.from_dict({'_version': 3, 'full_name': u'Pierre', 'age': u'7'}).age == u'7'
+
+
+def test_decode_nested_legacy():
+    blog_post = BlogPost.from_dict({'title': u'Hello', 'writers': [{'name': u'Pierre', 'age': 42}]})
+
+    assert (blog_post.title, blog_post.headline) == (u'Untitled', u'Hello')  # The old title moved to headline
+    assert blog_post.authors == [Author(full_name=u'Pierre', age=42, country=u'BE')]
+    blog_post.validate()
+
+    assert dict(BlogPost.from_dict(dict(blog_post))) == dict(blog_post)
+
+
+def test_unknown_version():
+    for version in (0, 4, u'3', None):
+        with assert_raises(InvalidModelError) as cm:
+            Author.from_dict({'_version': version, 'full_name': u'Pierre', 'age': 42})
+        assert cm.exception.errors == {'_version': ERROR_INVALID}
+
+
+def test_validate_dict_legacy():
+    Author.validate_dict({'name': u'Pierre', 'age': u'42'})
+    BlogPost.validate_dict({'title': u'Hello', 'writers': [{'name': u'Pierre', 'age': 42}]})
+
+    with assert_raises(InvalidModelError) as cm:
+        Author.validate_dict({'name': u'Pierre', 'age': u'old'})  # Failed conversions are reported by validation
+
+    assert cm.exception.errors == {'age': ERROR_INVALID}
+
+    with assert_raises(InvalidModelError) as cm:
+        BlogPost.validate_dict({'title': u'Hello', 'writers': [{'name': u'Pierre'}]})
+
+    assert cm.exception.errors == {'authors': ERROR_INVALID}
+
+    with assert_raises(InvalidModelError) as cm:
+        Author.validate_dict({'_version': 5})
+
+    assert cm.exception.errors == {'_version': ERROR_INVALID}
+
+    # Legacy values are read from the dict itself, never from an upgraded copy
+    original_upgrade = migrations.upgrade
+
+    def upgrade(model_class, dct):
+        raise AssertionError('Legacy dicts should not be upgraded')
+
+    migrations.upgrade = upgrade
+    try:
+        BlogPost.validate_dict({'title': u'Hello', 'writers': [{'name': u'Pierre', 'age': 42}]})
+    finally:
+        migrations.upgrade = original_upgrade
+
+
+def test_invalid_migrations():
+    """Misdeclared versions and migrations are rejected when the model class is created"""
+
+    def model_class(version, steps_by_version):
+        class Versioned(Model):
+            schema_version = version
+            schema_migrations = steps_by_version
+
+            name = String()
+
+    model_class(2, {2: [rename('title', 'name')]})
+
+    assert_raises(ValueError, model_class, 0, None)
+    assert_raises(ValueError, model_class, u'2', None)
+    assert_raises(ValueError, model_class, 2, {3: [rename('title', 'name')]})
+    assert_raises(ValueError, model_class, 2, {2: [('title', 'name')]})
+
+
+def test_json():
+    author = Author(full_name=u'Pierre', age=42, country=u'BE')
+
+    assert json.loads(author.to_json()) == dict(author)
+    assert Author.from_json(author.to_json()) == author
+    assert Author.from_json('{"name": "Pierre", "age": "42"}') == author
+
+    schema = Author.json_schema()
+    assert schema['properties']['_version'] == {'enum': [3]} and '_version' in schema['required']
+
+
+def test_reading_plan():
+    plan = reading_plan(BlogPost, 1)
+
+    assert reading_plan(BlogPost, 1) is plan  # Cached
+    assert [(property_name, source_key, len(steps)) for property_name, _, source_key, steps in plan] == \
+        [('authors', 'writers', 0), ('headline', 'title', 0), ('title', None, 1)]
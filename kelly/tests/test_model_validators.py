@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_model_validators
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Model validator ordering, skipping and concurrency tests.
+
+"""
+
+from threading import Event
+from multiprocessing.pool import ThreadPool
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, InvalidModelError, ERROR_INVALID, model_validator
+
+
+calls = []
+
+
+class Booking(Model):
+    start = Integer()
+    end = Integer()
+    room = String(error_key='location')
+
+    @model_validator(error_key='end', inputs=['start', 'end'])
+    def in_order(self):
+        calls.append('in_order')
+        assert self.start <= self.end, ERROR_INVALID
+
+    @model_validator(error_key='availability', inputs=['room', 'in_order_key'], cost=100)
+    def available(self):
+        calls.append('available')
+        assert self.room != u'busy', ERROR_INVALID
+
+    @model_validator(error_key='in_order_key', inputs=['start', 'end'], cost=5)
+    def short_enough(self):
+        calls.append('short_enough')
+        assert self.end - self.start < 10, ERROR_INVALID
+
+    @model_validator(error_key='room', inputs=['room'], cost=0.5)
+    def room_name(self):
+        calls.append('room_name')
+        assert self.room is None or len(self.room) > 1, ERROR_INVALID
+
+
+def _validate(model_class, **kwargs):
+    del calls[:]
+
+    try:
+        model_class(**kwargs).validate()
+    except InvalidModelError as e:
+        return e.errors
+
+    return {}
+
+
+def test_order():
+    assert _validate(Booking, start=1, end=2, room=u'A1') == {}
+    assert calls == ['room_name', 'in_order', 'short_enough', 'available']
+
+
+def test_skipped_inputs():
+    assert _validate(Booking, start=None, end=2, room=u'A1') == {'start': 'required'}
+    assert calls == ['room_name']
+
+    assert _validate(Booking, start=3, end=2, room=u'busy') == {'end': ERROR_INVALID}
+    assert calls == ['room_name', 'in_order']
+
+    assert _validate(Booking, start=1, end=20, room=u'busy') == {'in_order_key': ERROR_INVALID}
+    assert calls == ['room_name', 'in_order', 'short_enough']
+
+    # Error keys of properties are followed
+    assert _validate(Booking, start=1, end=2, room=3) == {'location': ERROR_INVALID}
+    assert 'available' not in calls
+
+    # Same with validate_dict()
+    with assert_raises(InvalidModelError) as cm:
+        Booking.validate_dict({'start': 3, 'end': 2, 'room': u'busy'})
+
+    assert cm.exception.errors == {'end': ERROR_INVALID}
+
+
+def test_invalid_inputs():
+    """Inputs are checked when the model class is created"""
+
+    def unknown():
+        class Unknown(Model):
+            start = Integer()
+
+            @model_validator(error_key='start', inputs=['stop'])
+            def foo(self):
+                pass
+
+    def circular():
+        class Circular(Model):
+            start = Integer()
+
+            @model_validator(error_key='foo', inputs=['bar'])
+            def foo(self):
+                pass
+
+            @model_validator(error_key='bar', inputs=['foo'])
+            def bar(self):
+                pass
+
+    assert_raises(ValueError, unknown)
+    assert_raises(ValueError, circular)
+
+
+class Report(Model):
+    title = String()
+
+    # Both validators wait for each other: they only pass if they run concurrently
+    first_started = Event()
+    second_started = Event()
+
+    @model_validator(error_key='first', inputs=['title'], cost=10, concurrent=True)
+    def first(self):
+        Report.first_started.set()
+        assert Report.second_started.wait(5), ERROR_INVALID
+
+    @model_validator(error_key='second', inputs=['title'], cost=10, concurrent=True)
+    def second(self):
+        Report.second_started.set()
+        assert Report.first_started.wait(5), ERROR_INVALID
+
+    @model_validator(error_key='title', cost=1)
+    def title_length(self):
+        assert len(self.title) < 10, ERROR_INVALID
+
+
+def test_concurrent():
+    pool = ThreadPool(2)
+    Report.model_validator_pool = pool
+
+    try:
+        Report(title=u'Report').validate()
+        assert Report.first_started.is_set() and Report.second_started.is_set()
+
+        Report.first_started.clear()
+        Report.second_started.clear()
+
+        with assert_raises(InvalidModelError) as cm:
+            Report(title=u'Quarterly report').validate()
+
+        assert cm.exception.errors == {'title': ERROR_INVALID}
+        assert not Report.first_started.is_set()
+    finally:
+        Report.model_validator_pool = None
+        pool.close()
+        pool.join()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_payloads
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Raw dict validation tests - validate_dict() must agree with from_dict() followed by validate().
+
+"""
+
+import sys
+from datetime import datetime
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, DateTime, List, Dict, Boolean, Object, Union, Constant, choices, \
+    min_length, regex, model_validator, InvalidModelError, ERROR_INVALID, ERROR_REQUIRED
+
+
+class Author(Model):
+    name = String(validators=[min_length(2)])
+    email = String(required=False, validators=[regex(r'[^@]+@[^@]+\Z')])
+
+
+class Revision(Model):
+    changes = String(default_value=u'Fake changes')
+    revised_on = DateTime(coerce=True, required=False)
+
+
+class ClickEvent(Model):
+    type = Constant(u'click')
+    x = Integer(coerce=True)
+
+
+class ScrollEvent(Model):
+    type = Constant(u'scroll')
+    offset = Integer()
+
+
+class BlogPost(Model):
+    title = String(validators=[min_length(3)])
+    status = String(validators=[choices([u'draft', u'published'])])
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String(required=False)})
+    scores = Dict(values=Integer(coerce=True), required=False)
+    published = Boolean(coerce=True)
+    likes = Integer(required=False, coerce=True)
+    category = String(required=False)
+    tags = List(property=String(validators=[min_length(3)]), required=False, max_size=3)
+    author = Object(model_class=Author)
+    revisions = List(required=False, property=Object(model_class=Revision))
+    events = List(required=False, property=Union('type', {'click': ClickEvent, 'scroll': ScrollEvent}))
+
+    @model_validator(error_key='category')
+    def category_or_tags(self):
+        assert self.tags is not None or self.category is not None, ERROR_REQUIRED
+
+    @model_validator(error_key='author')
+    def no_self_review(self):
+        author_name = getattr(self.author, 'name', None)
+        assert author_name is None or author_name != self.meta_data.get('corrector'), ERROR_INVALID
+
+
+class Comment(Model):
+    text = String()
+    replies = List(property=Object('%s.Comment' % __name__), required=False)
+
+
+def _payload():
+    return {
+        'title': u'Hello world',
+        'status': u'published',
+        'meta_data': {'corrector': u'Moinax'},
+        'published': u'yes',
+        'likes': u'3',
+        'tags': [u'foo', u'bar'],
+        'author': {'name': u'Pierre', 'email': u'pierre@example.com'},
+        'revisions': [{'revised_on': u'2016-01-02T03:04:05Z'}, {'changes': u'bar'}],
+        'events': [{'type': u'click', 'x': u'1'}, {'type': u'scroll', 'offset': 2}],
+    }
+
+
+def _payloads():
+    yield _payload()
+
+    for key, value in (('title', None), ('title', u'Hi'), ('status', u'archived'), ('published', u'maybe'),
+                       ('likes', 3.5), ('tags', None), ('tags', [u'foo', u'ba']), ('tags', [u'foo'] * 4),
+                       ('tags', u'foo'), ('author', {'name': u'P'}), ('author', {'name': u'Moinax'}),
+                       ('author', {'name': u'Pierre', 'email': u'pierre'}), ('author', None), ('author', u'Pierre'),
+                       ('meta_data', {'reviewer': u'Jack'}), ('meta_data', {'corrector': u'Jack', 'foo': u'bar'}),
+                       ('scores', {'foo': 1, 'bar': u'2'}), ('scores', {'foo': u'x'}), ('scores', {'foo': None}),
+                       ('revisions', [{'revised_on': u'yesterday'}]), ('revisions', [{'changes': None}]),
+                       ('revisions', [None]), ('events', [{'type': u'scroll', 'offset': u'2'}]),
+                       ('events', [{'type': u'click', 'x': 1, 'offset': 2}]), ('unknown', 42)):
+        payload = _payload()
+        payload[key] = value
+        yield payload
+
+    payload = _payload()
+    del payload['tags']
+    yield payload
+
+    payload['category'] = u'news'
+    yield payload
+
+
+def _errors(validate, *args):
+    try:
+        validate(*args)
+    except InvalidModelError as e:
+        return e.errors
+
+    return {}
+
+
+def test_validate_dict_agrees_with_validate():
+    for payload in _payloads():
+        expected_errors = _errors(lambda: BlogPost.from_dict(payload).validate())
+        assert _errors(BlogPost.validate_dict, payload) == expected_errors, (payload, expected_errors)
+        assert _errors(BlogPost.validate_dict, payload, 'some context') == expected_errors
+
+
+def test_validate_dict_reports_every_property():
+    """from_dict() stops at the first undecodable value, validate_dict() does not"""
+
+    payload = _payload()
+    payload['events'] = [{'type': u'drag'}]
+    payload['title'] = None
+
+    assert_raises(InvalidModelError, BlogPost.from_dict, payload)
+    assert _errors(BlogPost.validate_dict, payload) == {'events': ERROR_INVALID, 'title': ERROR_REQUIRED}
+
+
+def test_validate_dict_no_instances():
+    instances = []
+
+    class CountedAuthor(Author):
+        def __new__(cls, **kwargs):
+            instances.append(cls)
+            return super(CountedAuthor, cls).__new__(cls, **kwargs)
+
+    class Book(Model):
+        authors = List(property=Object(model_class=CountedAuthor))
+
+        @model_validator(error_key='authors')
+        def first_author(self):
+            assert self.authors[0].name.startswith(u'P'), ERROR_INVALID
+
+    Book.validate_dict({'authors': [{'name': u'Pierre'}, {'name': u'Moinax'}]})
+    assert _errors(Book.validate_dict, {'authors': [{'name': u'Moinax'}]}) == {'authors': ERROR_INVALID}
+    assert instances == []
+
+
+def test_validate_dict_deep():
+    dct = {'text': u'Leaf'}
+    for _ in xrange(sys.getrecursionlimit() * 2):
+        dct = {'text': u'Level', 'replies': [dct]}
+
+    Comment.validate_dict(dct)
+
+    leaf = dct
+    while 'replies' in leaf:
+        leaf = leaf['replies'][0]
+    leaf['text'] = None
+    assert _errors(Comment.validate_dict, dct) == {'replies': ERROR_INVALID}
+
+    cyclic_dct = {'text': u'Hello', 'replies': []}
+    cyclic_dct['replies'].append(cyclic_dct)
+    assert_raises(ValueError, Comment.validate_dict, cyclic_dct)
+
+
+def test_model_view():
+    class Event(Model):
+        name = String()
+        happened_on = DateTime(coerce=True)
+        source = Object(model_class=Author, required=False)
+
+        @property
+        def day(self):
+            return self.happened_on.date()
+
+        def is_recent(self):
+            return self.day.year >= 2016
+
+        @model_validator(error_key='happened_on')
+        def recent(self):
+            assert self.is_recent() and self.source.name, ERROR_INVALID
+
+    Event.validate_dict({'name': u'click', 'happened_on': u'2016-01-02T03:04:05Z', 'source': {'name': u'Pierre'}})
+    assert _errors(Event.validate_dict, {'name': u'click', 'happened_on': datetime(2015, 1, 1),
+                                         'source': {'name': u'Pierre'}}) == {'happened_on': ERROR_INVALID}
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_projections
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Field-subset serialization tests.
+
+"""
+
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, List, Dict, Object, Union, Constant
+from kelly.projections import projection
+
+
+class Author(Model):
+    name = String()
+    email = String(required=False)
+
+
+class Item(Model):
+    name = String()
+    price = Integer()
+
+
+class ClickEvent(Model):
+    type = Constant(u'click')
+    x = Integer()
+
+
+class ScrollEvent(Model):
+    type = Constant(u'scroll')
+    offset = Integer()
+
+
+class Order(Model):
+    title = String()
+    notes = String(required=False)
+    author = Object(model_class=Author)
+    items = List(property=Object(model_class=Item))
+    tags = List(property=String(), required=False)
+    meta_data = Dict(mapping={'reviewer': Object(model_class=Author, required=False), 'status': String()})
+    events = List(property=Union('type', {'click': ClickEvent, 'scroll': ScrollEvent}), required=False)
+
+
+def _order():
+    return Order(title=u'Order', notes=u'Fragile', author=Author(name=u'Pierre', email=u'pierre@example.com'),
+                 items=[Item(name=u'Book', price=10), Item(name=u'Pen', price=2)], tags=[u'foo'],
+                 meta_data={'reviewer': Author(name=u'Moinax'), 'status': u'ok'},
+                 events=[ClickEvent(x=1), ScrollEvent(offset=2)])
+
+
+def test_to_dict():
+    order = _order()
+
+    assert order.to_dict() == dict(order)
+    assert order.to_dict(only=['title', 'tags']) == {'title': u'Order', 'tags': [u'foo']}
+    assert order.to_dict(only=['author.name']) == {'author': {'name': u'Pierre'}}
+    assert order.to_dict(only=['author.name', 'author']) == {'author': dict(order.author)}
+    assert order.to_dict(only=['items.*.price']) == {'items': [{'price': 10}, {'price': 2}]}
+    assert order.to_dict(only=['tags.*']) == {'tags': [u'foo']}
+    assert order.to_dict(only=['meta_data.status']) == {'meta_data': {'status': u'ok'}}
+    assert order.to_dict(only=['meta_data.reviewer.name']) == {'meta_data': {'reviewer': {'name': u'Moinax'}}}
+    assert order.to_dict(only=['events.*.type']) == {'events': [{'type': u'click'}, {'type': u'scroll'}]}
+
+
+def test_to_dict_exclude():
+    order = _order()
+
+    expected_dict = dict(order)
+    del expected_dict['notes']
+    del expected_dict['author']['email']
+    for item in expected_dict['items']:
+        del item['name']
+
+    assert order.to_dict(exclude=['notes', 'author.email', 'items.*.name']) == expected_dict
+    assert order.to_dict(only=['author', 'notes'], exclude=['author.email']) == {'author': {'name': u'Pierre'},
+                                                                                 'notes': u'Fragile'}
+
+    # None values are kept as is
+    order.author = None
+    assert order.to_dict(only=['author.name', 'title']) == {'author': None, 'title': u'Order'}
+
+
+def test_projection_cache():
+    compiled = projection(Order, ['title', 'author.name'])
+
+    assert projection(Order, ['title', 'author.name']) is compiled
+    assert projection(Order, ('title', 'author.name')) is compiled
+    assert projection(Order, ['title']) is not compiled
+
+
+def test_invalid_fields():
+    order = _order()
+
+    assert_raises(ValueError, order.to_dict, only=['foo'])
+    assert_raises(ValueError, order.to_dict, exclude=['author.foo'])
+    assert_raises(ValueError, order.to_dict, only=['items.price'])
+    assert_raises(ValueError, order.to_dict, only=['title.foo'])
+    assert_raises(ValueError, order.to_dict, only=['meta_data.foo'])
+
+    # Fields are checked when the projection is compiled, whether values are there or not
+    order.author = None
+    order.meta_data = {'status': u'ok'}
+    order.events = []
+    assert_raises(ValueError, order.to_dict, only=['author.nonexistent'])
+    assert_raises(ValueError, order.to_dict, exclude=['meta_data.reviewer.nonexistent'])
+    assert_raises(ValueError, order.to_dict, only=['events.*.x'])  # ScrollEvent has no x
+    assert_raises(ValueError, projection, Order, ['author.nonexistent'])
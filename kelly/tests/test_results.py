@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_results
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Non-raising validation & summary tests.
+
+"""
+
+from kelly import Model, String, Integer, Dict, ValidationResult, ValidationSummary, min_length, ERROR_INVALID, \
+    ERROR_REQUIRED
+from kelly.results import VALID
+
+
+class Order(Model):
+    reference = String(validators=[min_length(3)])
+    quantity = Integer()
+
+
+def test_check():
+    assert Order(reference=u'A-1', quantity=2).check() is VALID
+    assert Order.check_dict({'reference': u'A-1', 'quantity': 2}) is VALID
+
+    result = Order(reference=u'A').check()
+    assert not result
+    assert result.errors == {'reference': ERROR_INVALID, 'quantity': ERROR_REQUIRED}
+    assert Order.check_dict({'reference': u'A'}) == result
+
+    assert String().check(u'foo') is VALID
+    assert String().check(3) == ValidationResult(error=ERROR_INVALID)
+    assert Dict(values=Integer()).check({'foo': u'1'}) == ValidationResult({'foo': ERROR_INVALID}, ERROR_INVALID)
+
+
+def test_summary():
+    rows = [{'reference': u'A-%d' % index, 'quantity': index if index % 3 else None} for index in xrange(10)]
+    rows.append({'reference': u'A', 'quantity': 1})
+
+    summary = ValidationSummary(sample_size=2)
+    for line_number, row in enumerate(rows):
+        summary.add(Order.check_dict(row), label=line_number)
+
+    assert (summary.total, summary.valid, summary.invalid) == (11, 6, 5)
+    assert summary.by_field() == {'quantity': 4, 'reference': 1}
+    assert summary.by_code() == {ERROR_REQUIRED: 4, ERROR_INVALID: 1}
+    assert summary.most_common(1) == [(('quantity', ERROR_REQUIRED), 4)]
+    assert summary.samples == [(0, {'quantity': ERROR_REQUIRED}), (3, {'quantity': ERROR_REQUIRED})]
+
+    other_summary = ValidationSummary().update([String().check(3), VALID])
+    summary.merge(other_summary)
+    assert summary.as_dict()['by_field'] == {'quantity': 4, 'reference': 1, None: 1}
+    assert summary.total == 13 and len(summary.samples) == 2
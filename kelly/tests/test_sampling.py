@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_sampling
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Sampling validation policy tests.
+
+"""
+
+from nose.tools import assert_raises
+from kelly import Model, String, Integer, List, Object, SamplingPolicy, InvalidModelError, ERROR_INVALID, \
+    ERROR_REQUIRED, min_length
+from kelly.sampling import MODE_FULL, MODE_TYPES, check_types
+
+
+class Source(Model):
+    name = String(validators=[min_length(3)])
+
+
+class Event(Model):
+    name = String(validators=[min_length(3)])
+    count = Integer(required=False)
+    tags = List(property=String(), required=False)
+    source = Object(model_class=Source, required=False)
+
+
+def test_check_types():
+    assert check_types(Event(name=u'x', tags=[42], source=Source(name=u'x'))) == {}
+    assert check_types(Event(count=u'x', tags=u'x', source=u'x')) == {
+        'name': ERROR_REQUIRED, 'count': ERROR_INVALID, 'tags': ERROR_INVALID, 'source': ERROR_INVALID}
+
+
+def test_sampling():
+    policy = SamplingPolicy(rate=0.1, seed=42)
+    modes = [policy.validate(Event(name=u'click')) for _ in xrange(1000)]
+
+    assert 50 < modes.count(MODE_FULL) < 150
+    assert policy.counters['full'] == modes.count(MODE_FULL)
+    assert policy.counters['types'] == modes.count(MODE_TYPES)
+    assert policy.counters['full_errors'] == policy.counters['types_errors'] == 0
+    assert not policy.escalated
+
+    # Type errors are always caught, validator errors only when sampled
+    assert_raises(InvalidModelError, policy.validate, Event(name=42))
+    assert policy.counters['types_errors'] + policy.counters['full_errors'] == 1
+
+    assert SamplingPolicy(rate=0).validate(Event(name=u'x')) == MODE_TYPES
+    assert_raises(InvalidModelError, SamplingPolicy(rate=1).validate, Event(name=u'x'))
+
+
+def test_escalation():
+    policy = SamplingPolicy(rate=0.1, window=20, error_threshold=0.1, seed=42)
+
+    # A burst of invalid instances: sooner or later one is sampled, and everything gets fully validated
+    for _ in xrange(100):
+        try:
+            policy.validate(Event(name=u'x'))
+        except InvalidModelError:
+            pass
+
+    assert policy.escalated
+    assert policy.counters['escalations'] == 1
+    assert policy.error_rate == 1.0
+    assert policy.validate(Event(name=u'click')) == MODE_FULL
+
+    # Back to sampling once the window is clean again
+    for _ in xrange(20):
+        policy.validate(Event(name=u'click'))
+
+    assert not policy.escalated
+    assert policy.error_rate <= 0.1
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_schema
+~~~~~~~~~~~~~~~~~~~~~~~
+
+JSON Schema export tests - the schema and kelly validation must agree.
+
+"""
+
+import json
+import sys
+from datetime import datetime
+from kelly import Model, String, Integer, Uuid, DateTime, List, Dict, Boolean, Object, Union, Constant, choices, \
+    min_length, max_length, regex, InvalidModelError, CodecError, CannotSetPropertyError
+from kelly.schema import compile_schema, SCHEMA_URI
+
+
+class Author(Model):
+    name = String(validators=[min_length(2), max_length(20)])
+
+
+class Revision(Model):
+    id = Uuid(default_value=u'8fcd5d16-0ed8-4f6b-9d2a-1f2d8a4a6f3c')
+    changes = String()
+
+
+class Comment(Model):
+    text = String()
+    replies = List(property=Object('%s.Comment' % __name__), required=False)
+
+
+class ClickEvent(Model):
+    type = Constant(u'click')
+    x = Integer()
+
+
+class ScrollEvent(Model):
+    type = Constant(u'scroll')
+    offset = Integer()
+
+
+class BlogPost(Model):
+    title = String(validators=[min_length(3), max_length(100), regex(r'^([A-Za-z0-9- !.]*)$')])
+    status = String(validators=[choices([u'draft', u'published'])])
+    body = String(default_value=u'Lorem ipsum')
+    meta_data = Dict(mapping={'corrector': String(), 'reviewer': String(required=False)})
+    extra = Dict(required=False, max_size=2)
+    scores = Dict(values=Integer(), required=False)
+    published = Boolean()
+    likes = Integer(required=False)
+    tags = List(property=String(validators=[min_length(3)]), max_size=3)
+    author = Object(model_class=Author)
+    created_on = DateTime()
+    revisions = List(required=False, property=Object(model_class=Revision))
+    comments = List(required=False, property=Object(model_class=Comment))
+    events = List(required=False, property=Union('type', {'click': ClickEvent, 'scroll': ScrollEvent}))
+    version = Constant(2)
+
+
+def _payload():
+    return {
+        'title': u'Hello world',
+        'status': u'published',
+        'meta_data': {'corrector': u'Pierre', 'reviewer': None},
+        'extra': {'a': 1},
+        'published': True,
+        'likes': 3,
+        'tags': [u'foo', u'bar'],
+        'author': {'name': u'Pierre'},
+        'created_on': u'2016-01-02T03:04:05Z',
+        'revisions': [{'changes': u'foo'}, {'id': u'0b8fbd52-7f35-4f87-8a66-3c4f5f2b7a11', 'changes': u'bar'}],
+        'comments': [{'text': u'Hi', 'replies': [{'text': u'Hello'}]}],
+        'events': [{'type': u'click', 'x': 1}, {'type': u'scroll', 'offset': 2}],
+        'version': 2,
+    }
+
+
+def _mutations():
+    """Yield (description, payload) pairs, most of them invalid"""
+
+    yield 'valid', _payload()
+
+    for key in _payload():
+        payload = _payload()
+        del payload[key]
+        yield 'missing %s' % key, payload
+
+        for wrong_value in (None, u'x', 42, [], {}, [u'foo'] * 4, {'a': 1, 'b': 2, 'c': 3}):
+            payload = _payload()
+            payload[key] = wrong_value
+            yield '%s = %r' % (key, wrong_value), payload
+
+    nested_mutations = [
+        ('title', u'Hello @world'),
+        ('title', u'Hi'),
+        ('title', u'x' * 101),
+        ('title', u'Hello world\n'),  # '$' also matches before a trailing newline in Python
+        ('title', u'Hello world\n\n'),
+        ('status', u'archived'),
+        ('tags', [u'foo', u'ba']),
+        ('tags', [u'foo', None]),
+        ('created_on', u'2016-01-02 03:04:05.123456+01:00'),
+        ('created_on', u'02/01/2016'),
+        ('author', {'name': u'P'}),
+        ('author', {'name': u'Pierre', 'age': 42}),
+        ('author', {}),
+        ('meta_data', {'corrector': u'Pierre'}),
+        ('meta_data', {'reviewer': u'Moinax'}),
+        ('meta_data', {'corrector': u'Pierre', 'publisher': u'Jack'}),
+        ('revisions', [{'changes': u'foo', 'id': u'not-a-uuid'}]),
+        ('revisions', [{'changes': u'foo', 'id': u'8FCD5D16-0ED8-4F6B-9D2A-1F2D8A4A6F3C'}]),
+        ('revisions', [{}]),
+        ('revisions', [{'changes': u'foo', 'id': u'8fcd5d16-0ed8-4f6b-9d2a-1f2d8a4a6f3c\n'}]),
+        ('created_on', u'2016-01-02T03:04:05Z\n'),
+        ('likes', sys.maxint),
+        ('likes', 2 ** 70),
+        ('likes', -sys.maxint - 2),
+        ('comments', [{'text': u'Hi', 'replies': [{'text': u'Hello', 'replies': [{'text': 42}]}]}]),
+        ('comments', [{'text': u'Hi', 'replies': [{'text': u'Hello', 'replies': [{'text': u'Deep'}]}]}]),
+        ('comments', [{'text': u'Hi', 'replies': None}]),
+        ('events', [{'type': u'click', 'offset': 2}]),
+        ('events', [{'type': u'scroll', 'offset': 2}, {'type': u'drag', 'x': 1}]),
+        ('events', [{'type': u'click', 'x': u'1'}]),
+        ('events', [None]),
+        ('scores', {'foo': 1, 'bar': 2}),
+        ('scores', {'foo': 1, 'bar': u'2'}),
+        ('scores', {'foo': None}),
+    ]
+
+    for key, value in nested_mutations:
+        payload = _payload()
+        payload[key] = value
+        yield '%s = %r' % (key, value), payload
+
+
+def _kelly_accepts(payload):
+    try:
+        BlogPost.from_json(json.dumps(payload)).validate()
+    except (InvalidModelError, CodecError, CannotSetPropertyError):
+        return False
+
+    return True
+
+
+def test_schema():
+    schema = BlogPost.json_schema()
+
+    assert BlogPost.json_schema() is schema  # Cached
+    assert schema['$schema'] == SCHEMA_URI
+    assert schema['type'] == 'object' and schema['additionalProperties'] is False
+    assert set(schema['required']) == {'title', 'status', 'meta_data', 'published', 'tags', 'author', 'created_on'}
+
+    properties = schema['properties']
+    assert properties['title'] == {'type': 'string', 'minLength': 3, 'maxLength': 100,
+                                   'pattern': '^(?:([A-Za-z0-9- !.]*)(?=\\n?$))'}
+    assert properties['status'] == {'type': 'string', 'enum': [u'draft', u'published']}
+    assert properties['likes'] == {'type': ['integer', 'null'], 'minimum': -sys.maxint - 1, 'maximum': sys.maxint}
+    assert properties['tags'] == {'type': 'array', 'maxItems': 3, 'items': {'type': 'string', 'minLength': 3}}
+    assert properties['author'] == {'$ref': '#/definitions/Author'}
+    assert properties['version'] == {'enum': [2]}
+    assert properties['meta_data']['required'] == ['corrector']
+    assert properties['scores']['additionalProperties'] == {'type': 'integer', 'minimum': -sys.maxint - 1,
+                                                            'maximum': sys.maxint}
+
+    definitions = schema['definitions']
+    assert set(definitions) == {'Author', 'Revision', 'Comment', 'ClickEvent', 'ScrollEvent'}
+    assert definitions['Comment']['properties']['replies'] == {'type': ['array', 'null'],
+                                                               'items': {'$ref': '#/definitions/Comment'}}
+    assert properties['events']['items'] == {'oneOf': [{'$ref': '#/definitions/ClickEvent'},
+                                                       {'$ref': '#/definitions/ScrollEvent'}]}
+
+    # Self-referencing root model
+    assert Comment.json_schema()['properties']['replies']['items'] == {'$ref': '#'}
+
+    # Schemas are plain JSON
+    assert json.loads(json.dumps(schema)) == schema
+
+
+def test_schema_agrees_with_validation():
+    is_valid = compile_schema(BlogPost.json_schema())
+    valid_count = 0
+
+    for description, payload in _mutations():
+        decoded_payload = json.loads(json.dumps(payload))
+        assert is_valid(decoded_payload) == _kelly_accepts(payload), description
+        valid_count += is_valid(decoded_payload)
+
+    # Make sure both outcomes are covered
+    assert 0 < valid_count < 50
+
+
+def test_schema_round_trip():
+    blog_post = BlogPost.from_json(json.dumps(_payload()))
+    blog_post.created_on = datetime(2016, 1, 2, 3, 4, 5, 123456)
+    blog_post.validate()
+
+    assert compile_schema(BlogPost.json_schema())(json.loads(blog_post.to_json()))
+    assert compile_schema(Comment.json_schema())(json.loads(blog_post.comments[0].to_json()))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_store
+~~~~~~~~~~~~~~~~~~~~~~
+
+Columnar store tests.
+
+"""
+
+import os
+import tempfile
+from datetime import datetime
+from nose.tools import assert_raises, with_setup
+from kelly import Model, String, Integer, List, Dict, Object, Boolean, DateTime, CodecError
+from kelly.store import Store, write
+
+
+class Author(Model):
+    name = String()
+
+
+class Order(Model):
+    reference = String()
+    amount = Integer(required=False)
+    paid = Boolean(required=False)
+    created_on = DateTime(required=False)
+    author = Object(model_class=Author, required=False)
+    lines = List(property=Dict(), required=False)
+
+
+store_path = None
+
+
+def setup_store_path():
+    global store_path
+
+    handle, store_path = tempfile.mkstemp(suffix='.kst')
+    os.close(handle)
+
+
+def teardown_store_path():
+    os.remove(store_path)
+
+
+def _orders(count):
+    for index in xrange(count):
+        yield Order(reference=u'order-%d-é' % index if index % 2 else 'order-%d' % index,
+                    amount=-index * 2 ** 40 if index % 3 else None,
+                    paid=[True, False, None][index % 3],
+                    created_on=datetime(2016, 1, 1, 12, 30, 0, index) if index % 4 else None,
+                    author=Author(name=u'Author %d' % index) if index % 5 else None,
+                    lines=[{'sku': index, 'quantity': 2}])
+
+
+@with_setup(setup_store_path, teardown_store_path)
+def test_round_trip():
+    """Rows read back from a store are equal to the models that were written"""
+
+    assert write(store_path, Order, _orders(50)) == 50
+
+    with Store(store_path, Order) as store:
+        assert len(store) == 50
+
+        for row, order in zip(store, _orders(50)):
+            assert dict(row) == dict(order)
+            assert type(row.reference) is type(order.reference)
+
+        assert isinstance(store[7].author, Author)
+        assert isinstance(store[-1].to_model(), Order)
+        assert store[-1].to_model().reference == u'order-49-é'
+
+
+@with_setup(setup_store_path, teardown_store_path)
+def test_column():
+    """Columns can be scanned on their own"""
+
+    write(store_path, Order, _orders(10))
+
+    with Store(store_path, Order) as store:
+        assert list(store.column('amount')) == [order.amount for order in _orders(10)]
+        assert store.column('paid')[1] is False
+
+        with assert_raises(IndexError):
+            store.column('paid')[10]
+
+        with assert_raises(AttributeError):
+            store[0].unknown
+
+
+@with_setup(setup_store_path, teardown_store_path)
+def test_empty():
+    """Empty stores are fine"""
+
+    write(store_path, Order, [])
+
+    with Store(store_path, Order) as store:
+        assert len(store) == 0
+        assert list(store) == []
+
+
+@with_setup(setup_store_path, teardown_store_path)
+def test_schema_mismatch():
+    """Stores can only be read with the model class they were written with"""
+
+    write(store_path, Order, _orders(1))
+
+    with assert_raises(CodecError):
+        Store(store_path, Author)
+
+
+@with_setup(setup_store_path, teardown_store_path)
+def test_invalid_value():
+    """Values that do not fit their column are rejected"""
+
+    with assert_raises(CodecError):
+        write(store_path, Order, [Order(reference=u'foo', amount='not an integer')])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_threads
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Sharing model classes & properties across threads.
+
+"""
+
+from multiprocessing.pool import ThreadPool
+from kelly import Model, String, Uuid, min_length
+from kelly.codecs import schema_fingerprint
+from kelly.benchmarks.threads import build_payloads, run
+
+
+def test_concurrent_validation():
+    """Validating from many threads gives the same results as validating from a single one"""
+
+    payloads = build_payloads(600)
+    reference_results, _ = run(payloads, 1)
+    results, _ = run(payloads, 8)
+
+    assert results == reference_results
+    assert len([result for result in results if result is not None]) == 200
+
+
+def test_concurrent_class_creation():
+    """Model classes created concurrently from shared properties do not interfere with each other"""
+
+    shared_name = String(validators=[min_length(2)], intern=True)
+
+    def create_and_use(index):
+        model_class = type('Model%d' % index, (Model,), {'name': shared_name, 'extra_%d' % index: String()})
+        model_instance = model_class(name=u'name %d' % (index % 5))
+        return len(model_class._model_properties), schema_fingerprint(model_class), model_instance.name
+
+    pool = ThreadPool(8)
+    results = pool.map(create_and_use, range(200))
+    pool.close()
+    pool.join()
+
+    assert all(property_count == 2 for property_count, _, _ in results)
+    assert len(set(shared_name._interned_values)) == 5
+
+
+def test_validators_not_aliased():
+    """Properties never share their validator list with the caller"""
+
+    validators = [min_length(2)]
+    first_uuid = Uuid(validators=validators)
+    second_uuid = Uuid(validators=validators)
+
+    assert len(validators) == 1
+    assert len(first_uuid.validators) == 2
+    assert len(second_uuid.validators) == 2
+    assert first_uuid.validators is not second_uuid.validators
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.tests.test_traversal
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Self-referencing models, deep & cyclic model graphs tests.
+
+"""
+
+import sys
+from nose.tools import assert_raises
+from kelly import Model, String, List, Object, InvalidModelError, ERROR_INVALID
+from kelly.base import get_model_class
+
+
+class Comment(Model):
+    text = String()
+    replies = List(property=Object('%s.Comment' % __name__), required=False)
+
+
+class Employee(Model):
+    name = String()
+    manager = Object('Employee', required=False)
+    assistant = Object('%s.Employee' % __name__, required=False)
+
+
+def _thread(depth):
+    comment = Comment(text=u'Leaf', replies=[])
+    for index in xrange(depth):
+        comment = Comment(text=u'Level %d' % index, replies=[comment])
+
+    return comment
+
+
+def test_model_registry():
+    assert get_model_class('%s.Comment' % __name__) is Comment
+    assert get_model_class('Comment', __name__) is Comment
+
+    # Names are looked up in the module of the declaring model class first, and are ambiguous elsewhere
+    other_employee = type('Employee', (Model,), {'__module__': 'other.models', 'name': String()})
+    other_comment = type('Comment', (Model,), {'__module__': 'other.models',
+                                               'replies': List(property=Object('Comment'))})
+    assert get_model_class('Employee', 'other.models') is other_employee
+    assert get_model_class('Employee', __name__) is Employee
+    assert_raises(LookupError, get_model_class, 'Employee')
+
+    assert Employee._model_properties['manager']._model_class is Employee
+    assert other_comment._model_properties['replies'].property._model_class is other_comment
+
+    assert_raises(LookupError, get_model_class, 'NoSuchModel')
+    assert_raises(LookupError, Object('NoSuchModel').validate, Comment(text=u'Hello'))
+
+
+def test_self_reference():
+    comment = Comment(text=u'Hello', replies=[Comment(text=u'Hi')])
+    comment.validate()
+
+    comment.replies[0].text = 42
+    with assert_raises(InvalidModelError) as cm:
+        comment.validate()
+    assert cm.exception.errors == {'replies': ERROR_INVALID}
+
+    employee = Employee(name=u'Bob', manager=Employee(name=u'Alice'), assistant=Employee(name=u'Carol'))
+    employee.validate()
+    assert Employee.from_dict(dict(employee)) == employee
+
+    employee.manager = Comment(text=u'Hello')
+    assert_raises(InvalidModelError, employee.validate)
+
+
+def test_deep_tree():
+    depth = sys.getrecursionlimit() * 5
+    comment = _thread(depth)
+
+    comment.validate()
+    dct = dict(comment)
+    restored_comment = Comment.from_dict(dct)
+    assert isinstance(restored_comment, Comment)
+
+    leaf = restored_comment
+    for _ in xrange(depth):
+        leaf = leaf.replies[0]
+    assert leaf.text == u'Leaf'
+
+    # Errors deep down the tree still bubble up
+    leaf.text = None
+    with assert_raises(InvalidModelError) as cm:
+        restored_comment.validate()
+    assert cm.exception.errors == {'replies': ERROR_INVALID}
+
+
+def test_deep_tree_invalid_dict():
+    dct = {'text': u'Leaf', 'replies': [{'replies': []}]}
+    for _ in xrange(sys.getrecursionlimit() * 2):
+        dct = {'text': u'Level', 'replies': [dct]}
+
+    comment = Comment.from_dict(dct)
+    assert_raises(InvalidModelError, comment.validate)
+
+
+def test_cycles():
+    comment = Comment(text=u'Hello', replies=[])
+    comment.replies.append(Comment(text=u'Hi', replies=[comment]))
+
+    # Validation terminates...
+    comment.validate()
+    comment.replies[0].text = None
+    assert_raises(InvalidModelError, comment.validate)
+
+    # ...but dicts cannot represent cycles
+    assert_raises(ValueError, dict, comment)
+
+    employee = Employee(name=u'Bob')
+    employee.manager = employee
+    employee.validate()
+    assert_raises(ValueError, dict, employee)
+
+    dct = {'text': u'Hello', 'replies': []}
+    dct['replies'].append(dct)
+    assert_raises(ValueError, Comment.from_dict, dct)
+
+
+def test_shared_nodes():
+    shared_reply = Comment(text=u'Shared', replies=[])
+    comment = Comment(text=u'Hello', replies=[shared_reply, shared_reply])
+
+    dct = dict(comment)
+    assert dct['replies'][0] is dct['replies'][1]
+
+    restored_comment = Comment.from_dict(dct)
+    assert restored_comment.replies[0] is restored_comment.replies[1]
+    assert restored_comment == comment
+
+
+def test_flat_models():
+    from kelly import Integer, Dict
+    from kelly import traversal
+
+    class Flat(Model):
+        name = String()
+        tags = List(property=String())
+        counts = Dict(values=Integer())
+
+    class Holder(Model):
+        comments = Dict(values=List(property=Object(Comment)))
+
+    assert not Flat._model_nested
+    assert Comment._model_nested and Employee._model_nested and Holder._model_nested
+
+    def walk(*args):
+        raise AssertionError('Flat models should not be walked')
+
+    # Flat models never walk their graph
+    post_order, traversal._post_order = traversal._post_order, walk
+    try:
+        flat = Flat.from_dict({'name': u'Flat', 'tags': [u'a'], 'counts': {u'a': 1}})
+        flat.validate()
+        Flat.validate_dict({'name': u'Flat', 'tags': [u'a'], 'counts': {u'a': 1}})
+        assert dict(flat) == {'name': u'Flat', 'tags': [u'a'], 'counts': {u'a': 1}}
+        assert_raises(AssertionError, Holder.from_dict, {'comments': {}})
+    finally:
+        traversal._post_order = post_order
+
+
+def test_assignable_model_class():
+    class LateObject(Object):
+        def __init__(self, **kwargs):
+            super(LateObject, self).__init__(model_class='NoSuchModel', **kwargs)
+            self._model_class = Comment
+
+    assert LateObject().model_class({}) is Comment
+    LateObject().validate(Comment(text=u'Hello'))
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+"""
+kelly.traversal
+~~~~~~~~~~~~~~~
+
+Iterative, cycle-safe traversal of model graphs.
+
+Validation, dict casting and from_dict() do not recurse through nested models: the model graph is first walked with an
+explicit stack, visiting shared nodes only once, then every model is processed on its own, nested models first. While
+this happens, Object properties pick the results for nested models from the current traversal (kept per thread) rather
+than recursing. Deep trees therefore never hit the recursion limit, and:
+
+* validation of cyclic graphs terminates, each model being validated once;
+* Model.validate_dict() validates graphs of dicts the same way, without decoding them;
+* dict casting and from_dict() of cyclic graphs raise a ValueError, as dicts cannot represent them;
+* shared nodes are converted once: two references to the same model give the same dict, and two references to the same
+  dict give the same model.
+
+Model classes whose properties cannot hold nested models (see can_nest) skip all of this, and process the model
+directly.
+
+"""
+
+import threading
+import properties
+from errors import InvalidModelError, InvalidPropertyError
+from base import Model as BaseModel
+
+migrations = None  # Imported on first use, as only versioned models need it
+
+_state = threading.local()
+
+
+def validate(model_instance, context):
+    """Validate a model graph - returns the errors of the root model
+
+    :type model_instance: Model
+    :param context: an arbitrary validation context (any string will do), only used for the root model
+    """
+
+    # Flat models, or already traversing (e.g. from a model validator)
+    if not model_instance._model_nested or getattr(_state, 'validation', None) is not None:
+        return model_instance._collect_errors(context)
+
+    nodes, _ = _post_order(model_instance, _validation_children, id)
+    session = _state.validation = {'results': {}, 'pending': set(id(node) for node in nodes)}
+
+    try:
+        for node in nodes[:-1]:
+            session['results'][id(node)] = len(node._collect_errors(None)) == 0
+
+        return model_instance._collect_errors(context)
+    finally:
+        _state.validation = None
+
+
+def known_validity(model_instance):
+    """Whether a nested model is valid, as found by the current traversal. Returns None if the model is not part of
+    the current traversal, in which case it should be validated directly.
+
+    :type model_instance: Model
+    """
+
+    session = getattr(_state, 'validation', None)
+
+    if session is None:
+        return None
+
+    valid = session['results'].get(id(model_instance))
+
+    if valid is None and id(model_instance) in session['pending']:
+        return True  # Cycle: the model is being validated further up
+
+    return valid
+
+
+def cast(model_instance):
+    """Cast a model graph to dicts - returns the (key, value) pairs of the root model
+
+    :type model_instance: Model
+    """
+
+    if not model_instance._model_nested or getattr(_state, 'casting', None) is not None:
+        return model_instance._cast_items()
+
+    nodes, cyclic = _post_order(model_instance, _casting_children, id)
+
+    if cyclic:
+        raise ValueError('Cannot cast a cyclic model graph to dict')
+
+    memo = _state.casting = {}
+
+    try:
+        for node in nodes[:-1]:
+            memo[id(node)] = dict(node._cast_items())
+
+        return model_instance._cast_items()
+    finally:
+        _state.casting = None
+
+
+def cast_model(model_instance):
+    """dict(model_instance), reusing the result of the current traversal if any
+
+    :type model_instance: Model
+    """
+
+    memo = getattr(_state, 'casting', None)
+    casted = memo.get(id(model_instance)) if memo is not None else None
+
+    return casted if casted is not None else dict(model_instance)
+
+
+def decode(model_class, dct):
+    """Decode a graph of dicts into models - returns the root model
+
+    :type model_class: Model
+    :type dct: dict
+    """
+
+    if not model_class._model_nested or getattr(_state, 'decoding', None) is not None:
+        return model_class._decode(dct)
+
+    nodes, cyclic = _post_order((model_class, dct), _decoding_children, _decoding_key)
+
+    if cyclic:
+        raise ValueError('Cannot decode a cyclic dict graph')
+
+    memo = _state.decoding = {}
+
+    try:
+        for node in nodes[:-1]:
+            try:
+                memo[_decoding_key(node)] = node[0]._decode(node[1])
+            except InvalidModelError:
+                pass  # Raised again, and keyed by the parent property, when decoding the parent
+
+        return model_class._decode(dct)
+    finally:
+        _state.decoding = None
+
+
+def decoded_model(dct, model_class):
+    """The model decoded from a dict by the current traversal, if any
+
+    :type dct: dict
+    :type model_class: Model
+    """
+
+    memo = getattr(_state, 'decoding', None)
+
+    return memo.get((id(dct), model_class)) if memo is not None else None
+
+
+def validate_dict(model_class, dct, context):
+    """Validate a graph of dicts without decoding it - returns the errors of the root dict
+
+    :type model_class: Model
+    :type dct: dict
+    :param context: an arbitrary validation context (any string will do), only used for the root dict
+    """
+
+    if not model_class._model_nested or getattr(_state, 'dict_validation', None) is not None:
+        return model_class._collect_dict_errors(dct, context)
+
+    nodes, cyclic = _post_order((model_class, dct), _dict_validation_children, _decoding_key)
+
+    if cyclic:
+        raise ValueError('Cannot validate a cyclic dict graph')
+
+    memo = _state.dict_validation = {}
+
+    try:
+        for node in nodes[:-1]:
+            memo[_decoding_key(node)] = len(node[0]._collect_dict_errors(node[1], None)) == 0
+
+        return model_class._collect_dict_errors(dct, context)
+    finally:
+        _state.dict_validation = None
+
+
+def known_dict_validity(dct, model_class):
+    """Whether a nested dict is valid, as found by the current traversal. Returns None if the dict is not part of the
+    current traversal, in which case it should be validated directly.
+
+    :type dct: dict
+    :type model_class: Model
+    """
+
+    memo = getattr(_state, 'dict_validation', None)
+
+    return memo.get((id(dct), model_class)) if memo is not None else None
+
+
+def can_nest(property_instance):
+    """Whether values of a property can hold nested models: Object properties, and List or Dict properties of those
+
+    :param property_instance
+    """
+
+    return any(True for _ in object_properties(property_instance))
+
+
+def object_properties(property_instance):
+    """The Object properties found in a property: itself, or the inner properties of List and Dict properties
+
+    :param property_instance
+    """
+
+    if isinstance(property_instance, properties.Object):
+        yield property_instance
+    elif isinstance(property_instance, properties.List):
+        if property_instance.property is not None:
+            for object_property in object_properties(property_instance.property):
+                yield object_property
+    elif isinstance(property_instance, properties.Dict):
+        inner_properties = property_instance.mapping.values() if property_instance.mapping is not None else \
+            [property_instance.values] if property_instance.values is not None else []
+        for inner_property in inner_properties:
+            for object_property in object_properties(inner_property):
+                yield object_property
+
+
+def _post_order(root, children, key):
+    """Walk a graph with an explicit stack. Returns the nodes (children first, root last) and whether a cycle was found.
+
+    :param root
+    :param children: a function returning the children of a node
+    :param key: a function returning a hashable identity for a node
+    """
+
+    order = []
+    visited = {key(root)}
+    on_stack = {key(root)}
+    stack = [(root, iter(children(root)))]
+    cyclic = False
+
+    while stack:
+        node, pending_children = stack[-1]
+
+        for child in pending_children:
+            child_key = key(child)
+            if child_key in on_stack:
+                cyclic = True
+            elif child_key not in visited:
+                visited.add(child_key)
+                on_stack.add(child_key)
+                stack.append((child, iter(children(child))))
+                break
+        else:
+            stack.pop()
+            on_stack.discard(key(node))
+            order.append(node)
+
+    return order, cyclic
+
+
+def _nested(property_instance, value, dicts=False, validating=True):
+    """Find the values handled by Object properties within a property value, following List and Dict properties
+
+    :param property_instance
+    :param value
+    :param dicts: whether to look for dicts (about to be decoded or validated), rather than models
+    :param validating: whether oversized and sampled lists/dicts should be skipped
+    """
+
+    stack = [(property_instance, value)]
+
+    while stack:
+        property_instance, value = stack.pop()
+
+        if isinstance(property_instance, properties.Object):
+            if dicts and isinstance(value, dict) or not dicts and isinstance(value, BaseModel):
+                yield property_instance, value
+        elif isinstance(property_instance, properties.List) and property_instance.property is not None:
+            if isinstance(value, list) and (not validating or _walk_items(property_instance, value)):
+                stack.extend((property_instance.property, item) for item in reversed(value))
+        elif isinstance(property_instance, properties.Dict) and property_instance.mapping is not None:
+            if isinstance(value, dict) and (not validating or _walk_items(property_instance, value)):
+                for inner_key, inner_property in property_instance.mapping.iteritems():
+                    if inner_key in value:
+                        stack.append((inner_property, value[inner_key]))
+        elif isinstance(property_instance, properties.Dict) and property_instance.values is not None:
+            if isinstance(value, dict) and (not validating or _walk_items(property_instance, value)):
+                stack.extend((property_instance.values, inner_value) for inner_value in value.itervalues())
+
+
+def _walk_items(property_instance, value):
+    """Oversized and sampled lists/dicts are left to their property: nested models are validated directly, if at all"""
+
+    if property_instance.max_size is not None and len(value) > property_instance.max_size:
+        return False
+
+    return getattr(property_instance, 'sample_size', None) is None
+
+
+def _validation_children(model_instance):
+    for property_name, property_instance in model_instance._model_properties.iteritems():
+        for _, nested_model in _nested(property_instance, getattr(model_instance, property_name)):
+            yield nested_model
+
+
+def _casting_children(model_instance):
+    """Mirrors Object.to_dict(), List.to_dict() and Dict.to_dict()"""
+
+    for property_name, property_instance in model_instance._model_properties.iteritems():
+        value = getattr(model_instance, property_name)
+        if isinstance(property_instance, properties.Object) and isinstance(value, BaseModel):
+            yield value
+        elif isinstance(property_instance, properties.List) and property_instance.property is not None and \
+                isinstance(value, list):
+            for item in value:
+                if isinstance(item, BaseModel):
+                    yield item
+        elif isinstance(property_instance, properties.Dict):
+            for _, nested_model in _nested(property_instance, value, validating=False):
+                yield nested_model
+
+
+def _decoding_children(node, validating=False):
+    model_class, dct = node
+
+    for property_instance, value in _raw_values(model_class, dct):
+        for object_property, nested_dct in _nested(property_instance, value, dicts=True, validating=validating):
+            try:
+                yield object_property.model_class(nested_dct), nested_dct
+            except InvalidPropertyError:
+                pass  # e.g. unknown Union discriminator, reported when decoding the parent
+
+
+def _raw_values(model_class, dct):
+    """Mirrors Model._decode(): legacy dicts of versioned models are read through their migrations"""
+
+    if model_class.schema_version is None:
+        for property_name, property_instance in model_class._model_properties.iteritems():
+            if property_name in dct:
+                yield property_instance, dct[property_name]
+        return
+
+    global migrations
+    if migrations is None:
+        import migrations
+
+    try:
+        for _, property_instance, value in migrations.read(model_class, dct):
+            yield property_instance, value
+    except InvalidModelError:
+        pass  # Unknown version, reported when decoding the dict
+
+
+def _dict_validation_children(node):
+    return _decoding_children(node, validating=True)
+
+
+def _decoding_key(node):
+    return id(node[1]), node[0]
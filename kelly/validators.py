@@ -17,21 +17,39 @@ ERROR_REQUIRED = 'required'
 class Validator(object):
     """Validator callable class - keeps track of context"""
 
-    def __init__(self, validation_function, context=None):
+    def __init__(self, validation_function, context=None, name=None, argument=None):
         self.validation_function = validation_function
         self.context = context
+        self.name = name
+        self.argument = argument
 
     def __call__(self, *args, **kwargs):
         return self.validation_function(*args, **kwargs)
 
 
 def choices(allowed_choices, context=None):
-    """Choice validator"""
+    """Choice validator
+
+    Interned properties store the choice objects themselves, so an identity check is enough for them before falling
+    back to a set lookup.
+    """
+
+    allowed_choices = tuple(allowed_choices)
+    allowed_identities = frozenset(id(allowed_choice) for allowed_choice in allowed_choices)
+    try:
+        allowed_lookup = frozenset(allowed_choices)
+    except TypeError:  # Unhashable choices
+        allowed_lookup = allowed_choices
 
     def validator(value):
-        assert value in allowed_choices, ERROR_INVALID
+        if id(value) in allowed_identities:
+            return
+        try:
+            assert value in allowed_lookup, ERROR_INVALID
+        except TypeError:  # Unhashable values
+            assert value in allowed_choices, ERROR_INVALID
 
-    return Validator(validator, context)
+    return Validator(validator, context, name='choices', argument=allowed_choices)
 
 
 def min_length(length, context=None):
@@ -40,7 +58,7 @@ def min_length(length, context=None):
     def validator(value):
         assert len(value) >= length, ERROR_INVALID
 
-    return Validator(validator, context)
+    return Validator(validator, context, name='min_length', argument=length)
 
 
 def max_length(length, context=None):
@@ -49,7 +67,7 @@ def max_length(length, context=None):
     def validator(value):
         assert len(value) <= length, ERROR_INVALID
 
-    return Validator(validator, context)
+    return Validator(validator, context, name='max_length', argument=length)
 
 
 def regex(pattern, context=None):
@@ -58,28 +76,53 @@ def regex(pattern, context=None):
     def validator(value):
         assert re.match(pattern, value) is not None, ERROR_INVALID
 
-    return Validator(validator, context)
+    return Validator(validator, context, name='regex', argument=pattern)
+
+
+DEFAULT_COST = 1
 
 
 class ModelValidator(object):
     """Model validators decorate model methods so that they are automatically called when validating the model."""
 
-    def __init__(self, validator_function, error_key, context=None):
+    def __init__(self, validator_function, error_key, context=None, inputs=None, cost=DEFAULT_COST, concurrent=False):
+        """Class constructor
+
+        :param validator_function
+        :param error_key
+        :param context
+        :param inputs: the names of the properties (or the error keys of other model validators) the validator reads -
+                       it is skipped if any of them is invalid, and runs after the model validators it depends on
+        :param cost: a relative cost hint - cheaper validators run first
+        :param concurrent: whether the validator may run in a thread pool, alongside independent ones (see
+                           Model.model_validator_pool)
+        """
+
         self.validator_function = validator_function
         self.error_key = error_key
         self.context = context
+        self.inputs = tuple(inputs) if inputs is not None else None
+        self.cost = cost
+        self.concurrent = concurrent
 
     def __call__(self, *args, **kwargs):
         return self.validator_function(*args, **kwargs)
 
 
-def model_validator(error_key):
+def model_validator(error_key, inputs=None, cost=DEFAULT_COST, concurrent=False):
     """Model validator decorator
 
+    > @model_validator(error_key='end_date', inputs=['start_date', 'end_date'])
+    > def dates_in_order(self):
+    >     assert self.start_date <= self.end_date, ERROR_INVALID
+
     :param error_key
+    :param inputs: the properties the validator reads (see ModelValidator)
+    :param cost: a relative cost hint
+    :param concurrent: whether the validator may run in a thread pool
     """
 
     def decorator(f):
-        return ModelValidator(f, error_key)
+        return ModelValidator(f, error_key, inputs=inputs, cost=cost, concurrent=concurrent)
 
     return decorator